@@ -0,0 +1,21 @@
+from app.services.startup import warm_up
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+router = APIRouter()
+
+
+@router.get("/health")
+def health():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+def ready():
+    """
+    Readiness: the index and models are loaded. Responds 503 while the
+    warm-up is running or if one of its steps failed.
+    """
+    status = warm_up.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
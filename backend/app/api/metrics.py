@@ -0,0 +1,13 @@
+from app.core.metrics import CONTENT_TYPE, registry
+from fastapi import APIRouter, Response
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+def metrics():
+    """
+    Stage latencies, cache and LLM counters, index sizes and ingestion queue
+    depth of this worker process, in the Prometheus text format.
+    """
+    return Response(registry.render(), media_type=CONTENT_TYPE)
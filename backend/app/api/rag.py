@@ -1,18 +1,67 @@
+import json
+import logging
 import os
-from typing import List
+from typing import List, Optional
 
 from app.db.session import get_db
-from app.services.rag_service import delete_all_files, query_rag, save_uploaded_file
-from dotenv import load_dotenv
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
-from llama_index.core import SimpleDirectoryReader
+from app.schemas.ingestion import IngestionJobStatus
+from app.services.ingestion_service import enqueue_ingestion, get_ingestion_job
+from app.services.rag_service import (
+    delete_all_files,
+    delete_uploaded_files,
+    find_existing_files,
+    get_stats,
+    query_executor,
+    query_rag_async,
+    save_uploaded_files,
+    stream_query_rag,
+)
+from app.services.synthesis import SYNTHESIS_MODES
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-DATA_PATH = os.getenv("DATA_PATH")
+
+def format_sources(nodes):
+    """Serialize retrieved nodes for a query response"""
+    return [
+        {
+            "text": node.text,
+            "score": node.score,
+            "source": node.metadata.get("source", "Unknown"),
+        }
+        for node in nodes
+    ]
+
+
+def check_synthesis_mode(synthesis_mode):
+    """Reject synthesis modes the service does not implement"""
+    if synthesis_mode is not None and synthesis_mode not in SYNTHESIS_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"synthesis_mode must be one of {', '.join(SYNTHESIS_MODES)}",
+        )
+
+
+def requeue_shared(result, db: Session):
+    """
+    Queue the files that shared a deleted file's content for ingestion, and
+    report the job in place of their paths.
+    """
+    requeued = result.pop("requeued")
+    if requeued:
+        result["job_id"] = enqueue_ingestion(requeued, db).id
+    return result
+
+
+def sse_event(event: str, data) -> str:
+    """Encode one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 
 @router.post("/upload_file/")
@@ -20,46 +69,129 @@ async def upload_file(
     files: List[UploadFile] = File(...), db: Session = Depends(get_db)
 ):
     """
-    Upload one or multiple files and store metadata in the database.
+    Upload one or multiple files, store metadata in the database and queue
+    new content for background ingestion. Nothing is saved if any file name
+    already exists; content already stored under another name is shared and
+    not ingested again.
     """
-    upload_files = []
     for file in files:
-        result = save_uploaded_file(file, db)
-        if result is None:
-            raise HTTPException(
-                status_code=400, detail=f"File {file.filename} already exists"
-            )
-        upload_files.append(result)
-    return {"upload_files": upload_files}
+        # Never let a client-supplied name point outside the data directory
+        file.filename = os.path.basename(file.filename or "")
+        if not file.filename:
+            raise HTTPException(status_code=400, detail="Missing file name")
+
+    filenames = [file.filename for file in files]
+    duplicates = await run_in_threadpool(find_existing_files, filenames, db) or [
+        name for name in filenames if filenames.count(name) > 1
+    ]
+    if duplicates:
+        raise HTTPException(
+            status_code=400, detail=f"File {duplicates[0]} already exists"
+        )
+
+    upload_files, new_paths = await save_uploaded_files(files, db)
+    job = await run_in_threadpool(enqueue_ingestion, new_paths, db)
+    return {"upload_files": upload_files, "job_id": job.id}
+
+
+@router.get("/ingest_status/{job_id}", response_model=IngestionJobStatus)
+def ingest_status(job_id: int, db: Session = Depends(get_db)):
+    """
+    Report the progress of a background ingestion job.
+    """
+    job = get_ingestion_job(job_id, db)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job
+
+
+@router.get("/stats")
+def stats(evaluate_quantization: bool = False):
+    """
+    Report embedding cache, embedding throughput and vector store statistics.
+    Set evaluate_quantization to measure the score and ranking change of
+    quantized vectors against float32.
+    """
+    return get_stats(evaluate_quantization)
 
 
 @router.delete("/delete_files/")
-async def delete_files(db: Session = Depends(get_db)):
+def delete_files(db: Session = Depends(get_db)):
     """
     Delete all uploaded files from the system and database.
     """
     return delete_all_files(db)
 
 
+@router.delete("/files/{filename}")
+def delete_file(filename: str, db: Session = Depends(get_db)):
+    """
+    Delete one uploaded file and remove its chunks from the index, leaving
+    every other file indexed.
+    """
+    result = requeue_shared(delete_uploaded_files([filename], db), db)
+    if not result["deleted"]:
+        raise HTTPException(status_code=404, detail=f"File {filename} not found")
+    return result
+
+
+@router.delete("/files")
+def delete_file_list(filenames: List[str] = Query(...), db: Session = Depends(get_db)):
+    """
+    Delete several uploaded files by name and remove their chunks from the
+    index. Names that do not exist are reported in not_found.
+    """
+    return requeue_shared(delete_uploaded_files(filenames, db), db)
+
+
 @router.get("/query")
-async def rag(query_text: str):
+async def rag(query_text: str, synthesis_mode: Optional[str] = None):
     """
     Perform a retrieval-augmented generation (RAG) query using stored documents.
+    synthesis_mode overrides the configured mode: "single" answers with one
+    LLM call, "tree" runs its leaf calls concurrently.
     """
-    documents = SimpleDirectoryReader(DATA_PATH).load_data()
-    if not documents:
+    check_synthesis_mode(synthesis_mode)
+    rag = await query_rag_async(query_text, synthesis_mode)
+    if rag is None:
         raise HTTPException(status_code=404, detail="No documents found")
 
-    rag = query_rag(query_text, documents)
     response = {
         "answer": rag.response,
-        "sources": [
-            {
-                "text": node.text,
-                "score": node.score,
-                "source": node.metadata.get("source", "Unknown"),
-            }
-            for node in rag.source_nodes
-        ],
+        "sources": format_sources(rag.source_nodes),
+        "context": (rag.metadata or {}).get("context"),
+        "synthesis": (rag.metadata or {}).get("synthesis"),
     }
     return response
+
+
+@router.get("/query_stream")
+async def rag_stream(query_text: str, synthesis_mode: Optional[str] = None):
+    """
+    Perform a RAG query and stream the result as Server-Sent Events: a
+    "sources" event with the retrieved documents, one "token" event per
+    generated token, then "done" (or "error" if generation fails).
+    """
+    check_synthesis_mode(synthesis_mode)
+    streamed = await query_executor.run(stream_query_rag, query_text, synthesis_mode)
+    if streamed is None:
+        raise HTTPException(status_code=404, detail="No documents found")
+    nodes, tokens = streamed
+
+    async def events():
+        yield sse_event("sources", format_sources(nodes))
+        try:
+            async for token in query_executor.iterate(tokens):
+                yield sse_event("token", token)
+        except Exception as exc:
+            logger.exception("Streaming generation failed")
+            yield sse_event("error", str(exc))
+            return
+        yield sse_event("done", {})
+
+    # Retrieval runs before the response starts, generation while it streams
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
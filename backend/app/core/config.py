@@ -17,6 +17,105 @@ class Settings(BaseSettings):
 
     DATA_PATH: str
     STORAGE_PATH: str
+    # Index snapshots kept on disk; the current one and any a worker is still
+    # loading are always kept
+    INDEX_SNAPSHOT_KEEP: int = 3
+    # How often a worker checks for snapshots written by other workers, 0 on
+    # every query, -1 never
+    INDEX_POLL_SECONDS: float = 1.0
+    # "mmap" (memory-mapped float32 matrix) or "simple" (llama-index JSON store)
+    VECTOR_STORE_BACKEND: str = "mmap"
+    # mmap backend only: "exact" search or "ivf" approximate search
+    VECTOR_INDEX: str = "exact"
+    # 0 picks 4 * sqrt(n) lists when the IVF index is trained
+    IVF_NLIST: int = 0
+    IVF_NPROBE: int = 8
+    # mmap backend only: "float32", "float16" or "int8" (per-vector scaled)
+    VECTOR_DTYPE: str = "float32"
+    # Re-score the top k * factor quantized hits in float32, 0 disables; a
+    # float32 copy of the vectors is kept on disk while enabled
+    VECTOR_RESCORE_FACTOR: int = 0
+
+    # "vector" (embedding similarity), "keyword" (BM25) or "hybrid" (both,
+    # fused by reciprocal rank)
+    RETRIEVAL_MODE: str = "vector"
+    KEYWORD_TOP_K: int = 10
+    RRF_K: int = 60
+
+    # Prompt tokens of retrieved context passed to the LLM. -1 fits it to
+    # LLM_CONTEXT_WINDOW less the answer and the rest of the prompt, 0
+    # disables the cap
+    CONTEXT_TOKEN_BUDGET: int = -1
+    # Share of a chunk's 5-word shingles found in a better chunk that makes it
+    # a near-duplicate
+    CONTEXT_DUPLICATE_THRESHOLD: float = 0.8
+    CONTEXT_MERGE_ADJACENT: bool = True
+
+    # "compact" (llama-index default, may refine over several sequential LLM
+    # calls), "single" (exactly one call) or "tree" (concurrent leaf calls)
+    SYNTHESIS_MODE: str = "compact"
+    # Leaf LLM calls in flight at once per query in tree mode
+    SYNTHESIS_CONCURRENCY: int = 4
+
+    # "http" (text-generation inference API) or "standin" (local,
+    # deterministic answers for offline benchmarks)
+    LLM_BACKEND: str = "http"
+    # Text-generation endpoint of Hugging Face's inference router; {model} is
+    # replaced with LLM_MODEL_NAME
+    LLM_API_URL: str = "https://router.huggingface.co/hf-inference/models/{model}"
+    # Per attempt; the deadline covers waiting for a slot and every retry
+    LLM_TIMEOUT_SECONDS: float = 60
+    LLM_DEADLINE_SECONDS: float = 120
+    LLM_MAX_RETRIES: int = 3
+    # Backoff before retry n is random up to base * 2^n, capped at 8 seconds
+    LLM_RETRY_BACKOFF_SECONDS: float = 0.5
+    # Pooled keep-alive connections to the API
+    LLM_MAX_CONNECTIONS: int = 16
+    # LLM calls in flight at once per worker process, across all queries
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_MAX_NEW_TOKENS: int = 256
+    LLM_CONTEXT_WINDOW: int = 3900
+    # standin backend only
+    STANDIN_LATENCY_MS: float = 200
+    STANDIN_JITTER_MS: float = 0
+    STANDIN_TOKENS_PER_SECOND: float = 0
+
+    # "huggingface" (EMBED_MODEL_NAME) or "standin" (hashed term vectors, no
+    # model download, for offline benchmarks; always embeds in-process)
+    EMBED_BACKEND: str = "huggingface"
+    STANDIN_EMBED_DIM: int = 384
+    # Added to every embedding batch
+    STANDIN_EMBED_LATENCY_MS: float = 0
+
+    # Lives outside STORAGE_PATH so it survives index rebuilds
+    EMBEDDING_CACHE_PATH: str = "cache/embeddings.sqlite3"
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 500_000
+
+    # Embedding worker processes for bulk ingestion, 0 keeps it in-process
+    EMBED_WORKERS: int = 0
+    EMBED_BATCH_SIZE: int = 64
+    # 0 splits the available cores evenly between workers
+    EMBED_THREADS_PER_WORKER: int = 0
+
+    # Document parser processes for ingestion, 0 parses in-process
+    PARSE_WORKERS: int = 0
+    # Files parsed or waiting to be chunked at once, 0 means 2 per worker
+    PARSE_MAX_IN_FLIGHT: int = 0
+
+    # Answers to repeated /rag/query calls, 0 entries disables the cache
+    QUERY_CACHE_MAX_ENTRIES: int = 1024
+    QUERY_CACHE_TTL_SECONDS: int = 3600
+    # Queries embedded, retrieved and generated at once per worker process
+    QUERY_CONCURRENCY: int = 4
+    # Questions of concurrent queries embedded in one forward pass; 1 embeds
+    # each on its own. A batch waits at most QUERY_EMBED_MAX_WAIT_MS to fill
+    QUERY_EMBED_MAX_BATCH_SIZE: int = 32
+    QUERY_EMBED_MAX_WAIT_MS: float = 2
+
+    # "background" loads the index and models after the server starts
+    # accepting requests (GET /ready turns 200 when done), "blocking" before,
+    # "off" leaves them to the first request that needs them
+    WARM_UP: str = "background"
 
     class Config:
         env_file = ".env"
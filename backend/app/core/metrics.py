@@ -0,0 +1,272 @@
+import contextvars
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from sub-millisecond lookups up to slow LLM calls and ingestion
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+# Stage durations of the request being handled, see track_request
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels.items():
+        escaped = _escape(_format_value(value)).replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """(name, labels, value) triples"""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count per label set"""
+
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets per label set"""
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += 1
+            series[2] += value
+
+    def samples(self):
+        with self._lock:
+            series = {
+                key: (list(counts), count, total)
+                for key, (counts, count, total) in self._series.items()
+            }
+        for key, (counts, count, total) in sorted(series.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", {**labels, "le": bound}, cumulative
+            yield f"{self.name}_bucket", {**labels, "le": math.inf}, count
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class CallbackMetric(_Metric):
+    """
+    Counter or gauge read at scrape time from a function, so components
+    that already count something are not counted twice.
+
+    fn returns a number, or a dict of number by label value tuple.
+    """
+
+    def __init__(self, name, help, type, fn, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.type = type
+        self.fn = fn
+
+    def samples(self):
+        value = self.fn()
+        if not isinstance(value, dict):
+            yield self.name, {}, value
+            return
+        for key, item in sorted(value.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            yield self.name, dict(zip(self.labelnames, key)), item
+
+
+class MetricsRegistry:
+    """Metrics of this process, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge_callback(self, name, help, fn, labelnames=()):
+        return self._register(CallbackMetric(name, help, "gauge", fn, labelnames))
+
+    def counter_callback(self, name, help, fn, labelnames=()):
+        return self._register(CallbackMetric(name, help, "counter", fn, labelnames))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception:
+                # One broken callback must not take the whole scrape down
+                logger.exception("Failed to collect metric %s", metric.name)
+                continue
+            lines.append(f"# HELP {metric.name} {_escape(metric.help)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "rag_stage_duration_seconds",
+    "Time spent in each ingestion and query stage",
+    ["stage"],
+)
+HTTP_REQUESTS = registry.counter(
+    "rag_http_requests_total",
+    "HTTP requests by route and status code",
+    ["method", "route", "status"],
+)
+HTTP_SECONDS = registry.histogram(
+    "rag_http_request_duration_seconds",
+    "Time until the response headers are sent, by route",
+    ["method", "route"],
+)
+RETRIEVED_NODES = registry.histogram(
+    "rag_retrieved_nodes",
+    "Nodes retrieved per query, before context packing",
+    buckets=(0, 1, 2, 4, 8, 16, 32),
+)
+PACKED_TOKENS = registry.histogram(
+    "rag_context_tokens",
+    "Context tokens passed to synthesis per query",
+    buckets=(0, 250, 500, 1000, 2000, 4000, 8000, 16000),
+)
+
+
+def observe_stage(stage: str, seconds: float):
+    """Record a stage duration, and add it to the current request's timings"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        with timings["lock"]:
+            timings["stages"][stage] = timings["stages"].get(stage, 0.0) + seconds
+
+
+@contextmanager
+def time_stage(stage: str):
+    """Time the block as one occurrence of stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+@contextmanager
+def track_request():
+    """
+    Collect the stage durations of one request.
+
+    Yields a dict of seconds by stage, filled by stages timed in this context,
+    including threads that run a copy of it. A stage that runs several times,
+    or concurrently, is summed.
+    """
+    timings = {"lock": threading.Lock(), "stages": {}}
+    token = _request_timings.set(timings)
+    try:
+        yield timings["stages"]
+    finally:
+        _request_timings.reset(token)
+
+
+def server_timing(stages: dict, total_seconds: float) -> str:
+    """Server-Timing header value, durations in milliseconds"""
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stages.items()]
+    entries.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(entries)
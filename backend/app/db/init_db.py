@@ -3,13 +3,40 @@ import logging
 from app.core.security import hash_password
 from app.db.models import User
 from app.db.session import Base, SessionLocal, engine
+from sqlalchemy import inspect, text
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def add_missing_columns():
+    """
+    Add columns introduced after a table was created.
+
+    create_all only creates missing tables, so new nullable columns on an
+    existing table are added here.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                    )
+                )
+                logger.info("Added column %s.%s", table.name, column.name)
+
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
 
     # Create superuser
     db = SessionLocal()
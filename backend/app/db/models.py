@@ -1,5 +1,14 @@
 from app.db.session import Base
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, func
+from sqlalchemy import (
+    JSON,
+    Column,
+    DateTime,
+    Float,
+    ForeignKey,
+    Integer,
+    String,
+    func,
+)
 from sqlalchemy.orm import relationship
 
 
@@ -42,3 +51,56 @@ class UploadedFile(Base):
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, unique=True, index=True)
     filepath = Column(String)
+    # Points at the shared blob; rows uploaded before content addressing
+    # have no hash and own their file
+    content_hash = Column(String, index=True, nullable=True)
+    size = Column(Integer, nullable=True)
+
+
+class FileBlob(Base):
+    __tablename__ = "file_blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String, unique=True, index=True, nullable=False)
+    path = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    # Number of uploaded_files rows sharing this content
+    ref_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=func.now())
+
+    def __repr__(self):
+        return f"<FileBlob {self.content_hash[:12]} refs={self.ref_count}>"
+
+
+class IngestionManifest(Base):
+    __tablename__ = "ingestion_manifest"
+
+    id = Column(Integer, primary_key=True, index=True)
+    filename = Column(String, unique=True, index=True, nullable=False)
+    filepath = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    mtime = Column(Float, nullable=False)
+    content_hash = Column(String, index=True, nullable=False)
+    node_ids = Column(JSON, default=list)
+    embed_model = Column(String)
+    chunker_version = Column(String)
+    last_processed = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<IngestionManifest {self.filename} nodes={len(self.node_ids or [])}>"
+
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String, default="queued", nullable=False)
+    total_files = Column(Integer, default=0)
+    processed_files = Column(Integer, default=0)
+    failed_files = Column(Integer, default=0)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<IngestionJob id={self.id} status={self.status}>"
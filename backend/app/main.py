@@ -1,14 +1,103 @@
-from app.api import auth, rag, user
+import time
+
+# Measured from here, so the interpreter and server start-up are excluded
+_import_started = time.perf_counter()
+
+from app.api import auth, health, metrics, rag, user
+from app.core.config import settings
+from app.core.metrics import HTTP_REQUESTS, HTTP_SECONDS, server_timing, track_request
 from app.db.init_db import init_db
-from fastapi import FastAPI
+from app.db.session import SessionLocal
+from app.services.ingestion_service import (
+    document_loader,
+    enqueue_unprocessed_files,
+    start_ingestion_worker,
+)
+from app.services.rag_service import (
+    embedder,
+    index_manager,
+    llm_client,
+    query_executor,
+    warm_up_models,
+)
+from app.services.startup import warm_up
+from fastapi import FastAPI, Request
+from starlette.routing import Match
 
 app = FastAPI()
+warm_up.imported(_import_started)
+
+
+def route_template(request: Request) -> str:
+    """Path template of the matched route, so ids do not become labels"""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+@app.middleware("http")
+async def record_request_timing(request: Request, call_next):
+    """
+    Count and time every request, and report the stages it spent time in as
+    a Server-Timing header. Streamed responses report the stages finished
+    before the first byte.
+    """
+    with track_request() as stages:
+        started = time.perf_counter()
+        response = await call_next(request)
+        elapsed = time.perf_counter() - started
+
+    route = route_template(request)
+    HTTP_REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+    HTTP_SECONDS.observe(elapsed, method=request.method, route=route)
+    response.headers["Server-Timing"] = server_timing(stages, elapsed)
+    return response
+
+
+def start_ingestion():
+    # Pick up files that were added to DATA_PATH while the service was down
+    start_ingestion_worker()
+    db = SessionLocal()
+    try:
+        enqueue_unprocessed_files(db)
+    finally:
+        db.close()
 
 
 @app.on_event("startup")
 def startup_event():
     init_db()
 
+    # The index is loaded before ingestion starts so new chunks extend it
+    steps = [
+        ("index", index_manager.load),
+        ("models", warm_up_models),
+        ("ingestion", start_ingestion),
+    ]
+    if settings.WARM_UP == "blocking":
+        warm_up.run(steps)
+    elif settings.WARM_UP == "background":
+        warm_up.start(steps)
+    else:
+        start_ingestion()
+        warm_up.skip()
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    embedder.shutdown()
+    document_loader.shutdown()
+    query_executor.shutdown()
+    llm_client.close()
+
+
+# Liveness and readiness probes
+app.include_router(health.router, tags=["Health"])
+
+# Prometheus metrics
+app.include_router(metrics.router, tags=["Metrics"])
 
 # Rag system
 app.include_router(rag.router, prefix="/rag", tags=["Rag"])
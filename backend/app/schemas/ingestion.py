@@ -0,0 +1,18 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class IngestionJobStatus(BaseModel):
+    id: int
+    status: str
+    total_files: int
+    processed_files: int
+    failed_files: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,75 @@
+import numpy as np
+
+# Vectors per list below which k-means has too little data to be useful
+MIN_POINTS_PER_LIST = 39
+# Training uses at most this many vectors
+MAX_TRAINING_SAMPLE = 100_000
+# Rows scored per step when assigning vectors to lists
+_ASSIGN_BLOCK_ROWS = 65_536
+
+
+def default_nlist(count: int) -> int:
+    """Number of inverted lists for a corpus of count vectors"""
+    return max(1, int(4 * np.sqrt(count)))
+
+
+def can_train(count: int, nlist: int) -> bool:
+    """Whether there are enough vectors to train nlist centroids"""
+    return count >= nlist * MIN_POINTS_PER_LIST
+
+
+def train_centroids(vectors: np.ndarray, nlist: int, iterations: int = 10, seed=0):
+    """
+    Spherical k-means over L2-normalized vectors.
+
+    Returns an (nlist, dim) float32 array of unit-length centroids.
+    """
+    rng = np.random.default_rng(seed)
+    if len(vectors) > MAX_TRAINING_SAMPLE:
+        vectors = vectors[rng.choice(len(vectors), MAX_TRAINING_SAMPLE, replace=False)]
+    vectors = np.asarray(vectors, dtype=np.float32)
+
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=nlist)
+
+        # Re-seed empty lists from random points
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid for every vector, as int32"""
+    result = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _ASSIGN_BLOCK_ROWS):
+        block = np.asarray(vectors[start : start + _ASSIGN_BLOCK_ROWS])
+        result[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return result
+
+
+def build_lists(assignments: np.ndarray, nlist: int):
+    """
+    Group row positions by list.
+
+    Returns (order, offsets) so that the rows of list l are
+    order[offsets[l]:offsets[l + 1]].
+    """
+    order = np.argsort(assignments, kind="stable")
+    offsets = np.searchsorted(assignments[order], np.arange(nlist + 1))
+    return order, offsets
+
+
+def probe(centroids: np.ndarray, query_vector: np.ndarray, nprobe: int):
+    """Indices of the nprobe lists closest to the query"""
+    nprobe = min(nprobe, len(centroids))
+    scores = centroids @ query_vector
+    return np.argpartition(-scores, nprobe - 1)[:nprobe]
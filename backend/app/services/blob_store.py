@@ -0,0 +1,62 @@
+import os
+import re
+
+# Suffixes kept on blob names; anything else is stored without one
+_EXTENSION_RE = re.compile(r"\.[a-z0-9]{1,10}")
+
+
+def blob_extension(filename: str) -> str:
+    """Lower-cased suffix of an uploaded file name, "" if it has none"""
+    extension = os.path.splitext(filename or "")[1].lower()
+    return extension if _EXTENSION_RE.fullmatch(extension) else ""
+
+
+class BlobStore:
+    """
+    Content-addressed storage for uploaded files.
+
+    Each distinct content is kept once, at <root>/<hash[:2]>/<hash><ext>,
+    however many names it was uploaded under. The suffix of the name it was
+    first uploaded under is kept, as the document reader picks its parser by
+    suffix. Reference counts live in the database; this class only places and
+    removes the bytes.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path_for(self, content_hash: str, extension: str = "") -> str:
+        """Location of the blob holding content with this SHA-256"""
+        return os.path.join(self.root, content_hash[:2], content_hash + extension)
+
+    def put(self, temp_path: str, content_hash: str, extension: str = "") -> str:
+        """
+        Move a fully written temporary file into the store.
+
+        The temporary file must be on the same filesystem so the move is an
+        atomic rename. Returns the blob path.
+        """
+        path = self.path_for(content_hash, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        return path
+
+    def remove(self, path: str):
+        """Delete a blob if it exists"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def iter_paths(self):
+        """Path of every blob in the store"""
+        if not os.path.isdir(self.root):
+            return
+        with os.scandir(self.root) as shards:
+            for shard in shards:
+                if not shard.is_dir():
+                    continue
+                with os.scandir(shard.path) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            yield entry.path
@@ -0,0 +1,240 @@
+import threading
+
+from llama_index.core.schema import NodeRelationship, NodeWithScore, TextNode
+from llama_index.core.utils import get_tokenizer
+
+# Node metadata key holding the chunk's token count, set at ingestion
+TOKEN_COUNT_KEY = "token_count"
+# Words per shingle when comparing chunks for near-duplicates
+_SHINGLE_SIZE = 5
+# Characters of the next chunk searched for at the end of the previous one
+_OVERLAP_PROBE_CHARS = 32
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in text, with the tokenizer the sentence splitter uses"""
+    return len(get_tokenizer()(text))
+
+
+def set_token_count(node):
+    """
+    Store the node's token count in its metadata, hidden from the embedding
+    and LLM views of the node so neither its vector nor its prompt changes.
+    """
+    node.metadata = {**node.metadata, TOKEN_COUNT_KEY: count_tokens(node.text)}
+    for attribute in ("excluded_embed_metadata_keys", "excluded_llm_metadata_keys"):
+        excluded = getattr(node, attribute)
+        if TOKEN_COUNT_KEY not in excluded:
+            setattr(node, attribute, [*excluded, TOKEN_COUNT_KEY])
+
+
+def token_count(node) -> int:
+    """Token count of a node, counted now for nodes ingested without one"""
+    count = node.metadata.get(TOKEN_COUNT_KEY)
+    return count if count is not None else count_tokens(node.text)
+
+
+def _shingles(text: str):
+    words = text.casefold().split()
+    if len(words) <= _SHINGLE_SIZE:
+        return {tuple(words)}
+    return {
+        tuple(words[i : i + _SHINGLE_SIZE])
+        for i in range(len(words) - _SHINGLE_SIZE + 1)
+    }
+
+
+def _source_of(node):
+    return node.ref_doc_id or node.metadata.get("file_path")
+
+
+def _merge_text(first: str, second: str):
+    """
+    Join consecutive chunks, dropping the text they overlap on.
+
+    Returns (merged text, overlapping text).
+    """
+    # The overlap is a suffix of first that starts like second; the earliest
+    # match is the longest overlap
+    probe = second[:_OVERLAP_PROBE_CHARS]
+    start = first.find(probe, max(0, len(first) - len(second)))
+    while probe and start != -1:
+        if second.startswith(first[start:]):
+            return first[:start] + second, first[start:]
+        start = first.find(probe, start + 1)
+    return f"{first}\n{second}", ""
+
+
+class ContextPacker:
+    """
+    Select the context passed to the response synthesizer.
+
+    Retrieved nodes are taken best first. A node whose word shingles are
+    mostly contained in an already selected node is dropped as a
+    near-duplicate. Consecutive chunks of the same file are merged into one
+    node without their shared overlap. Nodes are then added while they fit
+    in token_budget. The best node is always kept, so the budget is exceeded
+    only if that node alone is over it. token_budget=0 disables the budget.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 6000,
+        duplicate_threshold: float = 0.8,
+        merge_adjacent: bool = True,
+    ):
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+        self.merge_adjacent = merge_adjacent
+
+        self.queries = 0
+        self.tokens_retrieved = 0
+        self.tokens_packed = 0
+        self.duplicates_dropped = 0
+        self.chunks_merged = 0
+        self.over_budget_dropped = 0
+        self._lock = threading.Lock()
+
+    def pack(self, nodes):
+        """
+        Return (selected nodes, report) for nodes ordered best first.
+
+        report counts the tokens retrieved, packed and saved and the nodes
+        dropped or merged along the way.
+        """
+        retrieved = sum(token_count(node.node) for node in nodes)
+
+        unique, duplicates = self._drop_duplicates(nodes)
+        merged, merges = (
+            self._merge_adjacent(unique) if self.merge_adjacent else (unique, 0)
+        )
+
+        selected, used, over_budget = [], 0, 0
+        for node in merged:
+            tokens = token_count(node.node)
+            if selected and self.token_budget and used + tokens > self.token_budget:
+                over_budget += 1
+                continue
+            selected.append(node)
+            used += tokens
+
+        report = {
+            "tokens_retrieved": retrieved,
+            "tokens_packed": used,
+            "tokens_saved": retrieved - used,
+            "token_budget": self.token_budget,
+            "duplicates_dropped": duplicates,
+            "chunks_merged": merges,
+            "over_budget_dropped": over_budget,
+        }
+        with self._lock:
+            self.queries += 1
+            self.tokens_retrieved += retrieved
+            self.tokens_packed += used
+            self.duplicates_dropped += duplicates
+            self.chunks_merged += merges
+            self.over_budget_dropped += over_budget
+        return selected, report
+
+    def stats(self):
+        """Settings and totals over every packed query"""
+        with self._lock:
+            return {
+                "token_budget": self.token_budget,
+                "duplicate_threshold": self.duplicate_threshold,
+                "merge_adjacent": self.merge_adjacent,
+                "queries": self.queries,
+                "tokens_retrieved": self.tokens_retrieved,
+                "tokens_packed": self.tokens_packed,
+                "tokens_saved": self.tokens_retrieved - self.tokens_packed,
+                "duplicates_dropped": self.duplicates_dropped,
+                "chunks_merged": self.chunks_merged,
+                "over_budget_dropped": self.over_budget_dropped,
+            }
+
+    def _drop_duplicates(self, nodes):
+        kept, kept_shingles, dropped = [], [], 0
+        for node in nodes:
+            shingles = _shingles(node.node.get_content())
+            if any(
+                len(shingles & other) >= self.duplicate_threshold * len(shingles)
+                for other in kept_shingles
+            ):
+                dropped += 1
+                continue
+            kept.append(node)
+            kept_shingles.append(shingles)
+        return kept, dropped
+
+    def _merge_adjacent(self, nodes):
+        """
+        Fold each node into the node it directly follows, repeatedly, so a
+        run of consecutive chunks becomes one node at the best rank of the
+        run.
+
+        A link only counts when the next node's PREVIOUS points back, so
+        links left over from an older chunking of the file are ignored, and
+        a node that ends up in no run is kept on its own.
+        """
+        by_id = {node.node.node_id: node for node in nodes}
+        following = {}
+        for node in nodes:
+            node_id = node.node.node_id
+            related = node.node.relationships.get(NodeRelationship.NEXT)
+            if related is None or related.node_id not in by_id:
+                continue
+            if related.node_id == node_id:
+                continue
+            back = by_id[related.node_id].node.relationships.get(
+                NodeRelationship.PREVIOUS
+            )
+            if back is None or back.node_id == node_id:
+                following[node_id] = related.node_id
+        followers = set(following.values())
+
+        # Runs start at nodes nothing leads to; a follower left out of every
+        # run, e.g. in a cycle, then starts one of its own
+        starts = [node for node in nodes if node.node.node_id not in followers]
+        starts += [node for node in nodes if node.node.node_id in followers]
+        placed, merged, merges = set(), [], 0
+        for node in starts:
+            node_id = node.node.node_id
+            if node_id in placed:
+                continue
+            run = [node]
+            placed.add(node_id)
+            node_id = following.get(node_id)
+            while node_id is not None and node_id not in placed:
+                run.append(by_id[node_id])
+                placed.add(node_id)
+                node_id = following.get(node_id)
+            if len(run) == 1 or len({_source_of(n.node) for n in run}) > 1:
+                merged.extend(run)
+                continue
+
+            first = run[0].node
+            text, tokens = first.get_content(), token_count(first)
+            for part in run[1:]:
+                text, overlap = _merge_text(text, part.node.get_content())
+                # Only the shared text is re-tokenized
+                tokens += token_count(part.node) - (
+                    count_tokens(overlap) if overlap else 0
+                )
+            combined = TextNode(
+                id_="+".join(n.node.node_id for n in run),
+                text=text,
+                metadata={**first.metadata, TOKEN_COUNT_KEY: tokens},
+                excluded_embed_metadata_keys=first.excluded_embed_metadata_keys,
+                excluded_llm_metadata_keys=first.excluded_llm_metadata_keys,
+                relationships={
+                    key: value
+                    for key, value in first.relationships.items()
+                    if key == NodeRelationship.SOURCE
+                },
+            )
+            merged.append(
+                NodeWithScore(node=combined, score=max(n.score or 0 for n in run))
+            )
+            merges += len(run) - 1
+        merged.sort(key=lambda node: node.score or 0, reverse=True)
+        return merged, merges
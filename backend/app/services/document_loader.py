@@ -0,0 +1,111 @@
+import logging
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.core.metrics import observe_stage
+from llama_index.core import SimpleDirectoryReader
+
+logger = logging.getLogger(__name__)
+
+
+def parse_file(file_path: str):
+    """Parse one file into llama-index documents"""
+    return SimpleDirectoryReader(
+        input_files=[file_path], filename_as_id=True
+    ).load_data()
+
+
+def _timed_parse(file_path: str):
+    # Runs in a parser process, whose own metrics nobody scrapes
+    started = time.perf_counter()
+    documents = parse_file(file_path)
+    return documents, time.perf_counter() - started
+
+
+class DocumentLoader:
+    """
+    Parsing stage for ingestion.
+
+    Files are parsed across a pool of worker processes and their documents are
+    yielded one file at a time, in input order. At most max_in_flight files are
+    submitted or waiting to be consumed, so peak memory is bounded by that
+    window rather than by the size of the batch. With workers <= 1 files are
+    parsed lazily in-process.
+    """
+
+    def __init__(self, workers: int = 0, max_in_flight: int = 0):
+        self.workers = workers
+        self.max_in_flight = max_in_flight or 2 * max(1, workers)
+
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def load(self, file_paths):
+        """
+        Yield (file_path, documents, error) for every path.
+
+        documents is None and error holds the exception when parsing failed.
+        """
+        if self.workers <= 1:
+            for file_path in file_paths:
+                try:
+                    documents, seconds = _timed_parse(file_path)
+                except Exception as e:
+                    yield file_path, None, e
+                    continue
+                observe_stage("parse", seconds)
+                yield file_path, documents, None
+            return
+
+        in_flight = deque()
+        try:
+            for file_path in file_paths:
+                executor = self._get_executor()
+                future = executor.submit(_timed_parse, file_path)
+                in_flight.append((file_path, future, executor))
+                if len(in_flight) >= self.max_in_flight:
+                    yield self._result(*in_flight.popleft())
+            while in_flight:
+                yield self._result(*in_flight.popleft())
+        finally:
+            # Abandoned by the consumer: do not parse files nobody will read
+            for _, future, _ in in_flight:
+                future.cancel()
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def _result(self, file_path, future, executor):
+        try:
+            documents, seconds = future.result()
+        except BrokenProcessPool as e:
+            # A worker died (e.g. out of memory); start a fresh pool next time
+            logger.error("Parser pool broke while parsing %s", file_path)
+            with self._lock:
+                if self._executor is executor:
+                    executor.shutdown(wait=False)
+                    self._executor = None
+            return file_path, None, e
+        except Exception as e:
+            return file_path, None, e
+        observe_stage("parse", seconds)
+        return file_path, documents, None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                logger.info("Starting %d document parser workers", self.workers)
+                # The ingestion process already runs threads and torch
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
@@ -0,0 +1,167 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from llama_index.core.schema import MetadataMode
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+_QUERY_BATCH_SIZE = 500
+
+
+def text_hash(text: str) -> str:
+    """SHA-256 of the exact text sent to the embedding model"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed, on-disk cache of text embeddings.
+
+    Rows are keyed by (model name, text hash) and store vectors as float32
+    blobs in SQLite. The table is capped at max_entries; the least recently
+    used rows are evicted first.
+    """
+
+    def __init__(self, path: str, model_name: str, max_entries: int = 500_000):
+        self.path = path
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            ) WITHOUT ROWID
+            """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_embeddings_last_used "
+            "ON embeddings (last_used)"
+        )
+        self._conn.commit()
+
+    def get_many(self, hashes):
+        """Return {text_hash: vector} for the hashes present in the cache"""
+        found = {}
+        if not hashes:
+            return found
+
+        unique = list(dict.fromkeys(hashes))
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(unique), _QUERY_BATCH_SIZE):
+                batch = unique[start : start + _QUERY_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model_name, *batch],
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? "
+                        f"WHERE model = ? AND text_hash IN "
+                        f"({','.join('?' * len(rows))})",
+                        [now, self.model_name, *(key for key, _ in rows)],
+                    )
+            self._conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+        return found
+
+    def put_many(self, items):
+        """Store (text_hash, vector) pairs and evict if over capacity"""
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (self.model_name, key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for key, vector in items
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings "
+                "(model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._evict()
+            self._conn.commit()
+
+    def stats(self):
+        """Entry count and hit/miss counters"""
+        with self._lock:
+            (entries,) = self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _evict(self):
+        (entries,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if entries <= self.max_entries:
+            return
+        # Trim to 90% of the cap so eviction does not run on every insert
+        excess = entries - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE (model, text_hash) IN ("
+            "SELECT model, text_hash FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        logger.info("Evicted %d embeddings from cache", excess)
+
+
+def embed_nodes_cached(nodes, embed_texts, cache: EmbeddingCache = None):
+    """
+    Fill node.embedding for every node, consulting the cache first.
+
+    Only cache misses are passed to embed_texts, a callable mapping a list of
+    texts to their vectors in order; the results are written back to the cache.
+    """
+    pending = [node for node in nodes if node.embedding is None]
+    if not pending:
+        return
+
+    texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in pending]
+    hashes = [text_hash(text) for text in texts]
+
+    cached = cache.get_many(hashes) if cache is not None else {}
+
+    missing = {}
+    for key, text in zip(hashes, texts):
+        if key not in cached and key not in missing:
+            missing[key] = text
+
+    if missing:
+        vectors = embed_texts(list(missing.values()))
+        computed = dict(zip(missing.keys(), vectors))
+        if cache is not None:
+            cache.put_many(list(computed.items()))
+        cached.update(computed)
+
+    for node, key in zip(pending, hashes):
+        node.embedding = cached[key]
@@ -0,0 +1,68 @@
+"""
+Deterministic stand-in for the embedding model.
+
+Texts are embedded by hashing their terms into a fixed number of dimensions,
+so texts sharing words get similar vectors and retrieval behaves plausibly,
+without downloading or running a model. latency_ms is added per batch to
+approximate a model forward pass; like passes on one device, batches run one
+at a time.
+"""
+
+import asyncio
+import hashlib
+import math
+import threading
+import time
+from typing import List
+
+from app.services.keyword_index import tokenize
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field
+
+_device = threading.Lock()
+
+
+def hashed_embedding(text: str, dim: int) -> List[float]:
+    """Unit vector of term counts hashed into dim signed buckets"""
+    vector = [0.0] * dim
+    for term in tokenize(text):
+        digest = hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "big") % dim
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector))
+    if not norm:
+        # Text without terms still needs a valid direction
+        vector[0], norm = 1.0, 1.0
+    return [value / norm for value in vector]
+
+
+class StandInEmbedding(BaseEmbedding):
+    """Embedding model backed by hashed_embedding"""
+
+    dim: int = Field(default=384, gt=0)
+    latency_ms: float = Field(default=0.0, ge=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "StandInEmbedding"
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._get_text_embeddings([query])[0]
+
+    def get_query_embedding_batch(self, queries: List[str]) -> List[List[float]]:
+        """Several queries for the latency of one batch"""
+        return self._get_text_embeddings(queries)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return hashed_embedding(query, self.dim)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_ms:
+            with _device:
+                time.sleep(self.latency_ms / 1000)
+        return [hashed_embedding(text, self.dim) for text in texts]
@@ -0,0 +1,144 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Model copy owned by each worker process, created by _init_worker
+_worker_model = None
+
+
+def _init_worker(model_name: str, num_threads: int):
+    global _worker_model
+    # Thread limits must be in place before torch is imported
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    os.environ["MKL_NUM_THREADS"] = str(num_threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+    import torch
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    torch.set_num_threads(num_threads)
+    _worker_model = HuggingFaceEmbedding(model_name=model_name)
+
+
+def _embed_batch(texts):
+    return _worker_model.get_text_embedding_batch(texts)
+
+
+class BatchedEmbedder:
+    """
+    Embedding stage for ingestion.
+
+    Texts are grouped into batches of batch_size. With more than one worker
+    configured, batches are spread across a pool of processes, each holding
+    its own model copy limited to threads_per_worker threads; results come
+    back in input order. Small inputs stay on the in-process model to avoid
+    the IPC round-trip.
+    """
+
+    def __init__(
+        self,
+        embed_model,
+        model_name: str,
+        workers: int = 0,
+        batch_size: int = 64,
+        threads_per_worker: int = 0,
+    ):
+        self.embed_model = embed_model
+        self.model_name = model_name
+        self.workers = workers
+        self.batch_size = batch_size
+        self.threads_per_worker = threads_per_worker or max(
+            1, (os.cpu_count() or 1) // max(1, workers)
+        )
+
+        self._executor = None
+        self._lock = threading.Lock()
+        self.total_chunks = 0
+        self.total_seconds = 0.0
+        self.last_run = None
+
+    def embed(self, texts):
+        """Embed texts and return their vectors in the same order"""
+        if not texts:
+            return []
+
+        start = time.perf_counter()
+        if self.workers > 1 and len(texts) > self.batch_size:
+            batches = [
+                texts[i : i + self.batch_size]
+                for i in range(0, len(texts), self.batch_size)
+            ]
+            vectors = [
+                vector
+                for batch in self._get_executor().map(_embed_batch, batches)
+                for vector in batch
+            ]
+            workers = self.workers
+        else:
+            vectors = self.embed_model.get_text_embedding_batch(texts)
+            workers = 1
+        elapsed = time.perf_counter() - start
+
+        self._record(len(texts), elapsed, workers)
+        return vectors
+
+    def stats(self):
+        """Throughput of the last run and since startup, in chunks/sec"""
+        return {
+            "workers": self.workers,
+            "batch_size": self.batch_size,
+            "threads_per_worker": self.threads_per_worker,
+            "total_chunks": self.total_chunks,
+            "chunks_per_sec": (
+                self.total_chunks / self.total_seconds if self.total_seconds else 0.0
+            ),
+            "last_run": self.last_run,
+        }
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                logger.info(
+                    "Starting %d embedding workers (%d threads each)",
+                    self.workers,
+                    self.threads_per_worker,
+                )
+                # Forking a process that already loaded torch is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model_name, self.threads_per_worker),
+                )
+            return self._executor
+
+    def _record(self, chunks: int, elapsed: float, workers: int):
+        throughput = chunks / elapsed if elapsed else 0.0
+        with self._lock:
+            self.total_chunks += chunks
+            self.total_seconds += elapsed
+            self.last_run = {
+                "chunks": chunks,
+                "seconds": round(elapsed, 3),
+                "workers": workers,
+                "chunks_per_sec": round(throughput, 1),
+            }
+        logger.info(
+            "Embedded %d chunks in %.2fs (%.1f chunks/sec, %d workers)",
+            chunks,
+            elapsed,
+            throughput,
+            workers,
+        )
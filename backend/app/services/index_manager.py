@@ -0,0 +1,592 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from app.core.metrics import PACKED_TOKENS, RETRIEVED_NODES, time_stage
+from app.services.embedding_cache import embed_nodes_cached
+from app.services.index_snapshots import SnapshotStore
+from app.services.keyword_index import reciprocal_rank_fusion
+from app.services.synthesis import LLMCallRecorder, Synthesizers
+from app.services.vector_store import MmapVectorStore
+from llama_index.core import (
+    QueryBundle,
+    StorageContext,
+    VectorStoreIndex,
+    load_index_from_storage,
+)
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.schema import NodeWithScore
+
+logger = logging.getLogger(__name__)
+
+
+class SortedRetrieverQueryEngine:
+    """
+    Query engine that sorts based on similarity score.
+
+    retrieval_mode "vector" ranks by embedding similarity above a cutoff,
+    "keyword" by BM25 over the keyword index, and "hybrid" fuses both
+    rankings by reciprocal rank, so exact identifiers that embed poorly can
+    still be retrieved. With a context packer the retrieved nodes are
+    trimmed to its token budget before synthesis. With a query embedder the
+    questions of concurrent queries are embedded in shared batches. The
+    synthesis mode can be chosen per query, and the LLM calls each answer
+    takes are recorded.
+    """
+
+    similarity_cutoff = 0.5
+    max_selected_nodes = 8
+
+    def __init__(
+        self,
+        retriever,
+        synthesizers,
+        embed_model,
+        lock,
+        call_recorder,
+        keyword_index=None,
+        docstore=None,
+        retrieval_mode="vector",
+        keyword_top_k=10,
+        rrf_k=60,
+        context_packer=None,
+        query_embedder=None,
+    ):
+        self.retriever = retriever
+        self.synthesizers = synthesizers
+        self.call_recorder = call_recorder
+        self.embed_model = embed_model
+        self.lock = lock
+        self.keyword_index = keyword_index
+        self.docstore = docstore
+        self.retrieval_mode = retrieval_mode if keyword_index else "vector"
+        self.keyword_top_k = keyword_top_k
+        self.rrf_k = rrf_k
+        self.context_packer = context_packer
+        self.query_embedder = query_embedder
+
+    def retrieve(self, query):
+        """Nodes above the similarity cutoff, best first"""
+        if self.retrieval_mode == "keyword":
+            return self.retrieve_keyword(query)[: self.max_selected_nodes]
+        vector_nodes = self.retrieve_vector(query)
+        if self.retrieval_mode != "hybrid":
+            return vector_nodes[: self.max_selected_nodes]
+
+        keyword_nodes = self.retrieve_keyword(query)
+        by_id = {node.node_id: node for node in keyword_nodes + vector_nodes}
+        fused = reciprocal_rank_fusion(
+            [
+                [node.node_id for node in vector_nodes],
+                [node.node_id for node in keyword_nodes],
+            ],
+            k=self.rrf_k,
+        )
+        return [
+            NodeWithScore(node=by_id[node_id].node, score=score)
+            for node_id, score in fused[: self.max_selected_nodes]
+        ]
+
+    def retrieve_vector(self, query):
+        """Nodes above the similarity cutoff by embedding similarity"""
+        # Embed outside the lock; only the vector store lookup has to be
+        # serialized against in-place inserts from the ingestion worker
+        with time_stage("query_embed"):
+            if self.query_embedder is not None:
+                embedding = self.query_embedder.embed(query)
+            else:
+                embedding = self.embed_model.get_query_embedding(query)
+        query_bundle = QueryBundle(query, embedding=embedding)
+        with time_stage("vector_search"), self.lock:
+            retrieved = self.retriever.retrieve(query_bundle)
+
+        nodes = [node for node in retrieved if node.score >= self.similarity_cutoff]
+        return sorted(nodes, key=lambda x: x.score, reverse=True)
+
+    def retrieve_keyword(self, query):
+        """Nodes ranked by BM25, best first"""
+        with time_stage("keyword_search"):
+            hits = self.keyword_index.search(query, self.keyword_top_k)
+        nodes = []
+        with self.lock:
+            for node_id, score in hits:
+                # Postings are written before the docstore during ingestion
+                node = self.docstore.get_node(node_id, raise_error=False)
+                if node is not None:
+                    nodes.append(NodeWithScore(node=node, score=score))
+        return nodes
+
+    def select_context(self, query):
+        """Retrieved nodes packed for synthesis, and the packing report"""
+        nodes = self.retrieve(query)
+        RETRIEVED_NODES.observe(len(nodes))
+        if self.context_packer is None:
+            return nodes, None
+        with time_stage("context_pack"):
+            selected, report = self.context_packer.pack(nodes)
+        PACKED_TOKENS.observe(report["tokens_packed"])
+        return selected, report
+
+    def query(self, query, synthesis_mode=None):
+        nodes, report = self.select_context(query)
+        mode = synthesis_mode or self.synthesizers.default_mode
+        with self.call_recorder.track(mode) as usage, time_stage("synthesis"):
+            response = self.synthesizers.get(mode).synthesize(query, nodes)
+        self.call_recorder.finish(usage)
+
+        metadata = {**(response.metadata or {}), "synthesis": usage.as_dict()}
+        if report is not None:
+            metadata["context"] = report
+        response.metadata = metadata
+        return response
+
+    def stream(self, query, synthesis_mode=None):
+        """Return the selected nodes and a generator of answer tokens"""
+        nodes, _ = self.select_context(query)
+        mode = synthesis_mode or self.synthesizers.default_mode
+        with self.call_recorder.track(mode) as usage:
+            response = self.synthesizers.get(mode, streaming=True).synthesize(
+                query, nodes
+            )
+
+        def generate():
+            try:
+                with time_stage("synthesis"):
+                    yield from response.response_gen
+            finally:
+                self.call_recorder.finish(usage)
+
+        return nodes, generate()
+
+
+class IndexManager:
+    """
+    Keep a single vector index resident for the lifetime of the process.
+
+    The index is loaded from storage once, shared by every request and updated
+    in place by ingestion, so queries only pay for retrieval and synthesis.
+    version increases on every change to the indexed corpus. An optional
+    keyword index is kept in step with every insert and delete.
+
+    Storage is a series of immutable snapshots under storage_path/snapshots.
+    Changes are made inside writing(), which holds the write lock of every
+    process sharing the storage and starts from the newest snapshot, and are
+    published by persist(). poll() notices snapshots written by other
+    processes and loads them in the background; queries keep using the index
+    they started with until the new one is swapped in.
+    """
+
+    def __init__(
+        self,
+        storage_path: str,
+        embed_model,
+        llm,
+        similarity_top_k=10,
+        embedding_cache=None,
+        embedder=None,
+        vector_store_backend="simple",
+        vector_store_options=None,
+        keyword_index=None,
+        retrieval_mode="vector",
+        keyword_top_k=10,
+        rrf_k=60,
+        context_packer=None,
+        synthesis_mode="compact",
+        synthesis_concurrency=4,
+        query_embedder=None,
+        snapshot_keep=3,
+        poll_seconds=1.0,
+    ):
+        self.storage_path = storage_path
+        self.snapshots = SnapshotStore(
+            os.path.join(storage_path, "snapshots"), keep=snapshot_keep
+        )
+        self.poll_seconds = poll_seconds
+        self.vector_store_backend = vector_store_backend
+        self.vector_store_options = vector_store_options or {}
+        self.embed_model = embed_model
+        self.llm = llm
+        self.embedding_cache = embedding_cache
+        self.embedder = embedder
+        self.similarity_top_k = similarity_top_k
+        self.keyword_index = keyword_index
+        self.retrieval_mode = retrieval_mode
+        self.keyword_top_k = keyword_top_k
+        self.rrf_k = rrf_k
+        self.context_packer = context_packer
+        self.query_embedder = query_embedder
+        self.call_recorder = LLMCallRecorder()
+        self.synthesizers = Synthesizers(
+            llm,
+            default_mode=synthesis_mode,
+            max_concurrency=synthesis_concurrency,
+            callback_manager=CallbackManager([self.call_recorder]),
+        )
+
+        self.index = None
+        self.query_engine = None
+        self.lock = threading.RLock()
+        self.version = 0
+        self.snapshot = None
+        self.reloads = 0
+        self._loaded = False
+        self._signature = None
+        self._persisted_version = None
+        self._last_poll = 0.0
+        self._reload_thread = None
+        self._reload_lock = threading.Lock()
+        # Held while load() reads, so concurrent first uses read only once
+        self._load_lock = threading.RLock()
+
+    def load(self):
+        """Load the current snapshot from storage"""
+        os.makedirs(self.storage_path, exist_ok=True)
+        with self._load_lock:
+            # Read outside the query lock; queries keep using the previous index
+            index, snapshot, signature = self._read_current()
+            with self.lock:
+                self._install(index, snapshot, signature)
+
+    @contextmanager
+    def writing(self):
+        """
+        Hold the write lock shared with other processes, after catching up
+        with the newest snapshot, so changes never build on a stale index.
+        """
+        with self.snapshots.writer():
+            if not self._loaded or self.snapshots.current() != self.snapshot:
+                self.load()
+            yield
+
+    def poll(self):
+        """
+        Start loading a snapshot written by another process, if there is one.
+
+        Returns at once: the pointer is only stat'ed, at most every
+        poll_seconds, and the new index is loaded on a background thread.
+        """
+        if not self._loaded or self.poll_seconds < 0:
+            return
+        now = time.monotonic()
+        if now - self._last_poll < self.poll_seconds:
+            return
+        self._last_poll = now
+        if self.snapshots.signature() == self._signature:
+            return
+        with self._reload_lock:
+            if self._reload_thread is not None and self._reload_thread.is_alive():
+                return
+            self._reload_thread = threading.Thread(
+                target=self._reload, name="index-reload", daemon=True
+            )
+            self._reload_thread.start()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def ensure_loaded(self):
+        """
+        Load the index on first use if the startup warm-up has not run yet.
+
+        Callers racing the warm-up wait for its load instead of loading again.
+        """
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self.load()
+
+    def add_nodes(self, nodes):
+        """
+        Embed nodes and insert them into the shared index, creating it if needed.
+
+        Embedding runs before the lock is taken so concurrent queries are only
+        blocked for the insert itself. Vectors already in the embedding cache
+        are reused instead of being recomputed.
+        """
+        if not nodes:
+            return
+        # Inserting before the stored index is loaded would start a new one
+        self.ensure_loaded()
+        self.embed_nodes(nodes)
+        if self.keyword_index is not None:
+            with time_stage("keyword_insert"):
+                self.keyword_index.add_nodes(nodes)
+
+        with self.lock, time_stage("index_insert"):
+            if self.index is None:
+                storage_context = StorageContext.from_defaults(
+                    vector_store=self._open_vector_store()
+                )
+                self.index = VectorStoreIndex(
+                    nodes,
+                    embed_model=self.embed_model,
+                    storage_context=storage_context,
+                )
+                self._build_query_engine()
+            else:
+                self.index.insert_nodes(nodes)
+            self.version += 1
+
+    def embed_nodes(self, nodes):
+        """
+        Fill in the embedding of every node that has none, from the embedding
+        cache where possible. add_nodes() skips nodes embedded beforehand.
+        """
+        embed_texts = (
+            self.embedder.embed
+            if self.embedder is not None
+            else self.embed_model.get_text_embedding_batch
+        )
+        with time_stage("embed"):
+            embed_nodes_cached(nodes, embed_texts, self.embedding_cache)
+
+    def update_nodes(self, nodes):
+        """
+        Rewrite stored nodes, e.g. their prev/next links, keeping their
+        vectors and keyword postings; the text must not change.
+        """
+        if not nodes:
+            return
+        self.ensure_loaded()
+        with self.lock, time_stage("index_insert"):
+            if self.index is None:
+                return
+            self.index.docstore.add_documents(nodes, allow_update=True)
+            self.version += 1
+
+    def delete_nodes(self, node_ids):
+        """Remove nodes from the vector store, docstore and index struct"""
+        if not node_ids:
+            return
+        self.ensure_loaded()
+        with self.lock, time_stage("index_delete"):
+            if self.index is None:
+                return
+            self.index.delete_nodes(node_ids, delete_from_docstore=True)
+            for node_id in node_ids:
+                self.index.index_struct.nodes_dict.pop(node_id, None)
+            self.index.storage_context.index_store.add_index_struct(
+                self.index.index_struct
+            )
+            self.version += 1
+        if self.keyword_index is not None:
+            self.keyword_index.delete_nodes(node_ids)
+
+    def persist(self):
+        """Publish the index as a new snapshot, if it changed since the last one"""
+        with self.snapshots.writer(), time_stage("persist"):
+            with self.lock:
+                if self.version == self._persisted_version:
+                    return
+                index, version = self.index, self.version
+
+            def write(directory):
+                # No index files at all stands for an empty index
+                if index is not None:
+                    index.storage_context.persist(persist_dir=directory)
+
+            # Changes are only made under the writer lock held here, so the
+            # index stays as captured while queries go on reading it
+            snapshot = self.snapshots.write(write)
+            signature = self.snapshots.signature()
+            with self.lock:
+                self.snapshot = snapshot
+                self._signature = signature
+                self._persisted_version = version
+
+    def reset(self):
+        """Drop the in-memory index and the keyword index"""
+        with self.lock:
+            self.index = None
+            self.query_engine = None
+            if self.keyword_index is not None:
+                self.keyword_index.reset()
+            self._loaded = True
+            self.version += 1
+
+    def node_count(self):
+        """Number of nodes currently held by the index"""
+        return len(self.index.docstore.docs) if self.index else 0
+
+    def nodes(self, node_ids=None):
+        """Nodes currently held by the index, all of them or those of node_ids"""
+        with self.lock:
+            if self.index is None:
+                return []
+            docstore = self.index.docstore
+            if node_ids is None:
+                return list(docstore.docs.values())
+            nodes = [docstore.get_node(i, raise_error=False) for i in node_ids]
+            return [node for node in nodes if node is not None]
+
+    def vector_store_stats(self, evaluate=False):
+        """
+        Describe the vector store; evaluate also measures how quantization
+        changes scores and rankings.
+        """
+        with self.lock:
+            vector_store = self.index.vector_store if self.index else None
+        if not isinstance(vector_store, MmapVectorStore):
+            return {"backend": self.vector_store_backend}
+        stats = vector_store.describe()
+        if evaluate:
+            stats["quantization"] = vector_store.evaluate_quantization()
+        return stats
+
+    def keyword_index_stats(self):
+        """Describe the keyword index and the retrieval mode"""
+        if self.keyword_index is None:
+            return {"retrieval_mode": "vector"}
+        return {"retrieval_mode": self.retrieval_mode, **self.keyword_index.stats()}
+
+    def snapshot_stats(self):
+        """Snapshot this process serves and the snapshots on disk"""
+        return {
+            **self.snapshots.stats(),
+            "loaded": self.snapshot,
+            "reloads": self.reloads,
+            "poll_seconds": self.poll_seconds,
+        }
+
+    def synthesis_stats(self):
+        """Default synthesis mode and LLM call totals"""
+        return {
+            "default_mode": self.synthesizers.default_mode,
+            "max_concurrency": self.synthesizers.max_concurrency,
+            **self.call_recorder.stats(),
+        }
+
+    def query(self, query_text: str, synthesis_mode=None):
+        """Answer a query against the resident index"""
+        self.ensure_loaded()
+        query_engine = self.query_engine
+        if query_engine is None:
+            return None
+        return query_engine.query(query_text, synthesis_mode)
+
+    def stream_query(self, query_text: str, synthesis_mode=None):
+        """
+        Retrieve for a query and start generating the answer.
+
+        Returns (source nodes, token generator), or None without an index.
+        """
+        self.ensure_loaded()
+        query_engine = self.query_engine
+        if query_engine is None:
+            return None
+        return query_engine.stream(query_text, synthesis_mode)
+
+    def _open_vector_store(self, persist_dir=None):
+        # None lets StorageContext fall back to the default SimpleVectorStore
+        if self.vector_store_backend != "mmap":
+            return None
+        if persist_dir is None:
+            return MmapVectorStore(**self.vector_store_options)
+        return MmapVectorStore.from_persist_dir(
+            persist_dir, **self.vector_store_options
+        )
+
+    def _read_index(self, snapshot):
+        # Snapshot None is the layout from before snapshots: files directly in
+        # storage_path, or nothing at all
+        persist_dir = self.snapshots.path(snapshot) if snapshot else self.storage_path
+        with time_stage("index_load"):
+            if self.keyword_index is not None:
+                # Shared with the other workers, which may have written to it
+                self.keyword_index.refresh()
+            if not os.path.exists(os.path.join(persist_dir, "docstore.json")):
+                logger.info("No index in %s, starting empty", persist_dir)
+                return None
+            logger.debug("Loading index from %s", persist_dir)
+            storage_context = StorageContext.from_defaults(
+                persist_dir=persist_dir,
+                vector_store=self._open_vector_store(persist_dir),
+            )
+            index = load_index_from_storage(
+                storage_context, embed_model=self.embed_model
+            )
+            logger.info(
+                "Loaded %d nodes from %s", len(index.docstore.docs), persist_dir
+            )
+            self._backfill_keyword_index(index)
+            return index
+
+    def _read_current(self):
+        while True:
+            signature = self.snapshots.signature()
+            snapshot = self.snapshots.current()
+            with self.snapshots.reading(snapshot) as present:
+                if present:
+                    return self._read_index(snapshot), snapshot, signature
+            # Pruned since the pointer was read; a newer snapshot is current
+
+    def _install(self, index, snapshot, signature):
+        # Callers hold self.lock
+        self.index = index
+        self._build_query_engine()
+        self.snapshot = snapshot
+        self._signature = signature
+        self._loaded = True
+        self.version += 1
+        # A store converted while loading is published by the next persist()
+        vector_store = index.vector_store if index is not None else None
+        dirty = isinstance(vector_store, MmapVectorStore) and vector_store.dirty
+        self._persisted_version = None if dirty else self.version
+
+    def _reload(self):
+        signature = self.snapshots.signature()
+        snapshot = self.snapshots.current()
+        with self.lock:
+            version, loaded = self.version, self.snapshot
+        if snapshot == loaded:
+            self._signature = signature
+            return
+        # Tried again on the next poll if this fails, as the signature is
+        # unchanged
+        with self.snapshots.reading(snapshot) as present:
+            if not present:
+                return
+            try:
+                index = self._read_index(snapshot)
+            except Exception:
+                logger.exception("Loading index snapshot %s failed", snapshot)
+                return
+        with self.lock:
+            if (self.version, self.snapshot) != (version, loaded):
+                # Changed here in the meantime, by a writer that caught up first
+                return
+            self._install(index, snapshot, signature)
+            self.reloads += 1
+        logger.info("Switched to index snapshot %s", snapshot)
+
+    def _build_query_engine(self):
+        if self.index is None:
+            self.query_engine = None
+            return
+        retriever = self.index.as_retriever(similarity_top_k=self.similarity_top_k)
+        self.query_engine = SortedRetrieverQueryEngine(
+            retriever,
+            self.synthesizers,
+            self.embed_model,
+            self.lock,
+            self.call_recorder,
+            keyword_index=self.keyword_index,
+            docstore=self.index.docstore,
+            retrieval_mode=self.retrieval_mode,
+            keyword_top_k=self.keyword_top_k,
+            rrf_k=self.rrf_k,
+            context_packer=self.context_packer,
+            query_embedder=self.query_embedder,
+        )
+
+    def _backfill_keyword_index(self, index):
+        # Indexes persisted before keyword search existed have no postings
+        if self.keyword_index is None or self.keyword_index.doc_count():
+            return
+        nodes = list(index.docstore.docs.values())
+        if nodes:
+            logger.info("Building keyword index for %d nodes", len(nodes))
+            self.keyword_index.add_nodes(nodes)
@@ -0,0 +1,216 @@
+import fcntl
+import os
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+
+POINTER_FNAME = "CURRENT"
+LOCK_FNAME = ".lock"
+_TMP_PREFIX = ".tmp-"
+_READ_PREFIX = ".read-"
+
+
+def _fsync_tree(directory: str):
+    for parent, _, files in os.walk(directory):
+        for fname in files:
+            fd = os.open(os.path.join(parent, fname), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+    _fsync_dir(directory)
+
+
+def _fsync_dir(directory: str):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SnapshotStore:
+    """
+    Immutable, versioned index snapshots with an atomic pointer to the current one.
+
+    Every write goes to a fresh directory that is synced and renamed into
+    place before the CURRENT file is atomically replaced to name it, so a
+    reader sees either the old snapshot or the new one, never a half-written
+    mix. Snapshots are never modified after the swap; the newest keep are
+    retained, and an older one is only removed once no process is reading it.
+    Writers in every process are serialized by an exclusive lock file, so
+    versions increase without gaps or forks.
+    """
+
+    def __init__(self, root: str, keep: int = 3):
+        self.root = root
+        self.keep = max(1, keep)
+        self.writes = 0
+        self.pruned = 0
+
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._lock_file = None
+
+    @property
+    def pointer_path(self) -> str:
+        return os.path.join(self.root, POINTER_FNAME)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def current(self):
+        """Name of the current snapshot, None before the first write"""
+        try:
+            with open(self.pointer_path, "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def signature(self):
+        """
+        Stat of the pointer, which changes on every swap; comparing it is the
+        cheap way to notice a new snapshot.
+        """
+        try:
+            stat = os.stat(self.pointer_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def snapshots(self):
+        """Names of the complete snapshots, oldest first"""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        return sorted(
+            name
+            for name in names
+            if name[:1].isdigit() and os.path.isdir(self.path(name))
+        )
+
+    @contextmanager
+    def writer(self):
+        """
+        Hold the write lock of every process sharing root; reentrant within a
+        process.
+        """
+        with self._thread_lock:
+            if self._depth == 0:
+                os.makedirs(self.root, exist_ok=True)
+                lock_file = open(os.path.join(self.root, LOCK_FNAME), "a+")
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                except BaseException:
+                    lock_file.close()
+                    raise
+                self._lock_file = lock_file
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    @contextmanager
+    def reading(self, name):
+        """
+        Keep snapshot name from being pruned while it is read.
+
+        Yields whether it still exists; it may have been pruned between
+        reading the pointer and getting here.
+        """
+        if name is None:
+            yield True
+            return
+        with open(self.path(f"{_READ_PREFIX}{name}"), "a+") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            # prune() removes a snapshot before it lets go of this lock
+            yield os.path.isdir(self.path(name))
+
+    def write(self, persist) -> str:
+        """
+        Write a new snapshot with persist(directory) and make it current.
+
+        Returns the snapshot's name.
+        """
+        with self.writer():
+            current = self.current()
+            sequence = int(current.split("-")[0]) + 1 if current else 1
+            name = f"{sequence:010d}-{uuid.uuid4().hex[:8]}"
+
+            staging = self.path(f"{_TMP_PREFIX}{name}")
+            os.makedirs(staging)
+            try:
+                persist(staging)
+                _fsync_tree(staging)
+                os.rename(staging, self.path(name))
+            except BaseException:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+
+            pointer_tmp = self.path(f"{_TMP_PREFIX}{POINTER_FNAME}-{os.getpid()}")
+            with open(pointer_tmp, "w", encoding="utf-8") as f:
+                f.write(name)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(pointer_tmp, self.pointer_path)
+            _fsync_dir(self.root)
+
+            self.writes += 1
+            self.prune()
+        return name
+
+    def prune(self):
+        """
+        Remove snapshots beyond the newest keep that nobody is reading, and
+        abandoned writes.
+        """
+        with self.writer():
+            current = self.current()
+            names = self.snapshots()
+            for name in names[: -self.keep]:
+                if name != current and self._remove_unread(name):
+                    self.pruned += 1
+
+            for entry in os.listdir(self.root):
+                # Under the lock no write is in progress, so staging left
+                # behind belongs to a writer that crashed
+                if entry.startswith(_TMP_PREFIX):
+                    target = self.path(entry)
+                    if os.path.isdir(target):
+                        shutil.rmtree(target, ignore_errors=True)
+                    else:
+                        os.remove(target)
+                # Left by readers that found their snapshot already gone
+                elif entry.startswith(_READ_PREFIX):
+                    name = entry[len(_READ_PREFIX) :]
+                    if name not in names:
+                        self._remove_unread(name)
+
+    def _remove_unread(self, name) -> bool:
+        lock_path = self.path(f"{_READ_PREFIX}{name}")
+        with open(lock_path, "a+") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Still being read; removed by a later prune
+                return False
+            shutil.rmtree(self.path(name), ignore_errors=True)
+            os.remove(lock_path)
+        return True
+
+    def stats(self):
+        """Current snapshot and how many are kept on disk"""
+        return {
+            "current": self.current(),
+            "retained": len(self.snapshots()),
+            "keep": self.keep,
+            "writes": self.writes,
+            "pruned": self.pruned,
+        }
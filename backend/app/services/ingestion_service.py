@@ -0,0 +1,620 @@
+import hashlib
+import logging
+import os
+import queue
+import threading
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.db.models import IngestionJob, IngestionManifest
+from app.db.session import SessionLocal
+from app.services.context_packer import set_token_count
+from app.services.document_loader import DocumentLoader, parse_file
+from app.services.rag_service import (
+    DATA_PATH,
+    EMBED_MODEL_NAME,
+    STORAGE_PATH,
+    blob_store,
+    index_manager,
+    release_duplicates,
+)
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import NodeRelationship
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 2048
+CHUNK_OVERLAP = 256
+# Bumping either model or chunker version forces every file to be re-ingested
+CHUNKER_VERSION = f"sentence-splitter:{CHUNK_SIZE}:{CHUNK_OVERLAP}"
+HASH_BLOCK_SIZE = 1024 * 1024
+# Written by the ingestion that predates the manifest
+LEGACY_MANIFEST_FNAME = "processed_files.json"
+
+text_splitter = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+# Parses the files of a job in parallel, a bounded number of files at a time
+document_loader = DocumentLoader(
+    workers=settings.PARSE_WORKERS, max_in_flight=settings.PARSE_MAX_IN_FLIGHT
+)
+
+# Jobs are (job_id, file_paths) tuples consumed by a single background worker
+_job_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+registry.gauge_callback(
+    "rag_ingestion_queue_depth",
+    "Ingestion jobs waiting for the worker",
+    _job_queue.qsize,
+)
+
+
+def start_ingestion_worker():
+    """Start the background ingestion worker if it is not already running"""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(
+                target=_run_worker, name="ingestion-worker", daemon=True
+            )
+            _worker.start()
+
+
+def enqueue_ingestion(file_paths, db: Session):
+    """
+    Record an ingestion job for the given files and hand it to the worker.
+    """
+    job = IngestionJob(status="queued", total_files=len(file_paths))
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    _job_queue.put((job.id, list(file_paths)))
+    return job
+
+
+def enqueue_unprocessed_files(db: Session):
+    """
+    Queue every file in DATA_PATH and every uploaded blob that is new or
+    changed since it was ingested.
+
+    Only the stat signature is compared against the manifest, so a rescan
+    never opens unchanged files.
+    """
+    if not DATA_PATH or not os.path.isdir(DATA_PATH):
+        return None
+
+    with os.scandir(DATA_PATH) as entries:
+        file_paths = [entry.path for entry in entries if entry.is_file()]
+    file_paths.extend(blob_store.iter_paths())
+    remove_legacy_nodes(file_paths, db)
+
+    manifest = {entry.filename: entry for entry in db.query(IngestionManifest).all()}
+    pending = []
+    for file_path in file_paths:
+        entry = manifest.get(os.path.basename(file_path))
+        if entry is None or not is_unchanged(entry, os.stat(file_path)):
+            pending.append(file_path)
+
+    if not pending:
+        return None
+
+    logger.info("Queueing %d new or changed files from %s", len(pending), DATA_PATH)
+    return enqueue_ingestion(sorted(pending), db)
+
+
+def remove_legacy_nodes(file_paths, db: Session):
+    """
+    Drop the nodes that ingestion inserted with random ids before the manifest.
+
+    Their files have no manifest entry, so they are ingested again under
+    stable chunk ids and would otherwise be retrieved twice. Only nodes of
+    the given files are removed, as only those are re-ingested. Runs once:
+    processed_files.json is renamed afterwards.
+    """
+    legacy_path = os.path.join(STORAGE_PATH, LEGACY_MANIFEST_FNAME)
+    if not os.path.exists(legacy_path):
+        return
+
+    file_names = {os.path.basename(file_path) for file_path in file_paths}
+    with index_manager.writing():
+        if not os.path.exists(legacy_path):
+            # Migrated by another worker while this one waited for the lock
+            return
+        known = {
+            node_id
+            for entry in db.query(IngestionManifest).all()
+            for node_id in entry.node_ids or []
+        }
+        legacy_ids = [
+            node.node_id
+            for node in index_manager.nodes()
+            if node.node_id not in known
+            and os.path.basename(
+                node.metadata.get("file_path") or node.metadata.get("file_name", "")
+            )
+            in file_names
+        ]
+        index_manager.delete_nodes(legacy_ids)
+        index_manager.persist()
+        os.replace(legacy_path, legacy_path + ".migrated")
+    logger.info("Removed %d nodes of the pre-manifest index", len(legacy_ids))
+
+
+def get_ingestion_job(job_id: int, db: Session):
+    """Retrieve an ingestion job by id."""
+    return db.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+
+
+def hash_file(file_path: str) -> str:
+    """SHA-256 of the raw file bytes, read in fixed-size blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_current_version(entry: IngestionManifest) -> bool:
+    """Whether a manifest entry was produced by the current model and chunker"""
+    return (
+        entry.embed_model == EMBED_MODEL_NAME
+        and entry.chunker_version == CHUNKER_VERSION
+    )
+
+
+def is_unchanged(entry: IngestionManifest, stat) -> bool:
+    """Cheap check against the manifest using only size and mtime"""
+    return (
+        is_current_version(entry)
+        and entry.size == stat.st_size
+        and entry.mtime == stat.st_mtime
+    )
+
+
+def assign_chunk_ids(file_name: str, nodes):
+    """
+    Give nodes stable ids derived from their file and chunk text hash.
+
+    Re-splitting an unchanged chunk yields the same id, which is what lets an
+    edited file keep the vectors of the chunks it did not touch.
+    """
+    id_map = {}
+    occurrences = {}
+    for node in nodes:
+        chunk_hash = hashlib.sha256(node.text.encode("utf-8")).hexdigest()
+        occurrence = occurrences.get(chunk_hash, 0)
+        occurrences[chunk_hash] = occurrence + 1
+
+        chunk_id = f"{file_name}:{chunk_hash[:32]}:{occurrence}"
+        id_map[node.node_id] = chunk_id
+        node.id_ = chunk_id
+
+    # Keep prev/next links pointing at the renamed siblings
+    for node in nodes:
+        for relationship in (NodeRelationship.PREVIOUS, NodeRelationship.NEXT):
+            related = node.relationships.get(relationship)
+            if related is not None and related.node_id in id_map:
+                related.node_id = id_map[related.node_id]
+
+
+class FileUpdate:
+    """Pending changes to the index and manifest for one file"""
+
+    def __init__(
+        self,
+        file_path,
+        stat,
+        content_hash,
+        entry,
+        nodes,
+        previous_ids,
+        shared_with=None,
+    ):
+        self.file_path = file_path
+        self.file_name = os.path.basename(file_path)
+        # Name of the file whose nodes stand in for this one's, if any
+        self.shared_with = shared_with
+        self.stat = stat
+        self.content_hash = content_hash
+        self.entry = entry
+
+        # Vectors from another model or chunker cannot be reused
+        self.reset_ids = []
+        if entry and not is_current_version(entry):
+            self.reset_ids = list(previous_ids)
+            previous_ids = set()
+
+        self.nodes = nodes
+        self.chunk_ids = [node.node_id for node in nodes]
+        self.new_nodes = [node for node in nodes if node.node_id not in previous_ids]
+        self.stale_ids = list(previous_ids.difference(self.chunk_ids))
+        # Unchanged chunks of an edited file whose neighbours may have changed
+        self.kept_nodes = []
+        if self.new_nodes or self.stale_ids:
+            self.kept_nodes = [node for node in nodes if node.node_id in previous_ids]
+
+
+class FileCheck:
+    """
+    Signature of a file that has to be parsed, and its manifest entry. A file
+    whose content is already indexed under another name is not parsed; it is
+    recorded as sharing that file's nodes.
+    """
+
+    def __init__(self, file_path, stat, content_hash, entry, shared_with=None):
+        self.file_path = file_path
+        self.stat = stat
+        self.content_hash = content_hash
+        self.entry = entry
+        self.shared_with = shared_with
+
+
+def find_indexed_content(content_hash: str, db: Session):
+    """
+    Name of a file whose nodes index this content with the current version,
+    or None. Files sharing another file's nodes do not count.
+    """
+    entries = db.query(IngestionManifest).filter_by(
+        content_hash=content_hash,
+        embed_model=EMBED_MODEL_NAME,
+        chunker_version=CHUNKER_VERSION,
+    )
+    for entry in entries:
+        if entry.node_ids:
+            return entry.filename
+    return None
+
+
+def check_file(file_path: str, db: Session):
+    """
+    Decide whether a file has to be parsed again.
+
+    Unchanged files are detected first by size and mtime, then by the hash of
+    their raw bytes. Returns None for unchanged files, a FileCheck otherwise;
+    for a new file whose content is already indexed under another name its
+    shared_with is set and the file needs no parsing.
+    """
+    file_name = os.path.basename(file_path)
+    stat = os.stat(file_path)
+    entry = db.query(IngestionManifest).filter_by(filename=file_name).first()
+    if entry and is_unchanged(entry, stat):
+        logger.info("No changes detected: %s", file_name)
+        return None
+
+    content_hash = hash_file(file_path)
+    if entry and is_current_version(entry) and entry.content_hash == content_hash:
+        # Touched but not modified, only the stat signature needs updating
+        entry.size, entry.mtime = stat.st_size, stat.st_mtime
+        logger.info("No changes detected: %s", file_name)
+        return None
+
+    if entry is None:
+        indexed = find_indexed_content(content_hash, db)
+        if indexed is not None:
+            logger.info("Content of %s already indexed as %s", file_name, indexed)
+            return FileCheck(file_path, stat, content_hash, None, shared_with=indexed)
+
+    return FileCheck(file_path, stat, content_hash, entry)
+
+
+def build_update(check: FileCheck, documents):
+    """Chunk the parsed documents of a file and diff them against the index"""
+    nodes = text_splitter.get_nodes_from_documents(documents)
+    assign_chunk_ids(os.path.basename(check.file_path), nodes)
+    # Counted once here so queries can pack context without re-tokenizing
+    for node in nodes:
+        set_token_count(node)
+
+    entry = check.entry
+    previous_ids = set(entry.node_ids or []) if entry else set()
+    return FileUpdate(
+        check.file_path,
+        check.stat,
+        check.content_hash,
+        entry,
+        nodes,
+        previous_ids,
+        shared_with=check.shared_with,
+    )
+
+
+def prepare_file(file_path: str, db: Session):
+    """
+    Parse and chunk a file and work out how it differs from the index.
+
+    Returns None for unchanged files, which are never parsed.
+    """
+    check = check_file(file_path, db)
+    if check is None:
+        return None
+    if check.shared_with is not None:
+        return build_update(check, [])
+    return build_update(check, parse_file(file_path))
+
+
+def refresh_update(update: FileUpdate, db: Session):
+    """
+    Diff an update again against the manifest as it is now.
+
+    Files are checked and parsed without the write lock, so another worker
+    may have ingested the file, or a delete removed it, in the meantime.
+    Returns None when there is nothing left to do.
+    """
+    if not os.path.exists(update.file_path):
+        return None
+    entry = (
+        db.query(IngestionManifest)
+        .populate_existing()
+        .filter_by(filename=update.file_name)
+        .first()
+    )
+    if (
+        entry
+        and is_current_version(entry)
+        and entry.content_hash == update.content_hash
+    ):
+        return None
+    previous_ids = set(entry.node_ids or []) if entry else set()
+    return FileUpdate(
+        update.file_path,
+        update.stat,
+        update.content_hash,
+        entry,
+        update.nodes,
+        previous_ids,
+        shared_with=update.shared_with,
+    )
+
+
+def apply_updates(updates, db: Session):
+    """
+    Upsert a group of files into the index chunk by chunk.
+
+    The new chunks of every file are embedded together so bulk uploads fill
+    whole embedding batches; unchanged chunks keep their stored vectors and
+    chunks that disappeared are deleted. Unchanged chunks of an edited file
+    are rewritten so their prev/next links name the current chunks. Embedding
+    runs before anything is
+    written to the database, and the manifest rows are only staged in the
+    session, so the caller's commit is the only write transaction and a short
+    one.
+
+    Returns a function that reverts the index changes, for when the manifest
+    cannot be committed; a failure in here reverts them itself.
+    """
+    new_nodes = [node for update in updates for node in update.new_nodes]
+    index_manager.embed_nodes(new_nodes)
+
+    for update in updates:
+        entry = update.entry
+        if entry is None:
+            entry = IngestionManifest(filename=update.file_name)
+            db.add(entry)
+
+        entry.filepath = update.file_path
+        entry.size = update.stat.st_size
+        entry.mtime = update.stat.st_mtime
+        entry.content_hash = update.content_hash
+        entry.node_ids = update.chunk_ids
+        entry.embed_model = EMBED_MODEL_NAME
+        entry.chunker_version = CHUNKER_VERSION
+
+    removed_ids = [
+        node_id for update in updates for node_id in update.reset_ids + update.stale_ids
+    ]
+    # Kept to be re-inserted on undo; their vectors come from the embedding
+    # cache
+    removed = index_manager.nodes(removed_ids)
+    kept_nodes = [node for update in updates for node in update.kept_nodes]
+    relinked = index_manager.nodes([node.node_id for node in kept_nodes])
+    added_ids = []
+
+    def undo():
+        index_manager.delete_nodes(added_ids)
+        index_manager.add_nodes(removed)
+        index_manager.update_nodes(relinked)
+
+    try:
+        for update in updates:
+            index_manager.delete_nodes(update.reset_ids)
+
+        index_manager.add_nodes(new_nodes)
+        added_ids = [node.node_id for node in new_nodes]
+
+        for update in updates:
+            index_manager.delete_nodes(update.stale_ids)
+        index_manager.update_nodes(kept_nodes)
+    except Exception:
+        # A partial add may have inserted some of the new nodes
+        added_ids = [node.node_id for node in new_nodes]
+        undo()
+        raise
+
+    for update in updates:
+        logger.info(
+            "Ingested %s: %d chunks, %d embedded, %d removed",
+            update.file_name,
+            len(update.chunk_ids),
+            len(update.new_nodes),
+            len(update.stale_ids),
+        )
+    return undo
+
+
+def ingest_file(file_path: str, db: Session):
+    """
+    Parse, chunk, embed and upsert a single file into the shared index.
+
+    Returns the number of chunks embedded, 0 if the file is unchanged.
+    """
+    update = prepare_file(file_path, db)
+    if update is None:
+        return 0
+    with index_manager.writing():
+        update = refresh_update(update, db)
+        if update is None:
+            return 0
+        apply_updates([update], db)
+        index_manager.persist()
+        db.commit()
+    return len(update.new_nodes)
+
+
+def _run_worker():
+    while True:
+        job_id, file_paths = _job_queue.get()
+        try:
+            _run_job(job_id, file_paths)
+        except Exception:
+            logger.exception("Ingestion job %s crashed", job_id)
+        finally:
+            _job_queue.task_done()
+
+
+def _flush_updates(job: IngestionJob, updates, db: Session):
+    undo, requeue = None, []
+    try:
+        # Embedded before the lock, so other writers only wait for the index
+        # update itself
+        index_manager.embed_nodes(
+            [node for update in updates for node in update.new_nodes]
+        )
+        with index_manager.writing():
+            refreshed = [refresh_update(update, db) for update in updates]
+            refreshed = [update for update in refreshed if update is not None]
+            for update in list(refreshed):
+                if update.shared_with is None:
+                    continue
+                if find_indexed_content(update.content_hash, db) is None:
+                    # The file it was to share nodes with is gone since
+                    refreshed.remove(update)
+                    requeue.append(update.file_path)
+            # Files that shared the previous content of a changed file lose
+            # its nodes and are ingested on their own
+            replaced = {
+                update.entry.content_hash
+                for update in refreshed
+                if update.entry is not None
+                and update.entry.node_ids
+                and update.entry.content_hash != update.content_hash
+            }
+            try:
+                undo = apply_updates(refreshed, db)
+                requeue += release_duplicates(
+                    replaced, db, keep={update.file_name for update in refreshed}
+                )
+                # The snapshot is published before the manifest commit, so a
+                # crash in between leaves files to re-ingest rather than
+                # manifest rows with no nodes behind them
+                index_manager.persist()
+                job.processed_files += len(updates)
+                db.commit()
+            except Exception:
+                db.rollback()
+                if undo is not None:
+                    # The index must not keep nodes the manifest does not know
+                    # about
+                    undo()
+                    index_manager.persist()
+                raise
+    except Exception as e:
+        db.rollback()
+        logger.exception("Failed to ingest %d files", len(updates))
+        job.failed_files += len(updates)
+        job.error = f"{', '.join(update.file_name for update in updates)}: {e}"
+        requeue = []
+    db.commit()
+    if requeue:
+        enqueue_ingestion(requeue, db)
+
+
+def _record_failure(job: IngestionJob, file_path: str, error: Exception, db):
+    db.rollback()
+    logger.error("Failed to ingest %s", file_path, exc_info=error)
+    job.failed_files += 1
+    job.error = f"{os.path.basename(file_path)}: {error}"
+    db.commit()
+
+
+def _run_job(job_id: int, file_paths):
+    db = SessionLocal()
+    # Enough new chunks to keep every embedding worker busy for one batch
+    flush_chunks = settings.EMBED_BATCH_SIZE * max(1, settings.EMBED_WORKERS)
+    try:
+        job = get_ingestion_job(job_id, db)
+        job.status = "running"
+        db.commit()
+
+        # Files are checked, parsed and embedded without the write lock; each
+        # flush takes it, catches up with other workers' snapshots and diffs
+        # its files against the manifest again before publishing
+        checks = {}
+        for file_path in file_paths:
+            try:
+                check = check_file(file_path, db)
+            except Exception as e:
+                _record_failure(job, file_path, e, db)
+                continue
+            if check is None:
+                job.processed_files += 1
+            else:
+                checks[file_path] = check
+            db.commit()
+
+        # Files sharing content that is already indexed are not parsed
+        pending = [
+            build_update(checks.pop(file_path), [])
+            for file_path in list(checks)
+            if checks[file_path].shared_with is not None
+        ]
+        # Nor are new files with the same content as another new file of this
+        # job; they share its nodes once those are committed
+        owners, followers = {}, []
+        for file_path, check in list(checks.items()):
+            if check.entry is not None:
+                continue
+            owner = owners.setdefault(check.content_hash, file_path)
+            if owner != file_path:
+                check.shared_with = os.path.basename(owner)
+                followers.append(build_update(checks.pop(file_path), []))
+
+        # Documents stream in per file; only the current window of files
+        # and the chunks waiting for the next flush are held in memory
+        pending_chunks = 0
+        for file_path, documents, error in document_loader.load(list(checks)):
+            check = checks.pop(file_path)
+            try:
+                if error is not None:
+                    raise error
+                update = build_update(check, documents)
+            except Exception as e:
+                _record_failure(job, file_path, e, db)
+                continue
+            del documents
+
+            pending.append(update)
+            pending_chunks += len(update.new_nodes)
+            if pending_chunks >= flush_chunks:
+                _flush_updates(job, pending, db)
+                pending, pending_chunks = [], 0
+
+        if pending:
+            _flush_updates(job, pending, db)
+        if followers:
+            _flush_updates(job, followers, db)
+
+        job.status = "failed" if job.failed_files else "completed"
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        job = get_ingestion_job(job_id, db)
+        if job:
+            job.status = "failed"
+            job.error = str(e)
+            db.commit()
+        raise
+    finally:
+        db.close()
@@ -0,0 +1,248 @@
+import heapq
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+_QUERY_BATCH_SIZE = 500
+
+# Words joined by - . / _ (product codes, versions, paths) stay one token, and
+# their parts are indexed as well
+_TOKEN_RE = re.compile(r"\w+(?:[-./]\w+)*")
+_PART_RE = re.compile(r"[-./]")
+
+# Too common to help ranking; dropping them keeps posting lists short
+STOPWORDS = frozenset("""
+    a an and are as at be but by for from has have he her his i if in into is
+    it its me my no not of on or our she so than that the their them then
+    there these they this to was we were what when where which who why will
+    with you your
+    """.split())
+
+
+def tokenize(text: str):
+    """Lower-cased terms of text, stopwords removed"""
+    terms = []
+    for token in _TOKEN_RE.findall(text.casefold()):
+        if token not in STOPWORDS:
+            terms.append(token)
+        if not token.isalnum():
+            parts = _PART_RE.split(token)
+            terms.extend(part for part in parts if part and part not in STOPWORDS)
+    return terms
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60):
+    """
+    Fuse ranked lists of ids by reciprocal rank.
+
+    Returns (id, score) pairs, best first. Scores are divided by the best
+    possible score, so an id ranked first in every list scores 1.0.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    best = len(rankings) / (k + 1)
+    return sorted(
+        ((item, score / best) for item, score in scores.items()),
+        key=lambda pair: pair[1],
+        reverse=True,
+    )
+
+
+class KeywordIndex:
+    """
+    On-disk BM25 inverted index over node text.
+
+    Postings are (term, doc, term frequency) rows in a SQLite table keyed by
+    term, with nodes mapped to small integer doc ids, so a query reads only
+    the posting lists of its own terms. Nodes are added and removed
+    incrementally as the vector index changes. Searches use their own
+    connection, so under WAL they never wait for an ingestion write.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+
+        self._lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._conn = None
+        self._reader = None
+        self._open()
+
+    def add_nodes(self, nodes):
+        """Index the text of nodes, replacing any earlier version of them"""
+        if not nodes:
+            return
+        rows = [(node.node_id, Counter(tokenize(node.get_content()))) for node in nodes]
+        with self._lock:
+            self._delete([node_id for node_id, _ in rows])
+            postings = []
+            for node_id, counts in rows:
+                length = sum(counts.values())
+                cursor = self._conn.execute(
+                    "INSERT INTO docs (node_id, length) VALUES (?, ?)",
+                    (node_id, length),
+                )
+                doc = cursor.lastrowid
+                postings.extend((term, doc, tf) for term, tf in counts.items())
+                self._doc_count += 1
+                self._total_length += length
+            # Inserting in key order keeps B-tree page writes sequential
+            postings.sort()
+            self._conn.executemany(
+                "INSERT INTO postings (term, doc, tf) VALUES (?, ?, ?)", postings
+            )
+            self._conn.commit()
+
+    def delete_nodes(self, node_ids):
+        """Remove nodes from the index"""
+        if not node_ids:
+            return
+        with self._lock:
+            self._delete(list(node_ids))
+            self._conn.commit()
+
+    def search(self, query: str, top_k: int = 10):
+        """Return (node_id, BM25 score) pairs for the best top_k nodes"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or top_k <= 0:
+            return []
+
+        scores = {}
+        with self._read_lock:
+            # Counters of the last write; a search racing an insert may see
+            # them a batch ahead of its snapshot, which only nudges idf
+            doc_count, total_length = self._doc_count, self._total_length
+            if not doc_count:
+                return []
+            avg_length = total_length / doc_count
+            for term in terms:
+                postings = self._reader.execute(
+                    "SELECT p.doc, p.tf, d.length FROM postings p "
+                    "JOIN docs d ON d.doc = p.doc WHERE p.term = ?",
+                    (term,),
+                ).fetchall()
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (max(doc_count - df, 0) + 0.5) / (df + 0.5))
+                for doc, tf, length in postings:
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    score = idf * tf * (self.k1 + 1) / (tf + norm)
+                    scores[doc] = scores.get(doc, 0.0) + score
+
+            best = heapq.nlargest(top_k, scores.items(), key=lambda pair: pair[1])
+            if not best:
+                return []
+            placeholders = ",".join("?" * len(best))
+            node_ids = dict(
+                self._reader.execute(
+                    f"SELECT doc, node_id FROM docs WHERE doc IN ({placeholders})",
+                    [doc for doc, _ in best],
+                ).fetchall()
+            )
+        # A node deleted since its postings were read is dropped
+        return [(node_ids[doc], score) for doc, score in best if doc in node_ids]
+
+    def doc_count(self):
+        """Number of indexed nodes"""
+        return self._doc_count
+
+    def reset(self):
+        """Drop every posting"""
+        # Emptied in place: other worker processes keep the file open
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM docs")
+            self._conn.commit()
+            self._doc_count, self._total_length = 0, 0
+
+    def refresh(self):
+        """Re-read the corpus counters after another process changed the index"""
+        with self._lock:
+            self._read_counters()
+
+    def stats(self):
+        """Node, term and posting counts"""
+        with self._read_lock:
+            (terms,) = self._reader.execute(
+                "SELECT COUNT(DISTINCT term) FROM postings"
+            ).fetchone()
+            (postings,) = self._reader.execute(
+                "SELECT COUNT(*) FROM postings"
+            ).fetchone()
+        return {
+            "nodes": self._doc_count,
+            "terms": terms,
+            "postings": postings,
+            "size_bytes": (
+                os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            ),
+        }
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS docs (
+                doc INTEGER PRIMARY KEY,
+                node_id TEXT NOT NULL UNIQUE,
+                length INTEGER NOT NULL
+            )
+            """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, doc)
+            ) WITHOUT ROWID
+            """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_postings_doc ON postings (doc)"
+        )
+        self._conn.commit()
+
+        self._read_counters()
+        self._reader = sqlite3.connect(self.path, check_same_thread=False)
+
+    def _read_counters(self):
+        self._doc_count, self._total_length = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs"
+        ).fetchone()
+
+    def _delete(self, node_ids):
+        for start in range(0, len(node_ids), _QUERY_BATCH_SIZE):
+            batch = node_ids[start : start + _QUERY_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            docs = self._conn.execute(
+                f"SELECT doc, length FROM docs WHERE node_id IN ({placeholders})",
+                batch,
+            ).fetchall()
+            if not docs:
+                continue
+            doc_placeholders = ",".join("?" * len(docs))
+            doc_ids = [doc for doc, _ in docs]
+            self._conn.execute(
+                f"DELETE FROM postings WHERE doc IN ({doc_placeholders})", doc_ids
+            )
+            self._conn.execute(
+                f"DELETE FROM docs WHERE doc IN ({doc_placeholders})", doc_ids
+            )
+            self._doc_count -= len(docs)
+            self._total_length -= sum(length for _, length in docs)
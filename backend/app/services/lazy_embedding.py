@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, List
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+# SentenceTransformer.encode takes prompt_name from this release on
+_PROMPT_NAME_VERSION = (2, 4)
+
+
+def _encode_queries(model: BaseEmbedding, queries: List[str]):
+    """
+    Query vectors from one SentenceTransformer.encode call, as
+    HuggingFaceEmbedding computes them one at a time; None when the model is
+    not backed by a SentenceTransformer that takes prompt names.
+    """
+    encoder = getattr(model, "_model", None)
+    if not hasattr(encoder, "encode") or not hasattr(model, "normalize"):
+        return None
+    try:
+        import sentence_transformers
+    except ImportError:
+        return None
+    try:
+        version = tuple(
+            int(part) for part in sentence_transformers.__version__.split(".")[:2]
+        )
+    except ValueError:
+        return None
+    if version < _PROMPT_NAME_VERSION:
+        return None
+
+    prompts = getattr(encoder, "prompts", None) or {}
+    vectors = encoder.encode(
+        queries,
+        batch_size=model.embed_batch_size,
+        prompt_name="query" if "query" in prompts else None,
+        normalize_embeddings=model.normalize,
+    )
+    return vectors.tolist()
+
+
+class LazyEmbedding(BaseEmbedding):
+    """
+    Embedding model built by factory on first use.
+
+    Importing the service or loading an index only needs the model's name;
+    the weights are loaded by load(), normally from the startup warm-up, or
+    by the first call that embeds something. Batches are split as the
+    wrapped model would split them.
+    """
+
+    _factory: Callable[[], BaseEmbedding] = PrivateAttr()
+    _model: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr()
+    _load_seconds: float = PrivateAttr(default=None)
+
+    def __init__(self, factory: Callable[[], BaseEmbedding], **kwargs: Any):
+        super().__init__(**kwargs)
+        self._factory = factory
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LazyEmbedding"
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def load_seconds(self):
+        """Seconds the model took to load, None until it is loaded"""
+        return self._load_seconds
+
+    def load(self) -> BaseEmbedding:
+        """Build the wrapped model if that has not happened yet"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    model = self._factory()
+                    self._load_seconds = time.perf_counter() - started
+                    self.embed_batch_size = model.embed_batch_size
+                    self._model = model
+                    logger.info(
+                        "Loaded embedding model %s in %.2fs",
+                        self.model_name,
+                        self._load_seconds,
+                    )
+        return self._model
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self.load()._get_query_embedding(query)
+
+    def get_query_embedding_batch(self, queries: List[str]) -> List[List[float]]:
+        """Embed several queries in one forward pass where the model allows it"""
+        model = self.load()
+        batch = getattr(model, "get_query_embedding_batch", None)
+        if batch is not None:
+            return batch(queries)
+        vectors = _encode_queries(model, queries)
+        if vectors is not None:
+            return vectors
+        return [model.get_query_embedding(query) for query in queries]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self.load()._aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self.load()._get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return await self.load()._aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self.load()._get_text_embeddings(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await self.load()._aget_text_embeddings(texts)
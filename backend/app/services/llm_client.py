@@ -0,0 +1,360 @@
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any
+
+import httpx
+from app.core.metrics import observe_stage
+from app.services.llm_standin import StandInGenerator
+from llama_index.core.base.llms.types import (
+    CompletionResponse,
+    CompletionResponseGen,
+    LLMMetadata,
+)
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.llms.custom import CustomLLM
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth retrying: throttling, a model still loading, gateway errors
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class LLMClientError(Exception):
+    """An LLM call failed and will not be retried"""
+
+
+class LLMDeadlineExceeded(LLMClientError):
+    """An LLM call did not finish before its deadline"""
+
+
+class _Retryable(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMClient:
+    """
+    Base class for text-generation backends.
+
+    Every call holds one of max_concurrency slots and must finish within
+    deadline_seconds, including time spent waiting for a slot. Subclasses
+    implement one attempt of a call; the base class counts calls, failures
+    and time.
+    """
+
+    def __init__(self, max_concurrency: int = 8, deadline_seconds: float = 120):
+        self.max_concurrency = max_concurrency
+        self.deadline_seconds = deadline_seconds
+        self.calls = 0
+        self.failures = 0
+        self.deadline_exceeded = 0
+        self.retries = 0
+        self.seconds = 0.0
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt: str, max_new_tokens: int) -> str:
+        """Complete prompt and return the generated text"""
+        deadline = time.monotonic() + self.deadline_seconds
+        self._acquire(deadline)
+        started = time.perf_counter()
+        try:
+            return self._generate(prompt, max_new_tokens, deadline)
+        except Exception as e:
+            self._record_failure(e)
+            raise
+        finally:
+            self._release(started)
+
+    def stream(self, prompt: str, max_new_tokens: int):
+        """Complete prompt, yielding text as it is generated"""
+        deadline = time.monotonic() + self.deadline_seconds
+        self._acquire(deadline)
+        started = time.perf_counter()
+        try:
+            for token in self._stream(prompt, max_new_tokens, deadline):
+                if time.monotonic() > deadline:
+                    raise LLMDeadlineExceeded("LLM stream exceeded its deadline")
+                yield token
+        except Exception as e:
+            self._record_failure(e)
+            raise
+        finally:
+            self._release(started)
+
+    def stats(self):
+        """Call counters and the concurrency limit"""
+        with self._lock:
+            return {
+                "backend": type(self).__name__,
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+                "deadline_exceeded": self.deadline_exceeded,
+                "seconds": round(self.seconds, 4),
+            }
+
+    def close(self):
+        """Release pooled connections"""
+
+    def _acquire(self, deadline):
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            self._record_failure(LLMDeadlineExceeded())
+            raise LLMDeadlineExceeded("Timed out waiting for an LLM slot")
+        with self._lock:
+            self._in_flight += 1
+
+    def _release(self, started):
+        self._record_call(started)
+        self._slots.release()
+
+    def _record_call(self, started):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._in_flight -= 1
+            self.calls += 1
+            self.seconds += elapsed
+        observe_stage("llm", elapsed)
+
+    def _record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            if isinstance(error, LLMDeadlineExceeded):
+                self.deadline_exceeded += 1
+
+    def _generate(self, prompt, max_new_tokens, deadline):
+        raise NotImplementedError
+
+    def _stream(self, prompt, max_new_tokens, deadline):
+        raise NotImplementedError
+
+
+class HTTPInferenceClient(LLMClient):
+    """
+    Client for the Hugging Face text-generation inference API.
+
+    Calls go through pooled keep-alive connections, at most
+    max_connections of them. Each attempt times out after timeout_seconds
+    (or the remaining deadline); timeouts, transport errors and
+    RETRY_STATUSES are retried up to max_retries times with exponential
+    backoff and full jitter, honouring Retry-After. A stream is only retried
+    until its first token arrives.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        token: str = None,
+        timeout_seconds: float = 60,
+        deadline_seconds: float = 120,
+        max_retries: int = 3,
+        backoff_seconds: float = 0.5,
+        max_backoff_seconds: float = 8,
+        max_connections: int = 16,
+        max_concurrency: int = 8,
+        parameters: dict = None,
+    ):
+        super().__init__(
+            max_concurrency=max_concurrency, deadline_seconds=deadline_seconds
+        )
+        self.url = url
+        self.timeout_seconds = timeout_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.parameters = parameters or {}
+
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        )
+        self._client = httpx.Client(headers=headers, limits=limits)
+
+    def close(self):
+        self._client.close()
+
+    def _payload(self, prompt, max_new_tokens, stream):
+        return {
+            "inputs": prompt,
+            "parameters": {
+                "max_new_tokens": max_new_tokens,
+                "return_full_text": False,
+                **self.parameters,
+            },
+            "stream": stream,
+        }
+
+    def _attempt_timeout(self, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMDeadlineExceeded("LLM call exceeded its deadline")
+        return httpx.Timeout(min(self.timeout_seconds, remaining))
+
+    def _backoff(self, attempt, retry_after, deadline):
+        """Delay before the next attempt, or None when it would miss the deadline"""
+        delay = random.uniform(
+            0, min(self.max_backoff_seconds, self.backoff_seconds * 2**attempt)
+        )
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def _check(self, response: httpx.Response):
+        if response.status_code == 200:
+            return
+        if response.status_code in RETRY_STATUSES:
+            retry_after = response.headers.get("Retry-After")
+            raise _Retryable(
+                f"HTTP {response.status_code}",
+                float(retry_after) if retry_after and retry_after.isdigit() else None,
+            )
+        raise LLMClientError(f"HTTP {response.status_code}: {response.text[:500]}")
+
+    def _with_retries(self, attempt_fn, deadline):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return attempt_fn(self._attempt_timeout(deadline))
+            except (_Retryable, httpx.TimeoutException, httpx.TransportError) as e:
+                delay = None
+                if attempt < self.max_retries:
+                    delay = self._backoff(
+                        attempt, getattr(e, "retry_after", None), deadline
+                    )
+                if delay is None:
+                    if isinstance(e, httpx.TimeoutException):
+                        raise LLMDeadlineExceeded(f"LLM call timed out: {e}") from e
+                    raise LLMClientError(f"LLM call failed: {e}") from e
+                logger.warning("LLM call failed (%s), retrying in %.2fs", e, delay)
+                with self._lock:
+                    self.retries += 1
+                time.sleep(delay)
+
+    def _generate(self, prompt, max_new_tokens, deadline):
+        payload = self._payload(prompt, max_new_tokens, stream=False)
+
+        def attempt(timeout):
+            response = self._client.post(self.url, json=payload, timeout=timeout)
+            self._check(response)
+            return response.json()
+
+        return _generated_text(self._with_retries(attempt, deadline))
+
+    def _stream(self, prompt, max_new_tokens, deadline):
+        payload = self._payload(prompt, max_new_tokens, stream=True)
+
+        def attempt(timeout):
+            request = self._client.build_request(
+                "POST", self.url, json=payload, timeout=timeout
+            )
+            response = self._client.send(request, stream=True)
+            if response.status_code != 200:
+                response.read()
+                response.close()
+            self._check(response)
+            return response
+
+        response = self._with_retries(attempt, deadline)
+        try:
+            for line in response.iter_lines():
+                token = _stream_token(line)
+                if token:
+                    yield token
+        finally:
+            response.close()
+
+
+def _generated_text(body) -> str:
+    if isinstance(body, list):
+        body = body[0] if body else {}
+    return body.get("generated_text", "")
+
+
+def _stream_token(line: str):
+    """Text of one server-sent token event, None for anything else"""
+    if not line.startswith("data:"):
+        return None
+    data = line[len("data:") :].strip()
+    if not data or data == "[DONE]":
+        return None
+    token = json.loads(data).get("token") or {}
+    if token.get("special"):
+        return None
+    return token.get("text")
+
+
+class StandInClient(LLMClient):
+    """
+    Local deterministic backend with configurable latency, for measuring
+    throughput and tail latency offline. Shares the concurrency limit and
+    deadline handling of the real clients.
+    """
+
+    def __init__(self, generator: StandInGenerator, **kwargs):
+        super().__init__(**kwargs)
+        self.generator = generator
+
+    def _generate(self, prompt, max_new_tokens, deadline):
+        return self.generator.generate(prompt, max_new_tokens)
+
+    def _stream(self, prompt, max_new_tokens, deadline):
+        return self.generator.stream(prompt, max_new_tokens)
+
+
+class ClientLLM(CustomLLM):
+    """llama-index completion LLM backed by an LLMClient"""
+
+    model_name: str = "unknown"
+    context_window: int = 3900
+    num_output: int = 256
+
+    _client: Any = PrivateAttr()
+
+    def __init__(self, client: LLMClient, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._client = client
+
+    @property
+    def client(self) -> LLMClient:
+        return self._client
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            context_window=self.context_window,
+            num_output=self.num_output,
+            model_name=self.model_name,
+        )
+
+    @llm_completion_callback()
+    def complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        return CompletionResponse(text=self._client.generate(prompt, self.num_output))
+
+    @llm_completion_callback()
+    def stream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseGen:
+        def gen() -> CompletionResponseGen:
+            text = ""
+            for token in self._client.stream(prompt, self.num_output):
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+
+        return gen()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "client_llm"
@@ -0,0 +1,133 @@
+"""
+Deterministic stand-in for the text-generation inference API.
+
+The same prompt always produces the same answer after a configurable delay,
+so throughput and tail latency can be measured without network access or a
+model. StandInGenerator backs the in-process "standin" LLM backend; run this
+module to serve the same answers over HTTP, in the wire format the "http"
+backend speaks:
+
+    python -m app.services.llm_standin --port 8081 --latency-ms 300
+
+then set LLM_BACKEND=http and LLM_API_URL=http://localhost:8081/models/{model}.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+
+_VOCABULARY = (
+    "the document states that this answer is derived from retrieved context "
+    "and summarizes relevant passages about the requested topic with detail"
+).split()
+
+
+class StandInGenerator:
+    """
+    Produces a deterministic answer for a prompt.
+
+    A call waits latency_ms, plus up to jitter_ms drawn from a generator
+    seeded by the prompt, before the first token; tokens then arrive at
+    tokens_per_second (0 sends them all at once). Answers hold at most
+    response_tokens words, each followed by a space.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 200,
+        jitter_ms: float = 0,
+        tokens_per_second: float = 0,
+        response_tokens: int = 32,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+
+    def plan(self, prompt: str, max_new_tokens: int = None):
+        """(first token delay in seconds, per-token delay, tokens) for prompt"""
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        rng = random.Random(int.from_bytes(digest[:8], "big"))
+        count = self.response_tokens
+        if max_new_tokens:
+            count = min(count, max_new_tokens)
+        tokens = [f"{rng.choice(_VOCABULARY)} " for _ in range(count)]
+        first_delay = (self.latency_ms + rng.uniform(0, self.jitter_ms)) / 1000
+        token_delay = 1 / self.tokens_per_second if self.tokens_per_second else 0
+        return first_delay, token_delay, tokens
+
+    def generate(self, prompt: str, max_new_tokens: int = None) -> str:
+        return "".join(self.stream(prompt, max_new_tokens))
+
+    def stream(self, prompt: str, max_new_tokens: int = None):
+        first_delay, token_delay, tokens = self.plan(prompt, max_new_tokens)
+        time.sleep(first_delay)
+        for index, token in enumerate(tokens):
+            if index and token_delay:
+                time.sleep(token_delay)
+            yield token
+
+    async def agenerate(self, prompt: str, max_new_tokens: int = None) -> str:
+        tokens = [token async for token in self.astream(prompt, max_new_tokens)]
+        return "".join(tokens)
+
+    async def astream(self, prompt: str, max_new_tokens: int = None):
+        first_delay, token_delay, tokens = self.plan(prompt, max_new_tokens)
+        await asyncio.sleep(first_delay)
+        for index, token in enumerate(tokens):
+            if index and token_delay:
+                await asyncio.sleep(token_delay)
+            yield token
+
+
+def create_app(generator: StandInGenerator):
+    """FastAPI app answering POST /models/{model} like the inference API"""
+    from fastapi import FastAPI, Request
+    from fastapi.responses import StreamingResponse
+
+    app = FastAPI()
+
+    @app.post("/models/{model:path}")
+    async def generate(model: str, request: Request):
+        body = await request.json()
+        prompt = body.get("inputs", "")
+        max_new_tokens = body.get("parameters", {}).get("max_new_tokens")
+        if not body.get("stream"):
+            text = await generator.agenerate(prompt, max_new_tokens)
+            return [{"generated_text": text}]
+
+        async def events():
+            async for token in generator.astream(prompt, max_new_tokens):
+                yield f"data:{json.dumps({'token': {'text': token}})}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--tokens-per-second", type=float, default=0)
+    parser.add_argument("--response-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    generator = StandInGenerator(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+    )
+    uvicorn.run(create_app(generator), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(query_text: str) -> str:
+    """Case-fold and collapse whitespace so trivial variants share an entry"""
+    return " ".join(query_text.casefold().split())
+
+
+class QueryCache:
+    """
+    In-memory LRU cache of query results.
+
+    Entries are keyed by normalized query text, an optional variant (e.g. the
+    synthesis mode) and the index version they were computed against. Seeing
+    a newer version drops every older entry, and a result computed against an
+    older version is never stored, so an answer is only served while the
+    corpus it came from is unchanged. Entries also expire after ttl_seconds.
+    max_entries=0 disables the cache.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, query_text: str, version: int, variant=None):
+        """Cached result for the query at this index version, or None"""
+        if not self.max_entries:
+            return None
+        key = (variant, normalize_query(query_text))
+        now = time.monotonic()
+        with self._lock:
+            self._sync_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, query_text: str, version: int, result, variant=None):
+        """Store a result computed against the given index version"""
+        if not self.max_entries or result is None:
+            return
+        key = (variant, normalize_query(query_text))
+        with self._lock:
+            if self._version is not None and version < self._version:
+                # The corpus changed while this result was being computed
+                return
+            self._sync_version(version)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Entry count and hit/miss counters"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "version": self._version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _sync_version(self, version: int):
+        if self._version is None or version > self._version:
+            self._entries.clear()
+            self._version = version
@@ -0,0 +1,140 @@
+import threading
+import time
+
+
+def embed_queries(embed_model, queries):
+    """
+    Query vectors for several queries, in one forward pass when the model
+    supports it.
+    """
+    batch = getattr(embed_model, "get_query_embedding_batch", None)
+    if batch is not None:
+        return batch(queries)
+    return [embed_model.get_query_embedding(query) for query in queries]
+
+
+class _PendingQuery:
+    __slots__ = ("query", "wake", "vector", "error", "done")
+
+    def __init__(self, query):
+        self.query = query
+        self.wake = threading.Event()
+        self.vector = None
+        self.error = None
+        self.done = False
+
+
+class QueryEmbeddingBatcher:
+    """
+    Embeds the questions of concurrent queries together.
+
+    Callers block in embed(). The first caller to arrive while no batch is
+    being gathered leads: it waits up to max_wait_ms for more questions, or
+    until max_batch_size are queued, embeds them in one forward pass and
+    hands every caller its vector. Questions arriving while a batch runs
+    queue up, and the first of them leads the next batch, so under load
+    batches fill by themselves. The leader only waits when the previous
+    batch had company, so a lone query on an idle server is embedded at
+    once. max_batch_size <= 1 embeds every question on its own.
+    """
+
+    def __init__(self, embed_model, max_batch_size: int = 32, max_wait_ms: float = 2):
+        self.embed_model = embed_model
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self.queries = 0
+        self.batches = 0
+        self.largest_batch = 0
+        self.embed_seconds = 0.0
+
+        self._queue = []
+        self._leading = False
+        self._last_batch_size = 0
+        self._condition = threading.Condition()
+        self._stats_lock = threading.Lock()
+
+    def embed(self, query: str):
+        """Vector of one question, embedded with whatever else is waiting"""
+        if self.max_batch_size <= 1:
+            return self._run([query])[0]
+
+        pending = _PendingQuery(query)
+        with self._condition:
+            self._queue.append(pending)
+            lead = not self._leading
+            self._leading = True
+            # A leader gathering its batch may now have enough
+            self._condition.notify_all()
+
+        if not lead:
+            pending.wake.wait()
+        while not pending.done:
+            # Woken without a result: this caller leads the next batch
+            pending.wake.clear()
+            self._lead()
+            if not pending.done:
+                pending.wake.wait()
+
+        if pending.error is not None:
+            raise pending.error
+        return pending.vector
+
+    def stats(self):
+        """Batch settings and how full batches have been"""
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "queries": self.queries,
+                "batches": self.batches,
+                "mean_batch_size": (
+                    round(self.queries / self.batches, 2) if self.batches else 0.0
+                ),
+                "largest_batch": self.largest_batch,
+                "embed_seconds": round(self.embed_seconds, 4),
+            }
+
+    def _lead(self):
+        with self._condition:
+            deadline = time.monotonic() + self.max_wait_ms / 1000
+            # Waiting only pays off when other queries are likely to arrive
+            gather = self._last_batch_size > 1 or len(self._queue) > 1
+            while gather and len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._queue[: self.max_batch_size]
+            del self._queue[: self.max_batch_size]
+            self._last_batch_size = len(batch)
+
+        try:
+            vectors = self._run([pending.query for pending in batch])
+        except Exception as e:
+            for pending in batch:
+                pending.error = e
+        else:
+            for pending, vector in zip(batch, vectors):
+                pending.vector = vector
+
+        with self._condition:
+            if self._queue:
+                # Promote the oldest waiting caller to lead the next batch
+                self._queue[0].wake.set()
+            else:
+                self._leading = False
+        for pending in batch:
+            pending.done = True
+            pending.wake.set()
+
+    def _run(self, queries):
+        started = time.perf_counter()
+        vectors = embed_queries(self.embed_model, queries)
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self.queries += len(queries)
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, len(queries))
+            self.embed_seconds += elapsed
+        return vectors
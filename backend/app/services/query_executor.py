@@ -0,0 +1,78 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+_STREAM_END = object()
+
+
+class QueryExecutor:
+    """
+    Runs the blocking stages of a query off the event loop.
+
+    Work goes to a pool of max_workers threads, which caps how many queries
+    embed, retrieve and call the LLM at once. A coalesced call whose key is
+    already in flight awaits the running computation instead of starting
+    another one. Work runs in a copy of the caller's context, so per-request
+    state such as stage timings follows it onto the pool.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self.executed = 0
+        self.coalesced = 0
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="rag-query"
+        )
+        # Only touched from the event loop thread, so no lock is needed
+        self._in_flight = {}
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on the pool and return its result"""
+        self.executed += 1
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, context.run, fn, *args)
+
+    async def run_coalesced(self, key, fn, *args):
+        """
+        Like run, but callers passing the same key while the first call is
+        still running share its result (or exception).
+        """
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            self.executed += 1
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            future = loop.run_in_executor(self._executor, context.run, fn, *args)
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # A cancelled caller must not cancel the computation others await
+        return await asyncio.shield(future)
+
+    async def iterate(self, iterator):
+        """Drain a blocking iterator on the pool, one item at a time"""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        while True:
+            item = await loop.run_in_executor(
+                self._executor, context.run, next, iterator, _STREAM_END
+            )
+            if item is _STREAM_END:
+                return
+            yield item
+
+    def stats(self):
+        """Concurrency limit and execution counters"""
+        return {
+            "max_workers": self.max_workers,
+            "in_flight": len(self._in_flight),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+        }
+
+    def shutdown(self):
+        """Stop the worker threads once queued work has finished"""
+        self._executor.shutdown(wait=True)
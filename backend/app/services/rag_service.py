@@ -1,256 +1,632 @@
 import hashlib
-import json
+import logging
 import os
-import shutil
-from datetime import datetime
-
-from app.db.models import UploadedFile
+import tempfile
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.db.models import FileBlob, IngestionManifest, UploadedFile
+from app.services.blob_store import BlobStore, blob_extension
+from app.services.context_packer import ContextPacker, count_tokens
+from app.services.embedding_cache import EmbeddingCache
+from app.services.embedding_standin import StandInEmbedding
+from app.services.embedding_workers import BatchedEmbedder
+from app.services.index_manager import IndexManager
+from app.services.keyword_index import KeywordIndex
+from app.services.lazy_embedding import LazyEmbedding
+from app.services.llm_client import ClientLLM, HTTPInferenceClient, StandInClient
+from app.services.llm_standin import StandInGenerator
+from app.services.query_cache import QueryCache, normalize_query
+from app.services.query_embedder import QueryEmbeddingBatcher
+from app.services.query_executor import QueryExecutor
 from dotenv import load_dotenv
-from llama_index.core import (
-    StorageContext,
-    VectorStoreIndex,
-    get_response_synthesizer,
-    load_index_from_storage,
-)
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.llms.huggingface import HuggingFaceInferenceAPI
+from llama_index.core.base.response.schema import Response
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Retrieve necessary environment variables
 HF_TOKEN = os.getenv("HF_TOKEN")
 LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME")
 EMBED_MODEL_NAME = os.getenv("EMBED_MODEL_NAME")
 DATA_PATH = os.getenv("DATA_PATH")
 STORAGE_PATH = os.getenv("STORAGE_PATH")
-METADATA_PATH = os.path.join(STORAGE_PATH, "processed_files.json")
 
-# Initialize language and embedding models
-llm = HuggingFaceInferenceAPI(model_name=LLM_MODEL_NAME, token=HF_TOKEN)
-embed_model = HuggingFaceEmbedding(model_name=EMBED_MODEL_NAME)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Prompt tokens besides the retrieved context: the QA template, the question
+# and the metadata printed with each chunk
+PROMPT_RESERVE_TOKENS = 512
+
+# Uploads are stored once per distinct content under DATA_PATH/blobs
+blob_store = BlobStore(os.path.join(DATA_PATH, "blobs"))
+
+# Pooled, retrying LLM client shared by every query, and the llama-index LLM
+# on top of it
+if settings.LLM_BACKEND == "standin":
+    llm_client = StandInClient(
+        StandInGenerator(
+            latency_ms=settings.STANDIN_LATENCY_MS,
+            jitter_ms=settings.STANDIN_JITTER_MS,
+            tokens_per_second=settings.STANDIN_TOKENS_PER_SECOND,
+            response_tokens=settings.LLM_MAX_NEW_TOKENS,
+        ),
+        max_concurrency=settings.LLM_MAX_CONCURRENCY,
+        deadline_seconds=settings.LLM_DEADLINE_SECONDS,
+    )
+elif settings.LLM_BACKEND == "http":
+    llm_client = HTTPInferenceClient(
+        settings.LLM_API_URL.format(model=LLM_MODEL_NAME),
+        token=HF_TOKEN,
+        timeout_seconds=settings.LLM_TIMEOUT_SECONDS,
+        deadline_seconds=settings.LLM_DEADLINE_SECONDS,
+        max_retries=settings.LLM_MAX_RETRIES,
+        backoff_seconds=settings.LLM_RETRY_BACKOFF_SECONDS,
+        max_connections=settings.LLM_MAX_CONNECTIONS,
+        max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    )
+else:
+    raise ValueError(f"Unsupported LLM backend: {settings.LLM_BACKEND}")
+llm = ClientLLM(
+    llm_client,
+    model_name=LLM_MODEL_NAME,
+    context_window=settings.LLM_CONTEXT_WINDOW,
+    num_output=settings.LLM_MAX_NEW_TOKENS,
+)
 
+# Initialize the embedding model
+if settings.EMBED_BACKEND == "standin":
+    embed_model = StandInEmbedding(
+        model_name=f"standin-{settings.STANDIN_EMBED_DIM}",
+        dim=settings.STANDIN_EMBED_DIM,
+        latency_ms=settings.STANDIN_EMBED_LATENCY_MS,
+    )
+    # Keeps manifest entries and cached vectors apart from the real model's
+    EMBED_MODEL_NAME = embed_model.model_name
+elif settings.EMBED_BACKEND == "huggingface":
 
-def save_uploaded_file(file, db: Session):
-    """
-    Save an uploaded file to the specified data path and store its metadata in the database.
-    """
-    os.makedirs(DATA_PATH, exist_ok=True)
-    file_path = os.path.join(DATA_PATH, file.filename)
+    def _load_huggingface_embedding():
+        # torch and transformers are imported with the model, not the service
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 
-    # Check if the file already exists in the database
-    existing_file = db.query(UploadedFile).filter_by(filename=file.filename).first()
-    if existing_file:
-        return None
+        return HuggingFaceEmbedding(model_name=EMBED_MODEL_NAME)
 
-    # Save the uploaded file to disk
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Loaded by the startup warm-up or the first embedding, not on import
+    embed_model = LazyEmbedding(
+        _load_huggingface_embedding, model_name=EMBED_MODEL_NAME
+    )
+else:
+    raise ValueError(f"Unsupported embedding backend: {settings.EMBED_BACKEND}")
+
+# Persistent embedding cache shared by every ingestion path
+embedding_cache = EmbeddingCache(
+    settings.EMBEDDING_CACHE_PATH,
+    EMBED_MODEL_NAME,
+    max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+)
 
-    # Store file metadata in the database
-    db_file = UploadedFile(filename=file.filename, filepath=file_path)
-    db.add(db_file)
-    db.commit()
-    db.refresh(db_file)
+# Batched, optionally multi-process embedding stage for bulk ingestion
+embedder = BatchedEmbedder(
+    embed_model,
+    EMBED_MODEL_NAME,
+    # Worker processes load EMBED_MODEL_NAME from HuggingFace
+    workers=(settings.EMBED_WORKERS if settings.EMBED_BACKEND == "huggingface" else 0),
+    batch_size=settings.EMBED_BATCH_SIZE,
+    threads_per_worker=settings.EMBED_THREADS_PER_WORKER,
+)
 
-    return {"filename": file.filename, "path": file_path}
+# BM25 postings over node text, kept next to the index it describes
+keyword_index = KeywordIndex(os.path.join(STORAGE_PATH, "keyword_index.sqlite3"))
+
+# Trims retrieved context to a prompt token budget before synthesis. Context
+# that does not fit the LLM's window is split over several calls by compact
+# synthesis, so by default the budget is what the window leaves free.
+context_room = max(
+    1, settings.LLM_CONTEXT_WINDOW - settings.LLM_MAX_NEW_TOKENS - PROMPT_RESERVE_TOKENS
+)
+context_token_budget = settings.CONTEXT_TOKEN_BUDGET
+if context_token_budget < 0:
+    context_token_budget = context_room
+elif context_token_budget > context_room:
+    logger.warning(
+        "CONTEXT_TOKEN_BUDGET=%d exceeds the %d tokens LLM_CONTEXT_WINDOW leaves "
+        "for context; answers may take several LLM calls",
+        context_token_budget,
+        context_room,
+    )
+context_packer = ContextPacker(
+    token_budget=context_token_budget,
+    duplicate_threshold=settings.CONTEXT_DUPLICATE_THRESHOLD,
+    merge_adjacent=settings.CONTEXT_MERGE_ADJACENT,
+)
 
+# Embeds the questions of concurrent queries in one forward pass
+query_embedder = QueryEmbeddingBatcher(
+    embed_model,
+    max_batch_size=settings.QUERY_EMBED_MAX_BATCH_SIZE,
+    max_wait_ms=settings.QUERY_EMBED_MAX_WAIT_MS,
+)
 
-def delete_all_files(db: Session):
+# Shared index, loaded once at startup, updated in place by ingestion and
+# published as snapshots that the other workers pick up
+index_manager = IndexManager(
+    STORAGE_PATH,
+    embed_model,
+    llm,
+    embedding_cache=embedding_cache,
+    embedder=embedder,
+    vector_store_backend=settings.VECTOR_STORE_BACKEND,
+    vector_store_options={
+        "index_type": settings.VECTOR_INDEX,
+        "ivf_nlist": settings.IVF_NLIST,
+        "ivf_nprobe": settings.IVF_NPROBE,
+        "vector_dtype": settings.VECTOR_DTYPE,
+        "rescore_factor": settings.VECTOR_RESCORE_FACTOR,
+    },
+    keyword_index=keyword_index,
+    retrieval_mode=settings.RETRIEVAL_MODE,
+    keyword_top_k=settings.KEYWORD_TOP_K,
+    rrf_k=settings.RRF_K,
+    context_packer=context_packer,
+    synthesis_mode=settings.SYNTHESIS_MODE,
+    synthesis_concurrency=settings.SYNTHESIS_CONCURRENCY,
+    query_embedder=query_embedder,
+    snapshot_keep=settings.INDEX_SNAPSHOT_KEEP,
+    poll_seconds=settings.INDEX_POLL_SECONDS,
+)
+
+# Answers keyed by normalized query text and index_manager.version
+query_cache = QueryCache(
+    max_entries=settings.QUERY_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.QUERY_CACHE_TTL_SECONDS,
+)
+
+# Bounded pool for the blocking stages of request-time queries
+query_executor = QueryExecutor(max_workers=settings.QUERY_CONCURRENCY)
+
+
+# Counters and gauges read from the components' own statistics whenever
+# /metrics is scraped
+_COUNTERS = {
+    "rag_query_cache_hits_total": (
+        "Queries answered from the query cache",
+        lambda: query_cache.hits,
+    ),
+    "rag_query_cache_misses_total": (
+        "Query cache lookups that missed",
+        lambda: query_cache.misses,
+    ),
+    "rag_embedding_cache_hits_total": (
+        "Chunks whose vector was found in the embedding cache",
+        lambda: embedding_cache.hits,
+    ),
+    "rag_embedding_cache_misses_total": (
+        "Chunks that had to be embedded",
+        lambda: embedding_cache.misses,
+    ),
+    "rag_queries_coalesced_total": (
+        "Queries that shared the answer of an identical query in flight",
+        lambda: query_executor.coalesced,
+    ),
+    "rag_query_embed_batches_total": (
+        "Forward passes that embedded query questions",
+        lambda: query_embedder.batches,
+    ),
+    "rag_query_embed_questions_total": (
+        "Query questions embedded",
+        lambda: query_embedder.queries,
+    ),
+    "rag_index_reloads_total": (
+        "Index snapshots written by another process and loaded here",
+        lambda: index_manager.reloads,
+    ),
+    "rag_llm_calls_total": ("LLM calls made", lambda: llm_client.calls),
+    "rag_llm_retries_total": ("LLM attempts retried", lambda: llm_client.retries),
+    "rag_llm_failures_total": ("LLM calls that failed", lambda: llm_client.failures),
+}
+_GAUGES = {
+    "rag_index_nodes": ("Nodes in the resident index", index_manager.node_count),
+    "rag_index_version": (
+        "Changes applied to the resident index since startup",
+        lambda: index_manager.version,
+    ),
+    "rag_vector_store_bytes": (
+        "Bytes held by the stored vectors",
+        lambda: index_manager.vector_store_stats().get("stored_bytes", 0),
+    ),
+    "rag_keyword_index_nodes": (
+        "Nodes in the keyword index",
+        keyword_index.doc_count,
+    ),
+    "rag_queries_in_flight": (
+        "Distinct queries being answered",
+        lambda: query_executor.stats()["in_flight"],
+    ),
+    "rag_llm_calls_in_flight": (
+        "LLM calls in progress",
+        lambda: llm_client.stats()["in_flight"],
+    ),
+}
+for name, (help, read) in _COUNTERS.items():
+    registry.counter_callback(name, help, read)
+for name, (help, read) in _GAUGES.items():
+    registry.gauge_callback(name, help, read)
+
+
+def find_existing_files(filenames, db: Session):
     """
-    Delete all uploaded files from the system and clear database records.
+    Return the names among filenames that are already uploaded, in one query.
     """
-    files = db.query(UploadedFile).all()
+    rows = (
+        db.query(UploadedFile.filename)
+        .filter(UploadedFile.filename.in_(filenames))
+        .all()
+    )
+    return [row.filename for row in rows]
 
-    # Remove each file from disk if it exists
-    for file in files:
-        if os.path.exists(file.filepath):
-            os.remove(file.filepath)
 
-    # Remove file records from the database
-    db.query(UploadedFile).delete()
-    db.commit()
+def write_upload(source, directory: str):
+    """
+    Copy a file object to a temporary file in directory chunk by chunk,
+    hashing the bytes as they pass through.
 
-    # Remove the entire storage directory (if any files remain)
-    shutil.rmtree(STORAGE_PATH, ignore_errors=True)
-    return {"message": "All files deleted successfully"}
+    Returns (temporary path, size, SHA-256 hex digest).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix="upload-")
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                size += len(chunk)
+                buffer.write(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path, size, digest.hexdigest()
+
+
+async def save_uploaded_files(files, db: Session):
+    """
+    Save uploaded files to the blob store and store their metadata in the
+    database.
 
+    Files are streamed to a temporary directory next to DATA_PATH off the
+    event loop and hashed as they arrive. Content that is already stored only
+    gains a reference. Metadata for the batch is written in one transaction,
+    and new content is moved into the blob store, atomically, once that has
+    been committed.
 
-def save_processed_files(processed_files):
-    """Save the list of processed files"""
-    with open(METADATA_PATH, "w", encoding="utf-8") as f:
-        json.dump(processed_files, f)
+    Returns the saved files and the blob paths that are new and still need
+    to be ingested.
+    """
+    # Under DATA_PATH so the final rename never crosses filesystems; the
+    # directory scan for new files skips subdirectories
+    upload_dir = os.path.join(DATA_PATH, ".uploads")
+    os.makedirs(upload_dir, exist_ok=True)
+
+    received = []
+    try:
+        for file in files:
+            temp_path, size, content_hash = await run_in_threadpool(
+                write_upload, file.file, upload_dir
+            )
+            received.append((file.filename, temp_path, size, content_hash))
+    except BaseException:
+        for _, temp_path, _, _ in received:
+            os.remove(temp_path)
+        raise
 
+    # Queries, blob renames and the commit block, so they run off the loop too
+    return await run_in_threadpool(store_uploads, received, db)
 
-def load_processed_files():
-    """Load the list of processed files"""
-    if os.path.exists(METADATA_PATH):
-        with open(METADATA_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
 
+def store_uploads(received, db: Session):
+    """
+    Record received uploads in one transaction, then move new content into
+    the blob store. received holds (filename, temp_path, size, content_hash).
 
-def load_existing_index():
-    """Load the existing index if it exists"""
-    if os.path.exists(os.path.join(STORAGE_PATH, "docstore.json")):
-        print("Loading vector database from storage...")
-        storage_context = StorageContext.from_defaults(persist_dir=STORAGE_PATH)
-        index = load_index_from_storage(storage_context, embed_model=embed_model)
+    Blobs are only moved into place once their rows are committed, so a
+    failed commit (e.g. a concurrent upload of the same name) leaves no blob
+    that the database does not know about.
+    """
+    hashes = {content_hash for _, _, _, content_hash in received}
+    blobs = {
+        blob.content_hash: blob
+        for blob in db.query(FileBlob).filter(FileBlob.content_hash.in_(hashes))
+    }
+
+    saved, new_paths, moves, duplicates = [], [], [], []
+    for filename, temp_path, size, content_hash in received:
+        blob = blobs.get(content_hash)
+        deduplicated = blob is not None
+        if deduplicated:
+            duplicates.append(temp_path)
+        else:
+            extension = blob_extension(filename)
+            blob = FileBlob(
+                content_hash=content_hash,
+                path=blob_store.path_for(content_hash, extension),
+                size=size,
+                ref_count=0,
+            )
+            db.add(blob)
+            blobs[content_hash] = blob
+            new_paths.append(blob.path)
+            moves.append((temp_path, content_hash, extension))
+        blob.ref_count += 1
+
+        db.add(
+            UploadedFile(
+                filename=filename,
+                filepath=blob.path,
+                content_hash=content_hash,
+                size=size,
+            )
+        )
+        saved.append(
+            {
+                "filename": filename,
+                "path": blob.path,
+                "size": size,
+                "content_hash": content_hash,
+                "deduplicated": deduplicated,
+            }
+        )
 
-        processed_files = load_processed_files()
+    try:
+        db.commit()
+    except BaseException:
+        db.rollback()
+        for temp_path, _, _ in moves:
+            os.remove(temp_path)
+        raise
+    finally:
+        for temp_path in duplicates:
+            os.remove(temp_path)
 
-        print(f"Number of previously processed files: {len(processed_files)}")
+    for temp_path, content_hash, extension in moves:
+        blob_store.put(temp_path, content_hash, extension)
+    return saved, new_paths
 
-        # for file_name, file_info in processed_files.items():
-        #     print(f"   - {file_name} ({file_info.get('nodes_count', 0)} nodes)")
-        return index, processed_files
-    else:
-        print("Vector database is empty, creating a new index!")
-        return None, {}
 
+def release_duplicates(content_hashes, db: Session, keep=()):
+    """
+    Drop the manifest entries of files that shared the nodes of another file
+    with this content, as that file no longer provides them. Entries named in
+    keep are left alone.
 
-def process_new_documents(documents, text_splitter, existing_index, processed_files):
+    Returns the paths of those files, which have to be ingested again.
     """
-    Process new documents and update metadata
+    if not content_hashes:
+        return []
+    entries = db.query(IngestionManifest).filter(
+        IngestionManifest.content_hash.in_(list(content_hashes))
+    )
+    paths = []
+    for entry in entries:
+        if entry.node_ids or entry.filename in keep or entry in db.deleted:
+            continue
+        db.delete(entry)
+        if os.path.exists(entry.filepath):
+            paths.append(entry.filepath)
+    return paths
+
+
+def delete_uploaded_files(filenames, db: Session):
+    """
+    Delete the given files and remove only their nodes from the live index.
+
+    A shared blob loses one reference per deleted name; its bytes, nodes and
+    manifest entry go once no uploaded file refers to it. Names that were
+    never uploaded but were ingested straight from DATA_PATH are deleted as
+    well. The rest of the index is left in place, except that files which
+    shared the deleted nodes are returned in requeued for ingestion.
     """
-    # Group documents by file name
-    docs_by_filename = {}
-    for doc in documents:
-        file_path = doc.metadata.get("file_path", "")
-        file_name = (
-            os.path.basename(file_path)
-            if file_path
-            else doc.metadata.get("file_name", "unknown")
+    filenames = list(dict.fromkeys(filenames))
+    # Rows are read, the index persisted before the metadata commit and the
+    # files removed all under the write lock: a crash in between leaves files
+    # to re-ingest rather than orphaned nodes, and an ingestion flush waiting
+    # for the lock finds the files gone rather than indexing them again
+    with index_manager.writing():
+        files = (
+            db.query(UploadedFile).filter(UploadedFile.filename.in_(filenames)).all()
         )
+        hashes = {file.content_hash for file in files if file.content_hash}
+        blobs = {
+            blob.content_hash: blob
+            for blob in db.query(FileBlob).filter(FileBlob.content_hash.in_(hashes))
+        }
 
-        if file_name not in docs_by_filename:
-            docs_by_filename[file_name] = []
-        docs_by_filename[file_name].append(doc)
-
-    # Process each file
-    for file_name, file_docs in docs_by_filename.items():
-        # Create nodes for the file
-        combined_text = " ".join(doc.text for doc in file_docs)
-        file_hash = hashlib.md5(combined_text.encode()).hexdigest()
-
-        # Create nodes for the file
-        all_nodes = []
-        for doc in file_docs:
-            nodes = text_splitter.get_nodes_from_documents([doc])
-            # print(f"File {file_name}: created {len(nodes)} nodes")
-            all_nodes.extend(nodes)
-
-            # Add nodes to the index if available
-            if existing_index:
-                existing_index.insert_nodes(nodes)
-
-        # Save processed file information
-        processed_files[file_name] = {
-            "hash": file_hash,
-            "nodes_count": len(all_nodes),
-            "last_processed": datetime.now().isoformat(),
+        # Manifest entries are named after the blob file or the file itself
+        released, removed_paths = [], []
+        for file in files:
+            blob = blobs.get(file.content_hash)
+            if blob is None:
+                released.append(os.path.basename(file.filepath))
+                removed_paths.append(file.filepath)
+            else:
+                blob.ref_count -= 1
+                if blob.ref_count <= 0:
+                    released.append(os.path.basename(blob.path))
+                    removed_paths.append(blob.path)
+                    db.delete(blob)
+            db.delete(file)
+
+        uploaded = {file.filename for file in files}
+        loose = {
+            os.path.join(DATA_PATH, name): name
+            for name in filenames
+            if name not in uploaded
         }
+        entries = (
+            db.query(IngestionManifest)
+            .filter(
+                IngestionManifest.filename.in_(released)
+                | IngestionManifest.filepath.in_(list(loose))
+            )
+            .all()
+        )
+        found_loose = {loose[e.filepath] for e in entries if e.filepath in loose}
+        removed_paths.extend(os.path.join(DATA_PATH, name) for name in found_loose)
+
+        node_ids = [node_id for entry in entries for node_id in entry.node_ids or []]
+        for entry in entries:
+            db.delete(entry)
+        requeued = release_duplicates(
+            {entry.content_hash for entry in entries if entry.node_ids}, db
+        )
+
+        index_manager.delete_nodes(node_ids)
+        index_manager.persist()
+        db.commit()
+
+        for path in removed_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    deleted = [name for name in filenames if name in uploaded or name in found_loose]
+    return {
+        "deleted": deleted,
+        "not_found": [name for name in filenames if name not in deleted],
+        "nodes_removed": len(node_ids),
+        # Files that shared the deleted content, to be ingested on their own
+        "requeued": requeued,
+    }
+
+
+def delete_all_files(db: Session):
+    """
+    Delete all uploaded files from the system and clear database records.
+
+    Runs under the index write lock, so an ingestion job cannot record files
+    in the manifest between the delete and the reset of the index.
+    """
+    with index_manager.writing():
+        paths = [file.filepath for file in db.query(UploadedFile).all()]
+        paths += [blob.path for blob in db.query(FileBlob).all()]
+
+        db.query(UploadedFile).delete()
+        db.query(FileBlob).delete()
+        db.query(IngestionManifest).delete()
+
+        # Publish an empty snapshot rather than removing storage other workers
+        # may be reading; older snapshots are pruned as new ones are written
+        index_manager.reset()
+        index_manager.persist()
+        db.commit()
+
+        for path in paths:
+            blob_store.remove(path)
+    return {"message": "All files deleted successfully"}
+
+
+def warm_up_models():
+    """
+    Load the embedding model and the tokenizer used for context packing, and
+    run each once, so the first query does not pay for it.
+    """
+    embed_model.get_query_embedding("warm up")
+    count_tokens("warm up")
 
 
-def query_rag(query_text: str, documents):
+def get_stats(evaluate_quantization: bool = False):
     """
-    Perform a RAG query using stored documents.
+    Report embedding cache, ingestion embedding throughput, vector store,
+    keyword index, context packing, LLM call and LLM client statistics.
     """
+    return {
+        "embedding_cache": embedding_cache.stats(),
+        "embedding": embedder.stats(),
+        "query_cache": query_cache.stats(),
+        "query_executor": query_executor.stats(),
+        "query_embedding": query_embedder.stats(),
+        "index_snapshots": index_manager.snapshot_stats(),
+        "vector_store": index_manager.vector_store_stats(evaluate_quantization),
+        "keyword_index": index_manager.keyword_index_stats(),
+        "context": context_packer.stats(),
+        "synthesis": index_manager.synthesis_stats(),
+        "llm": llm_client.stats(),
+    }
+
+
+def query_rag(query_text: str, synthesis_mode=None):
+    """
+    Perform a RAG query against the resident index.
 
-    os.makedirs(STORAGE_PATH, exist_ok=True)
+    Answers are cached per index version and synthesis mode, so a repeated
+    query is served from memory until ingestion or a delete changes the
+    corpus. Returns None when nothing has been ingested yet.
+    """
+    index_manager.poll()
+    version = index_manager.version
+    cached = query_cache.get(query_text, version, synthesis_mode)
+    if cached is not None:
+        return cached
+    return answer_query(query_text, version, synthesis_mode)
 
-    text_splitter = SentenceSplitter(chunk_size=2048, chunk_overlap=256)
 
-    # Load or create the index
-    index, processed_files = load_existing_index()
+async def query_rag_async(query_text: str, synthesis_mode=None):
+    """
+    Perform a RAG query without blocking the event loop.
 
-    print(
-        f"Number of nodes in the database BEFORE adding: {len(index.docstore.docs) if index else 0}"
+    Cache hits return directly; otherwise the query runs on the query executor
+    and identical queries in flight against the same index version share one
+    computation. Returns None when nothing has been ingested yet.
+    """
+    index_manager.poll()
+    version = index_manager.version
+    cached = query_cache.get(query_text, version, synthesis_mode)
+    if cached is not None:
+        return cached
+    return await query_executor.run_coalesced(
+        (normalize_query(query_text), version, synthesis_mode),
+        answer_query,
+        query_text,
+        version,
+        synthesis_mode,
     )
 
-    # If index does not exist, create a new one
-    if index is None:
-        print(f"Creating a new index from {len(documents)} documents...")
-        # Create index and save metadata
-        process_new_documents(documents, text_splitter, None, processed_files)
-        index = VectorStoreIndex.from_documents(
-            documents, transformations=[text_splitter], embed_model=embed_model
-        )
-        save_processed_files(processed_files)
-        index.storage_context.persist(persist_dir=STORAGE_PATH)
-    else:
-        # Group documents by actual file name
-        docs_by_file = {}
-        for doc in documents:
-            file_path = doc.metadata.get("file_path", "")
-            if not file_path:
-                file_path = doc.metadata.get("file_name", "unknown")
-
-            if file_path not in docs_by_file:
-                docs_by_file[file_path] = []
-            docs_by_file[file_path].append(doc)
-
-        # Check and process new or changed files
-        new_or_changed_files = {}
-        for file_path, file_docs in docs_by_file.items():
-            file_name = os.path.basename(file_path)
-
-            # Calculate hash for the combined content
-            combined_text = " ".join(doc.text for doc in file_docs)
-            current_hash = hashlib.md5(combined_text.encode()).hexdigest()
-
-            # Detect new files
-            if file_name not in processed_files:
-                print(f"New file detected: {file_name}")
-                new_or_changed_files[file_path] = file_docs
-            # Detect changed files
-            elif current_hash != processed_files[file_name].get("hash", ""):
-                print(f"Changed file detected: {file_name}")
-                new_or_changed_files[file_path] = file_docs
-
-        if new_or_changed_files:
-            # Process new or changed files
-            all_new_docs = []
-            for file_path, file_docs in new_or_changed_files.items():
-                all_new_docs.extend(file_docs)
-
-            print(
-                f"Processing {len(all_new_docs)} documents from {len(new_or_changed_files)} new/changed files..."
-            )
 
-            # Process each file and update metadata
-            process_new_documents(all_new_docs, text_splitter, index, processed_files)
+def answer_query(query_text: str, version: int, synthesis_mode=None):
+    """Run a query against the index and cache the answer under version"""
+    result = index_manager.query(query_text, synthesis_mode)
+    query_cache.put(query_text, version, result, synthesis_mode)
+    return result
 
-            # Save processed files information
-            save_processed_files(processed_files)
-            if index:
-                index.storage_context.persist(persist_dir=STORAGE_PATH)
-        else:
-            print("No new or changed files")
-    print(f"Number of nodes in the database AFTER adding: {len(index.docstore.docs)}")
-
-    # Initialize query
-    retriever = index.as_retriever(similarity_top_k=10)
-    response_synthesizer = get_response_synthesizer(llm=llm)
-
-    class SortedRetrieverQueryEngine:
-        """Query engine that sorts based on similarity score"""
-
-        def __init__(self, retriever, response_synthesizer):
-            self.retriever = retriever
-            self.response_synthesizer = response_synthesizer
-
-        def query(self, query):
-            similarity_cutoff, max_selected_nodes = 0.5, 8
-            nodes = [
-                node
-                for node in self.retriever.retrieve(query)
-                if node.score >= similarity_cutoff
-            ]
-            return self.response_synthesizer.synthesize(
-                query,
-                sorted(nodes, key=lambda x: x.score, reverse=True)[:max_selected_nodes],
-            )
 
-    return SortedRetrieverQueryEngine(retriever, response_synthesizer).query(query_text)
+def stream_query_rag(query_text: str, synthesis_mode=None):
+    """
+    Perform a RAG query and stream the answer as it is generated.
+
+    Returns (source nodes, token iterator), or None when nothing has been
+    ingested yet. A cached answer is replayed as a single token; a streamed
+    answer is added to the cache once it completes.
+    """
+    index_manager.poll()
+    version = index_manager.version
+    cached = query_cache.get(query_text, version, synthesis_mode)
+    if cached is not None:
+        return cached.source_nodes, iter([cached.response])
+
+    streamed = index_manager.stream_query(query_text, synthesis_mode)
+    if streamed is None:
+        return None
+    nodes, tokens = streamed
+
+    def generate():
+        answer = []
+        for token in tokens:
+            answer.append(token)
+            yield token
+        query_cache.put(
+            query_text,
+            version,
+            Response("".join(answer), source_nodes=nodes),
+            synthesis_mode,
+        )
+
+    return nodes, generate()
@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WarmUp:
+    """
+    Runs the warm-up steps of a worker process once, in order, and reports
+    readiness.
+
+    Steps are (name, fn) pairs. The process is ready once every step has
+    finished. A failed step is logged and reported, and the remaining steps
+    still run, so one broken component does not hide the state of the
+    others. Times are measured from when the application started importing,
+    as reported by imported().
+    """
+
+    def __init__(self):
+        self.import_seconds = None
+        self.state = "pending"
+        self.steps = {}
+        self.seconds = None
+        self.ready_after_seconds = None
+
+        self._created = time.perf_counter()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def imported(self, started: float):
+        """Record that importing the application began at perf_counter started"""
+        self._created = started
+        self.import_seconds = time.perf_counter() - started
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def run(self, steps):
+        """Run the steps in the calling thread"""
+        with self._lock:
+            if self.state != "pending":
+                return
+            self.state = "running"
+        started = time.perf_counter()
+        failed = False
+        for name, fn in steps:
+            self.steps[name] = {"state": "running"}
+            step_started = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                logger.exception("Warm-up step %s failed", name)
+                self.steps[name] = {"state": "failed", "error": str(e)}
+                failed = True
+                continue
+            self.steps[name] = {
+                "state": "done",
+                "seconds": round(time.perf_counter() - step_started, 3),
+            }
+        self.seconds = time.perf_counter() - started
+        self.ready_after_seconds = time.perf_counter() - self._created
+        self.state = "failed" if failed else "ready"
+        logger.info("Warm-up %s after %.2fs", self.state, self.seconds)
+
+    def start(self, steps):
+        """Run the steps on a background thread"""
+        self._thread = threading.Thread(
+            target=self.run, args=(list(steps),), name="warm-up", daemon=True
+        )
+        self._thread.start()
+
+    def skip(self):
+        """Report ready without warming up; components load on first use"""
+        with self._lock:
+            if self.state == "pending":
+                self.state = "ready"
+                self.seconds = 0.0
+                self.ready_after_seconds = time.perf_counter() - self._created
+
+    def status(self):
+        """State of every step and the time startup took"""
+        return {
+            "ready": self.ready,
+            "state": self.state,
+            "import_seconds": (
+                round(self.import_seconds, 3)
+                if self.import_seconds is not None
+                else None
+            ),
+            "warm_up_seconds": (
+                round(self.seconds, 3) if self.seconds is not None else None
+            ),
+            "ready_after_seconds": (
+                round(self.ready_after_seconds, 3)
+                if self.ready_after_seconds is not None
+                else None
+            ),
+            "steps": {name: dict(step) for name, step in self.steps.items()},
+        }
+
+
+# Warm-up of this worker process, run from the application's startup hook
+warm_up = WarmUp()
@@ -0,0 +1,252 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from llama_index.core import get_response_synthesizer
+from llama_index.core.callbacks import CBEventType
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+from llama_index.core.response_synthesizers import ResponseMode, TreeSummarize
+
+# "compact": llama-index default, stuffs chunks into as few prompts as fit and
+#     refines the answer sequentially, one round-trip per prompt
+# "single": exactly one LLM call, context truncated to fit the prompt
+# "tree": chunks packed into prompts that are summarized concurrently, then
+#     the summaries are combined the same way until one answer is left
+SYNTHESIS_MODES = {
+    "compact": ResponseMode.COMPACT,
+    "single": ResponseMode.SIMPLE_SUMMARIZE,
+    "tree": ResponseMode.TREE_SUMMARIZE,
+}
+
+_current_usage = contextvars.ContextVar("llm_usage", default=None)
+
+
+class ParallelTreeSummarize(TreeSummarize):
+    """
+    Tree summarize whose leaf calls at each level run on up to
+    max_concurrency threads, so a level costs about one round-trip instead of
+    one per prompt.
+    """
+
+    def __init__(self, *args, max_concurrency: int = 4, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._max_concurrency = max(1, max_concurrency)
+
+    def get_response(self, query_str, text_chunks, **response_kwargs):
+        summary_template = self._summary_template.partial_format(query_str=query_str)
+        text_chunks = self._prompt_helper.repack(
+            summary_template, text_chunks=text_chunks, llm=self._llm
+        )
+
+        if len(text_chunks) == 1:
+            if self._streaming:
+                return self._llm.stream(
+                    summary_template, context_str=text_chunks[0], **response_kwargs
+                )
+            return self._llm.predict(
+                summary_template, context_str=text_chunks[0], **response_kwargs
+            )
+
+        def summarize(text_chunk):
+            return self._llm.predict(
+                summary_template, context_str=text_chunk, **response_kwargs
+            )
+
+        workers = min(self._max_concurrency, len(text_chunks))
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="rag-synthesis"
+        ) as executor:
+            # Copy the context so LLM calls are attributed to this query
+            futures = [
+                executor.submit(contextvars.copy_context().run, summarize, chunk)
+                for chunk in text_chunks
+            ]
+            summaries = [future.result() for future in futures]
+
+        return self.get_response(query_str, summaries, **response_kwargs)
+
+
+def build_synthesizer(
+    llm, mode: str, streaming=False, max_concurrency=4, callback_manager=None
+):
+    """
+    Response synthesizer for one of SYNTHESIS_MODES.
+
+    The synthesizer installs callback_manager on the LLM, falling back to the
+    global one, so every synthesizer sharing an LLM must get the same manager.
+    """
+    if mode not in SYNTHESIS_MODES:
+        raise ValueError(f"Unsupported synthesis mode: {mode}")
+    if mode == "tree":
+        return ParallelTreeSummarize(
+            llm=llm,
+            streaming=streaming,
+            max_concurrency=max_concurrency,
+            callback_manager=callback_manager,
+        )
+    return get_response_synthesizer(
+        llm=llm,
+        response_mode=SYNTHESIS_MODES[mode],
+        streaming=streaming,
+        callback_manager=callback_manager,
+    )
+
+
+class Synthesizers:
+    """
+    Response synthesizers by mode, built on first use and reused.
+
+    default_mode answers requests that do not pick a mode; tree leaf calls
+    are capped at max_concurrency per query. LLM calls are reported to the
+    handlers of callback_manager.
+    """
+
+    def __init__(
+        self,
+        llm,
+        default_mode: str = "compact",
+        max_concurrency: int = 4,
+        callback_manager=None,
+    ):
+        if default_mode not in SYNTHESIS_MODES:
+            raise ValueError(f"Unsupported synthesis mode: {default_mode}")
+        self.llm = llm
+        self.default_mode = default_mode
+        self.max_concurrency = max_concurrency
+        self.callback_manager = callback_manager
+
+        self._built = {}
+        self._lock = threading.Lock()
+
+    def get(self, mode=None, streaming: bool = False):
+        """Synthesizer for mode, or the default mode when mode is None"""
+        key = (mode or self.default_mode, streaming)
+        with self._lock:
+            if key not in self._built:
+                self._built[key] = build_synthesizer(
+                    self.llm,
+                    key[0],
+                    streaming,
+                    self.max_concurrency,
+                    self.callback_manager,
+                )
+            return self._built[key]
+
+
+class LLMUsage:
+    """LLM calls made while answering one query"""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.calls = 0
+        self.seconds = 0.0
+        self.slowest_call_seconds = 0.0
+        # Wall time from the start of synthesis until the answer is complete;
+        # below llm_seconds when calls overlap
+        self.synthesis_seconds = 0.0
+        self.started = time.perf_counter()
+
+    def as_dict(self):
+        return {
+            "mode": self.mode,
+            "llm_calls": self.calls,
+            "llm_seconds": round(self.seconds, 4),
+            "slowest_call_seconds": round(self.slowest_call_seconds, 4),
+            "synthesis_seconds": round(self.synthesis_seconds, 4),
+        }
+
+
+class LLMCallRecorder(BaseCallbackHandler):
+    """
+    Callback handler counting LLM calls and their time per query.
+
+    Calls are attributed to the LLMUsage opened by track() in the calling
+    context. A streamed call ends when its last token is read, possibly on
+    another thread, so calls are matched by event id rather than by context.
+    """
+
+    def __init__(self):
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+        self.queries = 0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self.max_calls_per_query = 0
+        self.max_seconds_per_query = 0.0
+        self.max_synthesis_seconds = 0.0
+        self.calls_by_mode = {}
+
+        self._open = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self, mode):
+        """Attribute LLM calls made inside the block to a new LLMUsage"""
+        usage = LLMUsage(mode)
+        token = _current_usage.set(usage)
+        try:
+            yield usage
+        finally:
+            _current_usage.reset(token)
+
+    def finish(self, usage: LLMUsage):
+        """Add a completed query to the totals"""
+        usage.synthesis_seconds = time.perf_counter() - usage.started
+        with self._lock:
+            self.queries += 1
+            self.llm_calls += usage.calls
+            self.llm_seconds += usage.seconds
+            self.max_calls_per_query = max(self.max_calls_per_query, usage.calls)
+            self.max_seconds_per_query = max(self.max_seconds_per_query, usage.seconds)
+            self.max_synthesis_seconds = max(
+                self.max_synthesis_seconds, usage.synthesis_seconds
+            )
+            self.calls_by_mode[usage.mode] = (
+                self.calls_by_mode.get(usage.mode, 0) + usage.calls
+            )
+
+    def stats(self):
+        """Totals over every tracked query"""
+        with self._lock:
+            return {
+                "queries": self.queries,
+                "llm_calls": self.llm_calls,
+                "llm_seconds": round(self.llm_seconds, 4),
+                "max_calls_per_query": self.max_calls_per_query,
+                "max_seconds_per_query": round(self.max_seconds_per_query, 4),
+                "max_synthesis_seconds": round(self.max_synthesis_seconds, 4),
+                "calls_by_mode": dict(self.calls_by_mode),
+            }
+
+    def on_event_start(
+        self, event_type, payload=None, event_id="", parent_id="", **kwargs
+    ):
+        usage = _current_usage.get()
+        if event_type != CBEventType.LLM or usage is None:
+            return event_id
+        with self._lock:
+            # A chat call implemented on top of complete is one round-trip
+            if parent_id in self._open:
+                return event_id
+            usage.calls += 1
+            self._open[event_id] = (usage, time.perf_counter())
+        return event_id
+
+    def on_event_end(self, event_type, payload=None, event_id="", **kwargs):
+        if event_type != CBEventType.LLM:
+            return
+        with self._lock:
+            opened = self._open.pop(event_id, None)
+            if opened is None:
+                return
+            usage, started = opened
+            elapsed = time.perf_counter() - started
+            usage.seconds += elapsed
+            usage.slowest_call_seconds = max(usage.slowest_call_seconds, elapsed)
+
+    def start_trace(self, trace_id=None):
+        pass
+
+    def end_trace(self, trace_id=None, trace_map=None):
+        pass
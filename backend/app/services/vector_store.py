@@ -0,0 +1,692 @@
+import json
+import logging
+import os
+import threading
+from contextlib import ExitStack
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+from app.services import ann_index
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.simple import SimpleVectorStore
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FNAME = "vectors.f32"
+SCALES_FNAME = "vector_scales.f32"
+IDS_FNAME = "vector_ids.json"
+IVF_FNAME = "ivf.npz"
+LEGACY_VECTOR_STORE_FNAME = "default__vector_store.json"
+
+# Rows copied per step when compacting the matrix on persist
+_COPY_BLOCK_ROWS = 65_536
+# The IVF index is retrained once the corpus has grown by this factor
+_IVF_RETRAIN_GROWTH = 4
+
+# Storage dtype -> (numpy dtype, file holding the scored matrix)
+_DTYPES = {
+    "float32": (np.float32, VECTORS_FNAME),
+    "float16": (np.float16, "vectors.f16"),
+    "int8": (np.int8, "vectors.i8"),
+}
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _quantize(vectors: np.ndarray, vector_dtype: str):
+    """
+    Convert float32 rows to the storage dtype.
+
+    Returns (rows, scales); int8 rows carry one float32 scale per row so that
+    row * scale approximates the original vector, other dtypes have no scales.
+    """
+    if vector_dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        rows = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return rows, scales.astype(np.float32)
+    return vectors.astype(_DTYPES[vector_dtype][0]), None
+
+
+class _StoreState:
+    """
+    Immutable view of the store; writers swap in a new one, so a query never
+    sees a half-applied insert or delete.
+    """
+
+    def __init__(
+        self,
+        matrix,
+        tail,
+        ids,
+        ref_doc_ids,
+        alive,
+        ivf=None,
+        assignments=None,
+        scales=None,
+        exact=None,
+    ):
+        # matrix: persisted rows (memory-mapped), tail: rows added since load
+        self.matrix = matrix
+        # scales: per-row scales of an int8 matrix, exact: float32 copy of a
+        # quantized matrix kept for re-scoring, both None when unused
+        self.scales = scales
+        self.exact = exact
+        self.tail = tail
+        self.ids = ids
+        self.ref_doc_ids = ref_doc_ids
+        self.alive = alive
+        # ivf: trained IVF lists or None, assignments: list of every row
+        self.ivf = ivf
+        self.assignments = assignments
+
+    def replace(self, **changes):
+        fields = dict(self.__dict__)
+        fields.update(changes)
+        return _StoreState(**fields)
+
+    @property
+    def dim(self):
+        if self.matrix.shape[0]:
+            return self.matrix.shape[1]
+        if self.tail.shape[0]:
+            return self.tail.shape[1]
+        return None
+
+
+class _IVFLists:
+    """Trained centroids and the inverted lists of the memory-mapped rows"""
+
+    def __init__(self, centroids, matrix_assignments, trained_count):
+        self.centroids = centroids
+        self.order, self.offsets = ann_index.build_lists(
+            matrix_assignments, len(centroids)
+        )
+        self.trained_count = trained_count
+
+
+def _empty_rows(dim: int = 0) -> np.ndarray:
+    return np.zeros((0, dim), dtype=np.float32)
+
+
+def _empty_state():
+    return _StoreState(_empty_rows(), _empty_rows(), [], [], np.zeros(0, dtype=bool))
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    Vector store keeping embeddings as a contiguous matrix, float32 by default.
+
+    Persisted vectors live in a memory-mapped file next to an id sidecar, so
+    loading only maps the file and resident memory is whatever the OS pages
+    in. Vectors are L2-normalized on insert; a query is one matrix-vector
+    product followed by argpartition for the top k. Deletes are tombstones
+    that are compacted away on persist.
+
+    With index_type="ivf" an inverted-file index is trained once there are
+    enough vectors, kept current as vectors are added and persisted with the
+    matrix, whose rows are then stored grouped by list. Queries only score
+    the ivf_nprobe lists closest to the query vector.
+
+    vector_dtype="float16" or "int8" (per-row scaled) stores the scored matrix
+    at half or a quarter of the float32 size. With rescore_factor > 0 a float32
+    copy is kept on disk as well and the top similarity_top_k * rescore_factor
+    candidates are re-scored against it; only those rows are paged in.
+    """
+
+    stores_text: bool = False
+    index_type: str = "exact"
+    # 0 picks 4 * sqrt(n) lists when the index is trained
+    ivf_nlist: int = 0
+    ivf_nprobe: int = 8
+    # "float32", "float16" or "int8"
+    vector_dtype: str = "float32"
+    # 0 disables float32 re-scoring of quantized results
+    rescore_factor: int = 0
+
+    _state: _StoreState = PrivateAttr()
+    _positions: dict = PrivateAttr()
+    _lock: Any = PrivateAttr()
+    _dirty: bool = PrivateAttr()
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        if self.vector_dtype not in _DTYPES:
+            raise ValueError(f"Unsupported vector dtype: {self.vector_dtype}")
+        self._state = _empty_state()
+        self._positions = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str, **kwargs: Any) -> "MmapVectorStore":
+        """
+        Map a persisted store, importing a legacy SimpleVectorStore if that is
+        all the directory contains.
+
+        The directory is only read. Vectors stored with another dtype, or
+        imported, are converted in memory and the store is marked dirty until
+        it is persisted.
+        """
+        store = cls(**kwargs)
+        ids_path = os.path.join(persist_dir, IDS_FNAME)
+        legacy_path = os.path.join(persist_dir, LEGACY_VECTOR_STORE_FNAME)
+
+        if os.path.exists(ids_path):
+            store._load(persist_dir)
+            matrix = store._state.matrix
+            if matrix.shape[0] and matrix.dtype != _DTYPES[store.vector_dtype][0]:
+                logger.info(
+                    "Converting %d stored vectors to %s",
+                    matrix.shape[0],
+                    store.vector_dtype,
+                )
+                store._convert()
+        elif os.path.exists(legacy_path):
+            logger.info("Importing embeddings from %s", legacy_path)
+            legacy = SimpleVectorStore.from_persist_path(legacy_path)
+            ids = list(legacy.data.embedding_dict.keys())
+            if ids:
+                store._append(
+                    ids,
+                    [legacy.data.text_id_to_ref_doc_id.get(i) for i in ids],
+                    np.asarray(
+                        [legacy.data.embedding_dict[i] for i in ids], dtype=np.float32
+                    ),
+                )
+                store._dirty = True
+        return store
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    @property
+    def dirty(self) -> bool:
+        """Whether the store differs from the files it was loaded from"""
+        return self._dirty
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __bool__(self) -> bool:
+        # StorageContext.from_defaults replaces a falsy store with its default
+        return True
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        """Add nodes with their embeddings to the store"""
+        if not nodes:
+            return []
+        ids = [node.node_id for node in nodes]
+        ref_doc_ids = [node.ref_doc_id for node in nodes]
+        vectors = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        self._append(ids, ref_doc_ids, vectors)
+        return ids
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        """Delete every node that belongs to ref_doc_id"""
+        with self._lock:
+            state = self._state
+            node_ids = [
+                node_id
+                for node_id, ref in zip(state.ids, state.ref_doc_ids)
+                if ref == ref_doc_id and node_id in self._positions
+            ]
+            self._delete_ids(node_ids)
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        """Delete nodes by id"""
+        if filters is not None:
+            raise NotImplementedError("Metadata filters are not supported")
+        with self._lock:
+            self._delete_ids(node_ids or [])
+
+    def clear(self) -> None:
+        """Remove every vector"""
+        with self._lock:
+            self._state = _empty_state()
+            self._positions = {}
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        """Return the similarity_top_k nodes by cosine similarity"""
+        if query.filters is not None:
+            raise NotImplementedError("Metadata filters are not supported")
+
+        state = self._state
+        if not state.alive.any() or query.query_embedding is None:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        query_vector = _normalize(np.asarray(query.query_embedding, dtype=np.float32))
+        candidates = self._candidate_mask(state, query)
+
+        if state.ivf is None:
+            rows = np.flatnonzero(candidates)
+            scores = self._score(state, query_vector)[rows]
+        else:
+            rows = self._probe_rows(state, query_vector)
+            rows = rows[candidates[rows]]
+            scores = self._score_rows(state, rows, query_vector)
+
+        top_k = min(query.similarity_top_k, len(rows))
+        if top_k <= 0:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        if self.rescore_factor and state.exact is not None:
+            shortlist = min(len(rows), top_k * self.rescore_factor)
+            keep = np.argpartition(-scores, shortlist - 1)[:shortlist]
+            rows = rows[keep]
+            scores = (self._gather_exact(state, rows) @ query_vector).astype(np.float32)
+
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return VectorStoreQueryResult(
+            similarities=scores[top].tolist(),
+            ids=[state.ids[i] for i in rows[top]],
+        )
+
+    def describe(self) -> dict:
+        """Storage settings and the memory used by the scored vectors"""
+        state = self._state
+        dim = state.dim or 0
+        rows = state.matrix.shape[0] + state.tail.shape[0]
+        float32_bytes = rows * dim * np.dtype(np.float32).itemsize
+        stored_bytes = state.matrix.nbytes + state.tail.nbytes
+        if state.scales is not None:
+            stored_bytes += state.scales.nbytes
+        return {
+            "backend": "mmap",
+            "index_type": self.index_type,
+            "vector_dtype": self.vector_dtype,
+            "rescore_factor": self.rescore_factor,
+            "vectors": len(self),
+            "dim": dim,
+            "float32_bytes": float32_bytes,
+            "stored_bytes": stored_bytes,
+            "memory_saved_bytes": float32_bytes - stored_bytes,
+            "memory_saved_ratio": (
+                round(1 - stored_bytes / float32_bytes, 3) if float32_bytes else 0.0
+            ),
+        }
+
+    def evaluate_quantization(self, samples: int = 32, top_k: int = 10) -> dict:
+        """
+        Compare quantized exact-search results with float32 scores.
+
+        Stored vectors are sampled as queries. Reports the overlap of the top_k
+        with the float32 top_k, with and without re-scoring, and the score
+        error on the float32 top_k. Needs the float32 copy kept for re-scoring.
+        """
+        state = self._state
+        if self.vector_dtype == "float32":
+            return {"available": False, "reason": "vectors are stored as float32"}
+        if state.exact is None:
+            return {"available": False, "reason": "no float32 copy to compare with"}
+
+        live = np.flatnonzero(state.alive)
+        top_k = min(top_k, len(live))
+        if not top_k:
+            return {"available": False, "reason": "the store is empty"}
+
+        rng = np.random.default_rng(0)
+        queries = rng.choice(live, min(samples, len(live)), replace=False)
+        exact_state = state.replace(matrix=state.exact, scales=None)
+        shortlist = min(len(live), top_k * max(1, self.rescore_factor))
+        recall, rescored_recall, errors = [], [], []
+        for query_vector in self._gather_exact(state, np.sort(queries)):
+            exact_scores = self._score(exact_state, query_vector)[live]
+            scores = self._score(state, query_vector)[live]
+
+            expected = np.argpartition(-exact_scores, top_k - 1)[:top_k]
+            found = np.argpartition(-scores, top_k - 1)[:top_k]
+            candidates = np.argpartition(-scores, shortlist - 1)[:shortlist]
+            rescored = candidates[
+                np.argpartition(-exact_scores[candidates], top_k - 1)[:top_k]
+            ]
+
+            recall.append(len(np.intersect1d(expected, found)) / top_k)
+            rescored_recall.append(len(np.intersect1d(expected, rescored)) / top_k)
+            errors.append(np.abs(scores[expected] - exact_scores[expected]))
+
+        errors = np.concatenate(errors)
+        return {
+            "available": True,
+            "samples": len(queries),
+            "top_k": top_k,
+            "recall_at_k": round(float(np.mean(recall)), 4),
+            "recall_at_k_rescored": round(float(np.mean(rescored_recall)), 4),
+            "mean_abs_score_error": float(errors.mean()),
+            "max_abs_score_error": float(errors.max()),
+        }
+
+    def persist(self, persist_path: str, fs: Any = None) -> None:
+        """
+        Write live vectors to the directory of persist_path.
+
+        Tombstoned rows are dropped and the result is re-mapped, so the tail of
+        in-memory rows is folded into the memory-mapped file. Quantized rows are
+        written from the float32 copy when there is one.
+        """
+        persist_dir = os.path.dirname(persist_path)
+        os.makedirs(persist_dir, exist_ok=True)
+        vectors_path = os.path.join(persist_dir, _DTYPES[self.vector_dtype][1])
+        exact_path = os.path.join(persist_dir, VECTORS_FNAME)
+        scales_path = os.path.join(persist_dir, SCALES_FNAME)
+        ids_path = os.path.join(persist_dir, IDS_FNAME)
+        quantized = self.vector_dtype != "float32"
+        keep_exact = quantized and self.rescore_factor > 0
+
+        with self._lock:
+            state = self._state
+            live = np.flatnonzero(state.alive)
+            dim = state.dim or 0
+            if state.ivf is not None:
+                # Store rows grouped by list so every list is a contiguous slice
+                live = live[np.argsort(state.assignments[live], kind="stable")]
+
+            scales = []
+            with ExitStack() as files:
+                f = files.enter_context(open(vectors_path + ".tmp", "wb"))
+                if keep_exact:
+                    exact_file = files.enter_context(open(exact_path + ".tmp", "wb"))
+                for start in range(0, len(live), _COPY_BLOCK_ROWS):
+                    rows = live[start : start + _COPY_BLOCK_ROWS]
+                    vectors = self._gather_exact(state, rows)
+                    stored, block_scales = _quantize(vectors, self.vector_dtype)
+                    f.write(stored.tobytes())
+                    if keep_exact:
+                        exact_file.write(vectors.tobytes())
+                    if block_scales is not None:
+                        scales.append(block_scales)
+            if self.vector_dtype == "int8":
+                with open(scales_path + ".tmp", "wb") as f:
+                    empty = np.zeros(0, dtype=np.float32)
+                    f.write(np.concatenate(scales or [empty]).tobytes())
+
+            ids = [state.ids[i] for i in live]
+            ref_doc_ids = [state.ref_doc_ids[i] for i in live]
+            with open(ids_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "dim": dim,
+                        "count": len(ids),
+                        "dtype": self.vector_dtype,
+                        "ids": ids,
+                        "ref_doc_ids": ref_doc_ids,
+                    },
+                    f,
+                )
+
+            ivf_path = os.path.join(persist_dir, IVF_FNAME)
+            if state.ivf is not None:
+                with open(ivf_path + ".tmp", "wb") as f:
+                    np.savez(
+                        f,
+                        centroids=state.ivf.centroids,
+                        assignments=state.assignments[live],
+                        trained_count=state.ivf.trained_count,
+                    )
+                os.replace(ivf_path + ".tmp", ivf_path)
+            elif os.path.exists(ivf_path):
+                os.remove(ivf_path)
+
+            os.replace(vectors_path + ".tmp", vectors_path)
+            if keep_exact:
+                os.replace(exact_path + ".tmp", exact_path)
+            if self.vector_dtype == "int8":
+                os.replace(scales_path + ".tmp", scales_path)
+            os.replace(ids_path + ".tmp", ids_path)
+
+            # Drop files left over from a previous storage dtype
+            stale = {fname for _, fname in _DTYPES.values()} | {SCALES_FNAME}
+            stale.discard(_DTYPES[self.vector_dtype][1])
+            if keep_exact:
+                stale.discard(VECTORS_FNAME)
+            if self.vector_dtype == "int8":
+                stale.discard(SCALES_FNAME)
+            for fname in stale:
+                if os.path.exists(os.path.join(persist_dir, fname)):
+                    os.remove(os.path.join(persist_dir, fname))
+            self._load(persist_dir)
+            self._dirty = False
+
+    def _convert(self):
+        """Re-encode the mapped matrix in vector_dtype, in memory"""
+        with self._lock:
+            state = self._state
+            vectors = self._gather_exact(state, np.arange(state.matrix.shape[0]))
+            matrix, scales = _quantize(vectors, self.vector_dtype)
+            keep_exact = self.vector_dtype != "float32" and self.rescore_factor > 0
+            self._state = state.replace(
+                matrix=matrix, scales=scales, exact=vectors if keep_exact else None
+            )
+            self._dirty = True
+
+    def _load(self, persist_dir: str):
+        with open(os.path.join(persist_dir, IDS_FNAME), "r", encoding="utf-8") as f:
+            sidecar = json.load(f)
+
+        count, dim = sidecar["count"], sidecar["dim"]
+        stored_dtype = sidecar.get("dtype", "float32")
+        matrix, scales, exact = _empty_rows(dim), None, None
+        if count:
+            dtype, fname = _DTYPES[stored_dtype]
+            matrix = np.memmap(
+                os.path.join(persist_dir, fname),
+                dtype=dtype,
+                mode="r",
+                shape=(count, dim),
+            )
+            if stored_dtype == "int8":
+                scales = np.fromfile(
+                    os.path.join(persist_dir, SCALES_FNAME), dtype=np.float32
+                )
+            exact_path = os.path.join(persist_dir, VECTORS_FNAME)
+            if stored_dtype != "float32" and os.path.exists(exact_path):
+                exact = np.memmap(
+                    exact_path, dtype=np.float32, mode="r", shape=(count, dim)
+                )
+
+        ivf, assignments = None, None
+        ivf_path = os.path.join(persist_dir, IVF_FNAME)
+        if self.index_type == "ivf" and os.path.exists(ivf_path):
+            with np.load(ivf_path) as data:
+                if len(data["assignments"]) == count:
+                    assignments = data["assignments"]
+                    ivf = _IVFLists(
+                        data["centroids"], assignments, int(data["trained_count"])
+                    )
+
+        self._state = _StoreState(
+            matrix,
+            _empty_rows(dim),
+            sidecar["ids"],
+            sidecar["ref_doc_ids"],
+            np.ones(count, dtype=bool),
+            ivf=ivf,
+            assignments=assignments,
+            scales=scales,
+            exact=exact,
+        )
+        self._positions = {node_id: i for i, node_id in enumerate(sidecar["ids"])}
+        self._maybe_train_ivf()
+
+    def _append(self, ids, ref_doc_ids, vectors: np.ndarray):
+        vectors = _normalize(vectors)
+        with self._lock:
+            # Re-adding an id replaces its previous vector
+            self._delete_ids([node_id for node_id in ids if node_id in self._positions])
+
+            state = self._state
+            dim = vectors.shape[1]
+            if state.dim is not None and state.dim != dim:
+                raise ValueError(
+                    f"Embedding dimension {dim} does not match "
+                    f"the store dimension {state.dim}"
+                )
+            matrix = state.matrix if state.matrix.shape[0] else _empty_rows(dim)
+            tail = state.tail if state.tail.shape[0] else _empty_rows(dim)
+
+            assignments = state.assignments
+            if state.ivf is not None:
+                assignments = np.concatenate(
+                    [assignments, ann_index.assign(vectors, state.ivf.centroids)]
+                )
+
+            start = len(state.ids)
+            self._state = state.replace(
+                matrix=matrix,
+                tail=np.vstack([tail, vectors]),
+                ids=state.ids + list(ids),
+                ref_doc_ids=state.ref_doc_ids + list(ref_doc_ids),
+                alive=np.concatenate([state.alive, np.ones(len(ids), dtype=bool)]),
+                assignments=assignments,
+            )
+            for offset, node_id in enumerate(ids):
+                self._positions[node_id] = start + offset
+
+            self._maybe_train_ivf()
+
+    def _delete_ids(self, node_ids):
+        positions = [
+            self._positions.pop(node_id)
+            for node_id in node_ids
+            if node_id in self._positions
+        ]
+        if not positions:
+            return
+        state = self._state
+        alive = state.alive.copy()
+        alive[positions] = False
+        self._state = state.replace(alive=alive)
+
+    def _maybe_train_ivf(self):
+        """Train the IVF index, or retrain it once the corpus has grown enough"""
+        if self.index_type != "ivf":
+            return
+        state = self._state
+        count = len(self._positions)
+        if state.ivf is not None:
+            if count < _IVF_RETRAIN_GROWTH * state.ivf.trained_count:
+                return
+
+        nlist = self.ivf_nlist or ann_index.default_nlist(count)
+        if not ann_index.can_train(count, nlist):
+            return
+
+        live = np.flatnonzero(state.alive)
+        rng = np.random.default_rng(0)
+        if len(live) > ann_index.MAX_TRAINING_SAMPLE:
+            live = np.sort(
+                rng.choice(live, ann_index.MAX_TRAINING_SAMPLE, replace=False)
+            )
+        logger.info("Training IVF index: %d lists from %d vectors", nlist, len(live))
+        centroids = ann_index.train_centroids(self._gather(state, live), nlist)
+
+        persisted = state.matrix.shape[0]
+        matrix_assignments = ann_index.assign(state.matrix, centroids)
+        assignments = np.concatenate(
+            [matrix_assignments, ann_index.assign(state.tail, centroids)]
+        )
+        self._state = state.replace(
+            ivf=_IVFLists(centroids, matrix_assignments, count),
+            assignments=assignments,
+        )
+        logger.info("IVF index assigned %d rows", persisted + state.tail.shape[0])
+
+    @staticmethod
+    def _candidate_mask(state: _StoreState, query: VectorStoreQuery) -> np.ndarray:
+        candidates = state.alive.copy()
+        if query.node_ids is not None:
+            allowed = set(query.node_ids)
+            candidates &= np.fromiter(
+                (node_id in allowed for node_id in state.ids), bool, len(state.ids)
+            )
+        if query.doc_ids is not None:
+            allowed = set(query.doc_ids)
+            candidates &= np.fromiter(
+                (ref in allowed for ref in state.ref_doc_ids),
+                bool,
+                len(state.ref_doc_ids),
+            )
+        return candidates
+
+    def _probe_rows(self, state: _StoreState, query_vector: np.ndarray) -> np.ndarray:
+        ivf = state.ivf
+        lists = ann_index.probe(ivf.centroids, query_vector, self.ivf_nprobe)
+        persisted = state.matrix.shape[0]
+        parts = [ivf.order[ivf.offsets[i] : ivf.offsets[i + 1]] for i in lists]
+        tail_assignments = state.assignments[persisted:]
+        parts.append(persisted + np.flatnonzero(np.isin(tail_assignments, lists)))
+        return np.sort(np.concatenate(parts))
+
+    @staticmethod
+    def _matrix_rows(state: _StoreState, rows) -> np.ndarray:
+        """Persisted rows as float32, dequantized if needed"""
+        vectors = np.asarray(state.matrix[rows], dtype=np.float32)
+        if state.scales is not None:
+            vectors *= state.scales[rows, None]
+        return vectors
+
+    @classmethod
+    def _gather(cls, state: _StoreState, rows: np.ndarray, exact=False):
+        """
+        Vectors of the given row positions, in order, read from the float32
+        copy when exact is set and the store keeps one.
+        """
+        persisted = state.matrix.shape[0]
+        if exact and state.exact is not None:
+            state = state.replace(matrix=state.exact, scales=None)
+        in_matrix = rows < persisted
+        if in_matrix.all():
+            return cls._matrix_rows(state, rows)
+        vectors = np.empty((len(rows), state.dim), dtype=np.float32)
+        vectors[in_matrix] = cls._matrix_rows(state, rows[in_matrix])
+        vectors[~in_matrix] = state.tail[rows[~in_matrix] - persisted]
+        return vectors
+
+    @classmethod
+    def _gather_exact(cls, state: _StoreState, rows: np.ndarray) -> np.ndarray:
+        return cls._gather(state, rows, exact=True)
+
+    @classmethod
+    def _score_rows(cls, state: _StoreState, rows: np.ndarray, query_vector):
+        if not len(rows):
+            return np.zeros(0, dtype=np.float32)
+        return (cls._gather(state, rows) @ query_vector).astype(np.float32)
+
+    @staticmethod
+    def _score(state: _StoreState, query_vector: np.ndarray) -> np.ndarray:
+        parts = []
+        matrix = state.matrix
+        if matrix.shape[0] and matrix.dtype == np.float32:
+            parts.append(matrix @ query_vector)
+        elif matrix.shape[0]:
+            # Upcast block by block so the scan stays on the float32 BLAS path
+            # without materializing a float32 copy of the whole matrix
+            for start in range(0, matrix.shape[0], _COPY_BLOCK_ROWS):
+                block = np.asarray(
+                    matrix[start : start + _COPY_BLOCK_ROWS], dtype=np.float32
+                )
+                scores = block @ query_vector
+                if state.scales is not None:
+                    scores *= state.scales[start : start + len(block)]
+                parts.append(scores)
+        if state.tail.shape[0]:
+            parts.append(state.tail @ query_vector)
+        return np.concatenate(parts).astype(np.float32)
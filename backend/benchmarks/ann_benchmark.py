@@ -0,0 +1,200 @@
+"""
+Recall and latency of IVF retrieval against exact search.
+
+Builds the memory-mapped vector store from synthetic clustered vectors (or
+from an existing STORAGE_PATH), then reports recall@k against exact search
+and p50/p99 query latency for every (nlist, nprobe) combination.
+
+Usage, from the backend directory:
+    python -m benchmarks.ann_benchmark --vectors 200000 --dim 384
+    python -m benchmarks.ann_benchmark --storage storage --output ann.json
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from app.services.index_snapshots import SnapshotStore
+from app.services.vector_store import (
+    IDS_FNAME,
+    SCALES_FNAME,
+    VECTORS_FNAME,
+    MmapVectorStore,
+)
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+_ADD_BATCH_SIZE = 10_000
+
+# Quantized storage dtype -> (numpy dtype, file holding the matrix)
+_STORED_FILES = {
+    "float16": (np.float16, "vectors.f16"),
+    "int8": (np.int8, "vectors.i8"),
+}
+
+
+def synthetic_vectors(count: int, dim: int, clusters: int, seed: int = 0):
+    """Unit vectors drawn around random cluster centres, like text embeddings"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, count)
+    vectors = centres[labels] + 0.5 * rng.standard_normal((count, dim)).astype(
+        np.float32
+    )
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build_store(vectors: np.ndarray, persist_dir: str, **options):
+    """Insert vectors in batches, persist and map the store back from disk"""
+    store = MmapVectorStore(**options)
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), _ADD_BATCH_SIZE):
+        batch = vectors[offset : offset + _ADD_BATCH_SIZE]
+        store.add(
+            [
+                TextNode(id_=str(offset + i), text="", embedding=vector.tolist())
+                for i, vector in enumerate(batch)
+            ]
+        )
+    store.persist(os.path.join(persist_dir, "default__vector_store.json"))
+    build_seconds = time.perf_counter() - start
+    return MmapVectorStore.from_persist_dir(persist_dir, **options), build_seconds
+
+
+def run_queries(store: MmapVectorStore, queries: np.ndarray, top_k: int):
+    """Return the result ids and per-query latencies in milliseconds"""
+    results, latencies = [], []
+    for query in queries:
+        request = VectorStoreQuery(
+            query_embedding=query.tolist(), similarity_top_k=top_k
+        )
+        start = time.perf_counter()
+        result = store.query(request)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(result.ids)
+    return results, np.asarray(latencies)
+
+
+def recall(results, truth) -> float:
+    """Mean fraction of the exact top k found by the approximate search"""
+    return float(
+        np.mean(
+            [
+                len(set(found) & set(exact)) / len(exact)
+                for found, exact in zip(results, truth)
+            ]
+        )
+    )
+
+
+def load_vectors(storage_path: str) -> np.ndarray:
+    """
+    The stored vectors as float32: the exact copy when the store kept one,
+    otherwise the float16 or int8 matrix dequantized.
+    """
+    # The current snapshot, or the files themselves in an older layout
+    snapshots = SnapshotStore(os.path.join(storage_path, "snapshots"))
+    if snapshots.current():
+        storage_path = snapshots.path(snapshots.current())
+    with open(os.path.join(storage_path, IDS_FNAME), "r", encoding="utf-8") as f:
+        sidecar = json.load(f)
+
+    shape = (sidecar["count"], sidecar["dim"])
+    if not sidecar["count"]:
+        return np.zeros(shape, dtype=np.float32)
+    exact_path = os.path.join(storage_path, VECTORS_FNAME)
+    if os.path.exists(exact_path):
+        return np.array(np.memmap(exact_path, dtype=np.float32, mode="r", shape=shape))
+
+    stored_dtype = sidecar.get("dtype", "float32")
+    dtype, fname = _STORED_FILES[stored_dtype]
+    vectors = np.memmap(
+        os.path.join(storage_path, fname), dtype=dtype, mode="r", shape=shape
+    ).astype(np.float32)
+    if stored_dtype == "int8":
+        # Each int8 row times its scale approximates the original vector
+        scales = np.fromfile(os.path.join(storage_path, SCALES_FNAME), np.float32)
+        vectors *= scales[:, None]
+    return vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--storage", help="benchmark the vectors of a STORAGE_PATH")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, nargs="+", default=[0])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.storage:
+        vectors = load_vectors(args.storage)
+    else:
+        vectors = synthetic_vectors(args.vectors, args.dim, args.clusters)
+
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+    print(f"{len(vectors)} vectors of dim {vectors.shape[1]}, {len(queries)} queries")
+
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        exact_dir = os.path.join(workdir, "exact")
+        exact, build_seconds = build_store(vectors, exact_dir, index_type="exact")
+        truth, latencies = run_queries(exact, queries, args.top_k)
+        rows.append(
+            {
+                "index": "exact",
+                "nlist": None,
+                "nprobe": None,
+                "build_seconds": round(build_seconds, 2),
+                f"recall@{args.top_k}": 1.0,
+                "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+            }
+        )
+
+        for nlist in args.nlist:
+            ivf_dir = os.path.join(workdir, f"ivf-{nlist}")
+            store, build_seconds = build_store(
+                vectors, ivf_dir, index_type="ivf", ivf_nlist=nlist
+            )
+            if store._state.ivf is None:
+                print(f"nlist={nlist}: not enough vectors to train, skipped")
+                continue
+            trained_nlist = len(store._state.ivf.centroids)
+            for nprobe in args.nprobe:
+                store.ivf_nprobe = nprobe
+                results, latencies = run_queries(store, queries, args.top_k)
+                rows.append(
+                    {
+                        "index": "ivf",
+                        "nlist": trained_nlist,
+                        "nprobe": nprobe,
+                        "build_seconds": round(build_seconds, 2),
+                        f"recall@{args.top_k}": round(recall(results, truth), 4),
+                        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+                    }
+                )
+
+    columns = list(rows[0].keys())
+    print("  ".join(f"{column:>14}" for column in columns))
+    for row in rows:
+        print("  ".join(f"{str(row[column]):>14}" for column in columns))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            summary = {"vectors": len(vectors), "dim": int(vectors.shape[1])}
+            json.dump({**summary, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Throughput and latency of query embedding with and without micro-batching.
+
+Threads embed distinct questions through QueryEmbeddingBatcher, once per
+batch size, with the stand-in embedding model charging --latency-ms per
+forward pass (one pass at a time, as on a single device). Batch size 1 is
+the unbatched baseline. Each configuration also reports the latency of a
+single query on an idle batcher, which batching must not noticeably raise.
+
+Usage, from the backend directory:
+    python -m benchmarks.query_embed_benchmark
+    python -m benchmarks.query_embed_benchmark --concurrency 1 8 64 --batch-sizes 1 32
+"""
+
+import argparse
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.embedding_standin import StandInEmbedding
+from app.services.query_embedder import QueryEmbeddingBatcher
+from benchmarks.rag_benchmark import percentiles
+
+
+def measure(embed_model, batch_size: int, max_wait_ms: float, concurrency: int, n):
+    batcher = QueryEmbeddingBatcher(
+        embed_model, max_batch_size=batch_size, max_wait_ms=max_wait_ms
+    )
+    latencies = []
+
+    def embed(i):
+        started = time.perf_counter()
+        batcher.embed(f"question {i} about topic {i % 97}")
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(embed, range(n)))
+    elapsed = time.perf_counter() - started
+
+    idle = []
+    for i in range(20):
+        single = time.perf_counter()
+        batcher.embed(f"lone question {i}")
+        idle.append((time.perf_counter() - single) * 1000)
+
+    stats = batcher.stats()
+    return {
+        "max_batch_size": batch_size,
+        "concurrency": concurrency,
+        "qps": round(n / elapsed, 1),
+        **percentiles(latencies),
+        "idle_p50_ms": round(statistics.median(idle), 2),
+        "mean_batch_size": stats["mean_batch_size"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32])
+    parser.add_argument("--max-wait-ms", type=float, default=2)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    embed_model = StandInEmbedding(latency_ms=args.latency_ms)
+    rows = []
+    for concurrency in args.concurrency:
+        for batch_size in args.batch_sizes:
+            # A single thread gains nothing from more queries than a few passes
+            n = args.queries if concurrency > 1 else min(args.queries, 200)
+            row = measure(embed_model, batch_size, args.max_wait_ms, concurrency, n)
+            rows.append(row)
+            print(
+                f"concurrency {concurrency:>4}  batch {batch_size:>3}: "
+                f"{row['qps']:>8} q/s  p50 {row['p50_ms']:>7} ms  "
+                f"p99 {row['p99_ms']:>7} ms  idle {row['idle_p50_ms']:>6} ms  "
+                f"mean batch {row['mean_batch_size']}"
+            )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"options": vars(args), "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+"""
+End-to-end benchmark of ingestion, index loading and queries.
+
+For every corpus size, writes synthetic text files, ingests them through the
+ingestion worker, then loads the persisted index in a fresh process and
+answers queries through query_rag. Embeddings and answers come from the
+stand-in backends, so no model download or network access is needed, and
+the query cache is disabled so every query runs the full path. Each stage
+runs in its own process, so its peak RSS is its own.
+
+Usage, from the backend directory:
+    python -m benchmarks.rag_benchmark --docs 100 1000 --output rag.json
+    python -m benchmarks.rag_benchmark --output new.json --compare rag.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Metrics compared by --compare, and whether higher is better
+COMPARED_METRICS = {
+    "ingest.files_per_sec": True,
+    "ingest.chunks_per_sec": True,
+    "ingest.peak_rss_mb": False,
+    "load.seconds": False,
+    "load.peak_rss_mb": False,
+    "query.p50_ms": False,
+    "query.p95_ms": False,
+    "query.p99_ms": False,
+    "query.queries_per_sec": True,
+    "query.peak_rss_mb": False,
+}
+
+
+class RSSSampler:
+    """
+    Peak resident set size while the block runs, in MiB.
+
+    Samples /proc/self/statm from a background thread; elsewhere falls back
+    to the peak of the whole process so far.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._page_size = os.sysconf("SC_PAGE_SIZE")
+
+    def __enter__(self):
+        if os.path.exists("/proc/self/statm"):
+            self.peak_mb = self._current_mb()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._thread is None:
+            # ru_maxrss is KiB on Linux, bytes on macOS
+            scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+            usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak_mb = usage / scale
+            return
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, self._current_mb())
+
+    def _current_mb(self):
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * self._page_size / (1024 * 1024)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, self._current_mb())
+
+
+def synthetic_corpus(directory: str, docs: int, doc_words: int, seed: int = 0):
+    """
+    Write docs text files of about doc_words Zipf-distributed pseudo-words,
+    each naming a unique reference code, and return their total size in bytes.
+    """
+    rng = random.Random(seed)
+    syllables = ["ka", "lo", "mi", "re", "tu", "sa", "no", "vi", "de", "po", "ra"]
+    vocabulary = list(
+        dict.fromkeys(
+            "".join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+            for _ in range(8000)
+        )
+    )
+    weights = np.cumsum([1 / rank for rank in range(1, len(vocabulary) + 1)])
+
+    os.makedirs(directory, exist_ok=True)
+    total_bytes = 0
+    for doc in range(docs):
+        words = rng.choices(vocabulary, cum_weights=weights, k=doc_words)
+        words.insert(rng.randrange(len(words)), f"REF-{doc:06d}")
+        sentences, start = [], 0
+        while start < len(words):
+            end = start + rng.randint(12, 20)
+            sentences.append(" ".join(words[start:end]).capitalize() + ".")
+            start = end
+        text = "\n".join(
+            " ".join(sentences[i : i + 5]) for i in range(0, len(sentences), 5)
+        )
+        path = os.path.join(directory, f"doc-{doc:06d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        total_bytes += len(text.encode("utf-8"))
+    return total_bytes
+
+
+def synthetic_queries(directory: str, count: int, seed: int = 1):
+    """Questions built from a few consecutive words of random corpus files"""
+    rng = random.Random(seed)
+    names = sorted(os.listdir(directory))
+    queries = []
+    for _ in range(count):
+        with open(os.path.join(directory, rng.choice(names)), encoding="utf-8") as f:
+            words = f.read().split()
+        start = rng.randrange(max(1, len(words) - 6))
+        phrase = " ".join(words[start : start + 6])
+        queries.append(f"What does the text say about {phrase}")
+    return queries
+
+
+def percentiles(values):
+    values = np.asarray(values)
+    return {f"p{p}_ms": round(float(np.percentile(values, p)), 2) for p in (50, 95, 99)}
+
+
+def run_ingest_stage():
+    """Ingest DATA_PATH through the ingestion worker, in this process"""
+    started = time.perf_counter()
+    from app.db.init_db import init_db
+    from app.db.session import SessionLocal
+    from app.services.ingestion_service import (
+        enqueue_unprocessed_files,
+        get_ingestion_job,
+        start_ingestion_worker,
+    )
+    from app.services.rag_service import DATA_PATH, embedder, index_manager
+
+    import_seconds = time.perf_counter() - started
+
+    init_db()
+    index_manager.load()
+    start_ingestion_worker()
+
+    paths = [entry.path for entry in os.scandir(DATA_PATH) if entry.is_file()]
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    db = SessionLocal()
+    try:
+        with RSSSampler() as rss:
+            started = time.perf_counter()
+            job = enqueue_unprocessed_files(db)
+            while job.status not in ("completed", "failed"):
+                time.sleep(0.05)
+                db.expire_all()
+                job = get_ingestion_job(job.id, db)
+            seconds = time.perf_counter() - started
+        status, failed_files = job.status, job.failed_files
+    finally:
+        db.close()
+
+    chunks = index_manager.node_count()
+    return {
+        "import_seconds": round(import_seconds, 3),
+        "status": status,
+        "files": len(paths),
+        "failed_files": failed_files,
+        "chunks": chunks,
+        "bytes": total_bytes,
+        "seconds": round(seconds, 3),
+        "files_per_sec": round(len(paths) / seconds, 1),
+        "chunks_per_sec": round(chunks / seconds, 1),
+        "mb_per_sec": round(total_bytes / seconds / (1024 * 1024), 2),
+        "peak_rss_mb": round(rss.peak_mb, 1),
+        "embedding": embedder.stats(),
+    }
+
+
+def run_query_stage(queries, concurrency: int):
+    """Load the persisted index and answer queries, in this process"""
+    started = time.perf_counter()
+    from app.services.rag_service import index_manager, query_rag
+
+    import_seconds = time.perf_counter() - started
+
+    with RSSSampler() as load_rss:
+        started = time.perf_counter()
+        index_manager.load()
+        load_seconds = time.perf_counter() - started
+
+    def timed_query(query):
+        started = time.perf_counter()
+        response = query_rag(query)
+        elapsed = (time.perf_counter() - started) * 1000
+        metadata = response.metadata or {}
+        synthesis = metadata.get("synthesis", {})
+        return {
+            "total_ms": elapsed,
+            "synthesis_ms": synthesis.get("synthesis_seconds", 0.0) * 1000,
+            "llm_calls": synthesis.get("llm_calls", 0),
+            "nodes": len(response.source_nodes),
+            "tokens_packed": metadata.get("context", {}).get("tokens_packed", 0),
+        }
+
+    # The first query pays for lazy initialization, report it apart
+    first = timed_query(queries[0])
+    with RSSSampler() as query_rss:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = list(executor.map(timed_query, queries[1:]))
+        seconds = time.perf_counter() - started
+
+    totals = [sample["total_ms"] for sample in samples]
+    synthesis = [sample["synthesis_ms"] for sample in samples]
+    # Everything before synthesis: query embedding, retrieval, context packing
+    retrieval = [t - s for t, s in zip(totals, synthesis)]
+    return {
+        "load": {
+            "import_seconds": round(import_seconds, 3),
+            "seconds": round(load_seconds, 3),
+            "nodes": index_manager.node_count(),
+            "peak_rss_mb": round(load_rss.peak_mb, 1),
+        },
+        "query": {
+            "queries": len(samples),
+            "concurrency": concurrency,
+            "first_query_ms": round(first["total_ms"], 2),
+            **percentiles(totals),
+            "queries_per_sec": round(len(samples) / seconds, 1),
+            "retrieval": percentiles(retrieval),
+            "synthesis": percentiles(synthesis),
+            "mean_nodes": round(float(np.mean([s["nodes"] for s in samples])), 2),
+            "mean_tokens_packed": round(
+                float(np.mean([s["tokens_packed"] for s in samples])), 1
+            ),
+            "mean_llm_calls": round(
+                float(np.mean([s["llm_calls"] for s in samples])), 2
+            ),
+            "peak_rss_mb": round(query_rss.peak_mb, 1),
+        },
+    }
+
+
+def stage_env(workdir: str, args):
+    """Environment pointing a stage process at workdir and the stand-ins"""
+    env = dict(os.environ)
+    env.update(
+        {
+            "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'db.sqlite3')}",
+            "DATA_PATH": os.path.join(workdir, "data"),
+            "STORAGE_PATH": os.path.join(workdir, "storage"),
+            "EMBEDDING_CACHE_PATH": os.path.join(workdir, "cache", "embeddings.db"),
+            "EMBED_BACKEND": "standin",
+            "STANDIN_EMBED_LATENCY_MS": str(args.embed_latency_ms),
+            "LLM_BACKEND": "standin",
+            "STANDIN_LATENCY_MS": str(args.llm_latency_ms),
+            "QUERY_CACHE_MAX_ENTRIES": "0",
+        }
+    )
+    # Required settings without a default
+    for name, value in {
+        "SECRET_KEY": "benchmark",
+        "ALGORITHM": "HS256",
+        "ACCESS_TOKEN_EXPIRE_MINUTES": "15",
+        "REFRESH_TOKEN_EXPIRE_DAYS": "7",
+        "HF_TOKEN": "",
+        "LLM_MODEL_NAME": "standin",
+        "EMBED_MODEL_NAME": "standin",
+    }.items():
+        env.setdefault(name, value)
+    return env
+
+
+def run_stage(stage: str, workdir: str, args, extra_args=()):
+    """Run one stage in a fresh process and return its result"""
+    result_path = os.path.join(workdir, f"{stage}.json")
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.rag_benchmark",
+        "--stage",
+        stage,
+        "--result",
+        result_path,
+        *extra_args,
+    ]
+    completed = subprocess.run(
+        command,
+        cwd=BACKEND_DIR,
+        env=stage_env(workdir, args),
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        sys.stderr.write(completed.stdout + completed.stderr)
+        raise SystemExit(f"{stage} stage failed with exit code {completed.returncode}")
+    with open(result_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def benchmark_corpus(docs: int, args):
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        data_path = os.path.join(workdir, "data")
+        started = time.perf_counter()
+        total_bytes = synthetic_corpus(data_path, docs, args.doc_words)
+        generate_seconds = time.perf_counter() - started
+
+        queries_path = os.path.join(workdir, "queries.json")
+        with open(queries_path, "w", encoding="utf-8") as f:
+            json.dump(synthetic_queries(data_path, args.queries + 1), f)
+
+        ingest = run_stage("ingest", workdir, args)
+        queried = run_stage(
+            "query",
+            workdir,
+            args,
+            ["--queries-file", queries_path, "--concurrency", str(args.concurrency)],
+        )
+    return {
+        "docs": docs,
+        "corpus_bytes": total_bytes,
+        "generate_seconds": round(generate_seconds, 3),
+        "ingest": ingest,
+        **queried,
+    }
+
+
+def metric(row, path):
+    value = row
+    for key in path.split("."):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def compare(rows, baseline_path: str):
+    """Print the change of COMPARED_METRICS against a previous run"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {row["docs"]: row for row in json.load(f)["results"]}
+    for row in rows:
+        previous = baseline.get(row["docs"])
+        if previous is None:
+            print(f"docs={row['docs']}: not in {baseline_path}")
+            continue
+        print(f"docs={row['docs']} against {baseline_path}:")
+        for path, higher_is_better in COMPARED_METRICS.items():
+            old, new = metric(previous, path), metric(row, path)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = change < 0 if higher_is_better else change > 0
+            flag = "  worse" if worse and abs(change) >= 10 else ""
+            print(f"  {path:24} {old:>10} -> {new:>10}  {change:+6.1f}%{flag}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--docs", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--doc-words", type=int, default=600)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--embed-latency-ms", type=float, default=0)
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--workdir", help="directory for the temporary corpora")
+    parser.add_argument("--output", default="rag_benchmark.json")
+    parser.add_argument("--compare", help="previous --output to compare against")
+    # Used by the stage processes started by main
+    parser.add_argument("--stage", choices=["ingest", "query"], help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    parser.add_argument("--queries-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        if args.stage == "ingest":
+            result = run_ingest_stage()
+        else:
+            with open(args.queries_file, "r", encoding="utf-8") as f:
+                result = run_query_stage(json.load(f), args.concurrency)
+        with open(args.result, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return
+
+    rows = []
+    for docs in args.docs:
+        print(f"Benchmarking {docs} documents of {args.doc_words} words...")
+        rows.append(benchmark_corpus(docs, args))
+
+    columns = {
+        "docs": "docs",
+        "ingest.files_per_sec": "files/s",
+        "ingest.chunks_per_sec": "chunks/s",
+        "ingest.peak_rss_mb": "ingest MB",
+        "load.seconds": "load s",
+        "load.peak_rss_mb": "load MB",
+        "query.p50_ms": "p50 ms",
+        "query.p95_ms": "p95 ms",
+        "query.p99_ms": "p99 ms",
+        "query.queries_per_sec": "qps",
+        "query.peak_rss_mb": "query MB",
+    }
+    print("  ".join(f"{label:>10}" for label in columns.values()))
+    for row in rows:
+        print("  ".join(f"{str(metric(row, path)):>10}" for path in columns))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        summary = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "options": {
+                key: value
+                for key, value in vars(args).items()
+                if key not in ("stage", "result", "queries_file", "output", "compare")
+            },
+        }
+        json.dump({**summary, "results": rows}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare(rows, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Import time and time to first healthy and ready response of the API.
+
+Imports app.main in fresh interpreters, then starts uvicorn repeatedly and
+polls GET /health (liveness) and GET /ready (index and models loaded) until
+each first answers 200. By default the configured backends in .env are used,
+so the real model load is measured; --standin points every run at an empty
+temporary data directory and the stand-in embedding and LLM backends.
+
+Usage, from the backend directory:
+    python -m benchmarks.startup_benchmark --runs 5
+    python -m benchmarks.startup_benchmark --standin --importtime --output s.json
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from argparse import Namespace
+
+from benchmarks.rag_benchmark import BACKEND_DIR, stage_env
+
+_IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import(env):
+    """Seconds to import app.main in a fresh interpreter"""
+    completed = subprocess.run(
+        [sys.executable, "-c", _IMPORT_SNIPPET],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        sys.stderr.write(completed.stderr)
+        raise SystemExit("Importing app.main failed")
+    return float(completed.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(env, top: int):
+    """Packages with the largest cumulative import time, from -X importtime"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    cumulative = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, microseconds, name = (part.strip() for part in line[12:].split("|"))
+        if not microseconds.isdigit():
+            continue
+        package = name.split(".")[0]
+        # Nested modules are reported before, and included in, their package
+        if name == package:
+            cumulative[package] = max(
+                cumulative.get(package, 0), int(microseconds) / 1e6
+            )
+    ranked = sorted(cumulative.items(), key=lambda item: item[1], reverse=True)
+    return [{"package": name, "seconds": round(s, 3)} for name, s in ranked[:top]]
+
+
+def get_status(url: str):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status, json.loads(response.read() or b"null")
+    except urllib.error.HTTPError as e:
+        return e.code, None
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return None, None
+
+
+def measure_serve(env, timeout: float, poll_interval: float):
+    """Seconds from process start to the first 200 of /health and of /ready"""
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    healthy = ready = status = None
+    try:
+        while ready is None and time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise SystemExit(f"uvicorn exited with code {server.returncode}")
+            if healthy is None and get_status(f"{base}/health")[0] == 200:
+                healthy = time.perf_counter() - started
+            if healthy is not None:
+                code, status = get_status(f"{base}/ready")
+                if code == 200:
+                    ready = time.perf_counter() - started
+                    break
+            time.sleep(poll_interval)
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        "healthy_seconds": round(healthy, 3) if healthy is not None else None,
+        "ready_seconds": round(ready, 3) if ready is not None else None,
+        "server_status": status,
+    }
+
+
+def summarize(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return {
+        "median": round(statistics.median(values), 3),
+        "min": round(min(values), 3),
+        "max": round(max(values), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--standin", action="store_true")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--poll-interval", type=float, default=0.02)
+    parser.add_argument("--importtime", action="store_true")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ)
+        if args.standin:
+            os.makedirs(os.path.join(workdir, "data"))
+            env = stage_env(workdir, Namespace(embed_latency_ms=0, llm_latency_ms=0))
+
+        imports = [measure_import(env) for _ in range(args.runs)]
+        serves = [
+            measure_serve(env, args.timeout, args.poll_interval)
+            for _ in range(args.runs)
+        ]
+        slowest = slowest_imports(env, args.top) if args.importtime else None
+
+    result = {
+        "runs": args.runs,
+        "standin": args.standin,
+        "import_seconds": summarize(imports),
+        "healthy_seconds": summarize([s["healthy_seconds"] for s in serves]),
+        "ready_seconds": summarize([s["ready_seconds"] for s in serves]),
+        "last_ready_status": serves[-1]["server_status"],
+        "slowest_imports": slowest,
+    }
+    print(f"import app.main:        {result['import_seconds']}")
+    print(f"first healthy response: {result['healthy_seconds']}")
+    print(f"first ready response:   {result['ready_seconds']}")
+    if slowest:
+        print("slowest imports (cumulative seconds):")
+        for item in slowest:
+            print(f"  {item['package']:30} {item['seconds']:>8}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import pytest
+from app.services.blob_store import BlobStore, blob_extension
+from app.services.document_loader import parse_file
+
+# The file reader picks its PDF parser from these at runtime
+pytest.importorskip("pypdf")
+pytest.importorskip("llama_index.readers.file")
+
+
+def minimal_pdf(text: str) -> bytes:
+    """A one-page PDF showing text, with a valid cross-reference table"""
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode("latin-1")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        b"/Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\n" % (len(objects) + 1)
+    pdf += b"startxref\n%d\n%%%%EOF\n" % xref
+    return bytes(pdf)
+
+
+def test_blob_extension():
+    assert blob_extension("Report.PDF") == ".pdf"
+    assert blob_extension("notes") == ""
+    assert blob_extension("odd.name with spaces") == ""
+
+
+def test_uploaded_pdf_is_parsed_as_pdf(tmp_path):
+    upload = tmp_path / "upload.tmp"
+    upload.write_bytes(minimal_pdf("Quarterly revenue grew"))
+    store = BlobStore(str(tmp_path / "blobs"))
+
+    path = store.put(str(upload), "ab" * 32, blob_extension("report.pdf"))
+    text = "".join(document.text for document in parse_file(path))
+
+    assert path.endswith(".pdf")
+    assert "Quarterly revenue grew" in text
+    assert "%PDF" not in text
@@ -0,0 +1,76 @@
+import os
+
+from app.services.index_snapshots import SnapshotStore
+
+
+def write_marker(store: SnapshotStore, text: str) -> str:
+    def persist(directory):
+        with open(os.path.join(directory, "marker"), "w") as f:
+            f.write(text)
+
+    return store.write(persist)
+
+
+def test_write_publishes_in_order(tmp_path):
+    store = SnapshotStore(str(tmp_path), keep=3)
+    assert store.current() is None
+
+    first = write_marker(store, "one")
+    second = write_marker(store, "two")
+
+    assert store.current() == second
+    assert store.snapshots() == [first, second]
+    with open(os.path.join(store.path(second), "marker")) as f:
+        assert f.read() == "two"
+
+
+def test_failed_write_keeps_current(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    first = write_marker(store, "one")
+
+    def persist(directory):
+        raise RuntimeError("disk full")
+
+    try:
+        store.write(persist)
+    except RuntimeError:
+        pass
+
+    assert store.current() == first
+    assert store.snapshots() == [first]
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(".tmp-")]
+
+
+def test_prune_keeps_newest(tmp_path):
+    store = SnapshotStore(str(tmp_path), keep=2)
+    names = [write_marker(store, str(i)) for i in range(4)]
+
+    assert store.snapshots() == names[-2:]
+    assert store.pruned == 2
+
+
+def test_prune_skips_snapshot_being_read(tmp_path):
+    store = SnapshotStore(str(tmp_path), keep=1)
+    first = write_marker(store, "one")
+
+    with store.reading(first) as present:
+        assert present
+        second = write_marker(store, "two")
+        # Still readable: the reader holds it
+        assert store.snapshots() == [first, second]
+
+    store.prune()
+    assert store.snapshots() == [second]
+
+
+def test_reading_reports_pruned_snapshot(tmp_path):
+    store = SnapshotStore(str(tmp_path), keep=1)
+    first = write_marker(store, "one")
+    write_marker(store, "two")
+
+    with store.reading(first) as present:
+        assert not present
+
+    # The reader's lock file is cleaned up by the next prune
+    store.prune()
+    assert not os.path.exists(store.path(f".read-{first}"))
@@ -0,0 +1,288 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+from argparse import Namespace
+
+import pytest
+from benchmarks.rag_benchmark import stage_env
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Settings are read on import, so every scenario runs in a fresh process
+# against its own DATABASE_URL, DATA_PATH and STORAGE_PATH
+PRELUDE = """
+import json, os
+from app.db.init_db import init_db
+from app.db.models import IngestionManifest
+from app.db.session import SessionLocal
+from app.services import ingestion_service as ing
+from app.services.rag_service import index_manager
+init_db()
+index_manager.load()
+db = SessionLocal()
+
+def drain():
+    while not ing._job_queue.empty():
+        ing._run_job(*ing._job_queue.get())
+
+def state():
+    db.expire_all()
+    rows = db.query(IngestionManifest).all()
+    return {
+        "rows": sorted([row.filename, len(row.node_ids or [])] for row in rows),
+        "nodes": index_manager.node_count(),
+    }
+
+def report(**values):
+    print(json.dumps(values))
+"""
+
+
+def make_env(workdir, embed_latency_ms=0, **settings):
+    env = stage_env(
+        str(workdir), Namespace(embed_latency_ms=embed_latency_ms, llm_latency_ms=0)
+    )
+    env.update(settings)
+    os.makedirs(env["DATA_PATH"])
+    os.makedirs(env["STORAGE_PATH"])
+    return env
+
+
+def write(env, name, text):
+    with open(os.path.join(env["DATA_PATH"], name), "w") as f:
+        f.write(text)
+
+
+def start(env, code, prelude=True):
+    script = (PRELUDE if prelude else "") + textwrap.dedent(code)
+    return subprocess.Popen(
+        [sys.executable, "-c", script],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+
+def finish(process, returncode=0):
+    """The last line the process reported, after checking how it exited"""
+    out, err = process.communicate(timeout=120)
+    assert process.returncode == returncode, err[-2000:]
+    lines = out.strip().splitlines()
+    return json.loads(lines[-1]) if lines else None
+
+
+def run(env, code, prelude=True, returncode=0):
+    return finish(start(env, code, prelude), returncode)
+
+
+@pytest.fixture
+def env(tmp_path):
+    return make_env(tmp_path)
+
+
+def test_rescan_only_queues_changed_files(env):
+    write(env, "a.txt", "The warehouse code is ZX-41. " * 5)
+    write(env, "b.txt", "The warehouse code is ZX-42. " * 5)
+    run(env, "ing.enqueue_unprocessed_files(db); drain()")
+
+    result = run(
+        env,
+        """
+        before = index_manager.version
+        unchanged = ing.enqueue_unprocessed_files(db)
+        with open(os.path.join(os.environ["DATA_PATH"], "b.txt"), "a") as f:
+            f.write("It moved to aisle 7.")
+        changed = ing.enqueue_unprocessed_files(db)
+        drain()
+        report(
+            unchanged=unchanged and unchanged.total_files,
+            changed=changed.total_files,
+            version_bumped=index_manager.version > before,
+            **state(),
+        )
+        """,
+    )
+
+    assert result["unchanged"] is None
+    assert result["changed"] == 1
+    assert result["version_bumped"]
+    assert result["rows"] == [["a.txt", 1], ["b.txt", 1]]
+    assert result["nodes"] == 2
+
+
+def test_crash_between_persist_and_commit_recovers(tmp_path):
+    env = make_env(tmp_path, EMBED_BATCH_SIZE="1")
+    for i in range(3):
+        write(env, f"n{i}.txt", f"The warehouse code is ZX-4{i}. " * 5)
+
+    # The snapshot is published, the manifest commit never happens
+    run(
+        env,
+        """
+        persist = index_manager.persist
+        def crash():
+            persist()
+            os._exit(3)
+        index_manager.persist = crash
+        ing.enqueue_unprocessed_files(db)
+        drain()
+        """,
+        returncode=3,
+    )
+
+    result = run(
+        env,
+        """
+        after_crash = state()
+        job = ing.enqueue_unprocessed_files(db)
+        drain()
+        report(after_crash=after_crash, requeued=job.total_files, **state())
+        """,
+    )
+
+    assert result["after_crash"]["rows"] == []
+    assert result["requeued"] == 3
+    assert result["rows"] == [[f"n{i}.txt", 1] for i in range(3)]
+    # Nodes published before the crash are replaced, not duplicated
+    assert result["nodes"] == 3
+
+
+def test_concurrent_legacy_migration(env):
+    write(env, "notes.txt", "The warehouse code is ZX-42. " * 5)
+    # An index and processed_files.json as written before the manifest
+    run(
+        env,
+        """
+        import os
+        from llama_index.core import SimpleDirectoryReader, VectorStoreIndex
+        from app.db.init_db import init_db
+        from app.services.embedding_standin import StandInEmbedding
+        storage = os.environ["STORAGE_PATH"]
+        documents = SimpleDirectoryReader(os.environ["DATA_PATH"]).load_data()
+        index = VectorStoreIndex.from_documents(
+            documents, embed_model=StandInEmbedding(model_name="standin-384")
+        )
+        index.storage_context.persist(persist_dir=storage)
+        with open(os.path.join(storage, "processed_files.json"), "w") as f:
+            f.write('{"notes.txt": {}}')
+        init_db()
+        """,
+        prelude=False,
+    )
+
+    workers = [
+        start(
+            env,
+            """
+            import threading
+            errors = []
+            def rescan():
+                try:
+                    ing.enqueue_unprocessed_files(SessionLocal())
+                except Exception as e:
+                    errors.append(repr(e))
+            threads = [threading.Thread(target=rescan) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            drain()
+            report(errors=errors)
+            """,
+        )
+        for _ in range(2)
+    ]
+    for worker in workers:
+        assert finish(worker)["errors"] == []
+
+    result = run(env, "report(**state())")
+    assert result["rows"] == [["notes.txt", 1]]
+    # The random-id legacy node is gone, only the re-ingested one is left
+    assert result["nodes"] == 1
+    assert not os.path.exists(os.path.join(env["STORAGE_PATH"], "processed_files.json"))
+
+
+def test_delete_all_during_ingest(tmp_path):
+    env = make_env(tmp_path, embed_latency_ms=2000)
+    result = run(
+        env,
+        """
+        import threading, time
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from app.api.rag import router
+        from app.services.rag_service import delete_all_files
+
+        app = FastAPI()
+        app.include_router(router, prefix="/rag")
+        client = TestClient(app)
+        files = [
+            ("files", (f"f{i}.txt", f"The warehouse code is ZX-4{i}. ".encode() * 5))
+            for i in range(3)
+        ]
+        client.post("/rag/upload_file/", files=files)
+        job = threading.Thread(target=ing._run_job, args=ing._job_queue.get())
+        job.start()
+        # Let the job get into embedding, which holds no lock
+        time.sleep(0.5)
+        before = index_manager.version
+        started = time.monotonic()
+        delete_all_files(SessionLocal())
+        delete_seconds = time.monotonic() - started
+        deleted_version = index_manager.version
+        job.join()
+        after_delete = state()
+
+        client.post("/rag/upload_file/", files=files)
+        drain()
+        report(
+            delete_seconds=delete_seconds,
+            version_bumped=deleted_version > before,
+            after_delete=after_delete,
+            **state(),
+        )
+        """,
+    )
+
+    # The delete does not wait for the job's embedding to finish
+    assert result["delete_seconds"] < 1.5
+    assert result["version_bumped"]
+    # The job drops the files deleted under it instead of recording them
+    assert result["after_delete"] == {"rows": [], "nodes": 0}
+    assert len(result["rows"]) == 3
+    assert result["nodes"] == 3
+
+
+def test_shared_content_requeued_on_delete(env):
+    text = "The warehouse code is ZX-42. " * 5
+    write(env, "a.txt", text)
+    write(env, "b.txt", text)
+
+    result = run(
+        env,
+        """
+        from app.services.rag_service import delete_uploaded_files
+        ing.enqueue_unprocessed_files(db)
+        drain()
+        shared = state()
+        deleted = delete_uploaded_files(["a.txt"], db)
+        ing.enqueue_ingestion(deleted["requeued"], db)
+        drain()
+        report(
+            shared=shared,
+            requeued=[os.path.basename(path) for path in deleted["requeued"]],
+            **state(),
+        )
+        """,
+    )
+
+    # b.txt is recorded without nodes of its own while a.txt holds them
+    assert sorted(n for _, n in result["shared"]["rows"]) == [0, 1]
+    assert result["shared"]["nodes"] == 1
+    assert result["requeued"] == ["b.txt"]
+    assert result["rows"] == [["b.txt", 1]]
+    assert result["nodes"] == 1
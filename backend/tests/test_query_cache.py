@@ -0,0 +1,43 @@
+from app.services.query_cache import QueryCache
+
+
+def test_hit_for_normalized_query():
+    cache = QueryCache()
+    cache.put("What is  XJ-9000?", 1, "answer")
+
+    assert cache.get("what is xj-9000? ", 1) == "answer"
+    assert cache.get("what is xj-9000?", 1, variant="tree") is None
+
+
+def test_new_version_drops_entries():
+    cache = QueryCache()
+    cache.put("question", 1, "old answer")
+
+    assert cache.get("question", 2) is None
+    # Still gone when an older reader asks again
+    assert cache.get("question", 1) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_result_from_older_version_is_not_stored():
+    cache = QueryCache()
+    cache.get("question", 2)
+    # Computed against version 1 while version 2 was published
+    cache.put("question", 1, "stale answer")
+
+    assert cache.get("question", 2) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_expired_entry_misses():
+    cache = QueryCache(ttl_seconds=0)
+    cache.put("question", 1, "answer")
+
+    assert cache.get("question", 1) is None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = QueryCache(max_entries=0)
+    cache.put("question", 1, "answer")
+
+    assert cache.get("question", 1) is None
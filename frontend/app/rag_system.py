@@ -1,3 +1,4 @@
+import json
 import os
 import time
 
@@ -32,6 +33,10 @@ def show(selectbox_key):
                 st.subheader("Uploaded Files:")
                 for file in response["upload_files"]:
                     st.write(f"📌 **{file['filename']}** - `{file['path']}`")
+                st.info(
+                    f"⚙️ Ingestion job #{response['job_id']} queued, "
+                    "files become searchable once it completes."
+                )
         else:
             st.warning("⚠️ Please select at least one file before uploading.")
 
@@ -41,25 +46,7 @@ def show(selectbox_key):
 
     if st.button("Search"):
         if query_text:
-            with st.spinner("Processing your query..."):
-                start_time = time.time()
-                response = query_rag(query_text)
-                end_time = time.time()
-                processing_time = end_time - start_time
-
-            st.info(f"⏳ Processing time: {processing_time:.2f} seconds")
-
-            if "error" in response:
-                st.error(response["error"])
-            else:
-                st.subheader("📖 Answer:")
-                st.write(response.get("answer", "No answer found."))
-
-                st.subheader("📚 Source Information:")
-                for source in response.get("sources", []):
-                    with st.expander(f"🧐 Confidence Score: {source['score']:.2f}"):
-                        st.write(source["text"])
-                        st.write(f"🔗 Source: {source['source']}")
+            show_streamed_answer(query_text)
         else:
             st.warning("⚠️ Please enter a question before searching.")
 
@@ -79,6 +66,46 @@ def show(selectbox_key):
     st.markdown("---")
 
 
+def show_streamed_answer(query_text):
+    """Render the answer token by token as the backend streams it."""
+    start_time = time.time()
+    first_token_time = None
+    answer = ""
+
+    st.subheader("📖 Answer:")
+    answer_placeholder = st.empty()
+    answer_placeholder.write("⏳ Processing your query...")
+    sources_container = st.container()
+
+    for event, data in stream_query_rag(query_text):
+        if event == "sources":
+            with sources_container:
+                st.subheader("📚 Source Information:")
+                for source in data:
+                    with st.expander(f"🧐 Confidence Score: {source['score']:.2f}"):
+                        st.write(source["text"])
+                        st.write(f"🔗 Source: {source['source']}")
+        elif event == "token":
+            if first_token_time is None:
+                first_token_time = time.time() - start_time
+            answer += data
+            answer_placeholder.write(answer + "▌")
+        elif event == "error":
+            answer_placeholder.write(answer)
+            st.error(data)
+            return
+
+    answer_placeholder.write(answer or "No answer found.")
+    processing_time = time.time() - start_time
+    if first_token_time is not None:
+        st.info(
+            f"⏳ First token after {first_token_time:.2f} seconds, "
+            f"processing time: {processing_time:.2f} seconds"
+        )
+    else:
+        st.info(f"⏳ Processing time: {processing_time:.2f} seconds")
+
+
 def upload_files(files):
     """Uploads files to the backend and returns the response."""
     files_data = [("files", (file.name, file, file.type)) for file in files]
@@ -98,10 +125,26 @@ def delete_files(files):
         return {"error": "Failed to delete files."}
 
 
-def query_rag(query_text):
-    """Sends a query to the RAG system and returns the response."""
-    response = requests.get(f"{API_URL}/rag/query?query_text={query_text}")
-    if response.status_code == 200:
-        return response.json()
-    else:
-        return {"error": "Failed to fetch data from the server."}
+def stream_query_rag(query_text):
+    """Streams a query answer from the backend as (event, data) pairs."""
+    try:
+        response = requests.get(
+            f"{API_URL}/rag/query_stream",
+            params={"query_text": query_text},
+            stream=True,
+        )
+    except requests.RequestException:
+        yield "error", "Failed to fetch data from the server."
+        return
+
+    with response:
+        if response.status_code != 200:
+            yield "error", "Failed to fetch data from the server."
+            return
+
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:") :].strip()
+            elif line.startswith("data:") and event:
+                yield event, json.loads(line[len("data:") :])